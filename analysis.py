@@ -0,0 +1,245 @@
+import asyncio
+import copy
+import cProfile
+import os
+import pstats
+import select
+import sys
+import threading
+import timeit
+from typing import Dict, Optional
+
+import click
+
+try:
+    import termios
+    import tty
+except ImportError:
+    termios = tty = None
+
+import analysis_server
+import engine_stragegies
+import worker_pool
+from components import Player, GameState, TimeTrack, TurnAction
+from game_data import init_game, parse_game_data
+from ponder import Ponderer
+from position_cache import PositionCache
+from transposition import TranspositionTable
+
+
+def strategy_options(function):
+    """Search options shared by the live (pw.py) and the offline (analyze.py) command"""
+    options = [
+        click.option("--strategy", "-s", default="greedy_single_core", help="Turn calculation Algorithm",
+                     type=click.Choice(list(engine_stragegies.strategies), case_sensitive=False)),
+        click.option("--depth", "-d", default=None, help="Depth for movement calculation, with --time-budget the maximum "
+                                                         "depth [default: 3, unlimited with --time-budget]", type=int),
+        click.option("--tt-size", default=0, show_default=True, help="Transposition table size in MB, 0 disables it", type=int),
+        click.option("--time-budget", "-t", default=None, help="Seconds per move, deepens iteratively and returns the deepest completed depth", type=float),
+        click.option("--workers", default=None, help="Worker processes of the parallel strategies [default: cpu count]", type=int),
+        click.option("--split-ply", default=2, show_default=True, help="Ply at which greedy_four_core and parallel_alpha_beta split the search into tasks", type=int),
+        click.option("--iterations", default=2000, show_default=True, help="Iterations of mcts without --time-budget", type=int),
+        click.option("--endgame-distance", default=engine_stragegies.EngineStrategy.endgame_distance, show_default=True,
+                     help="Solve the game exactly once both players together are this close to the goal, 0 disables it", type=int),
+        click.option("--stats", is_flag=True, default=False, help="Print nodes per ply, branching factor, pruned actions, "
+                                                                  "cutoffs, TT hits and where the search spent its time"),
+        click.option("--profile", default=None, help="Run the search under cProfile, write the pstats dump to this file "
+                                                     "and print the most expensive functions", type=click.Path(dir_okay=False)),
+        click.option("--verify-aggregates", is_flag=True, default=False, help="Cross-check the incremental player scores "
+                                                                              "against a full recalculation (slow)"),
+        click.option("--cache", default=None, help="Position cache file shared across sessions and processes, created if "
+                                                   "missing (see cache.py warmup)", type=click.Path(dir_okay=False)),
+        click.option("--cache-size", default=1_000_000, show_default=True, help="Maximum entries of the position cache", type=int),
+        click.option("--live", is_flag=True, default=False, help="Print the best line of every completed iteration while "
+                                                                 "searching, a key press stops the search and takes the best "
+                                                                 "line so far"),
+    ]
+    for option in reversed(options):
+        function = option(function)
+    return function
+
+
+def configure_strategy(strategy, depth, tt_size, time_budget, workers, split_ply, iterations, endgame_distance, stats,
+                       verify_aggregates, cache, cache_size) \
+        -> (engine_stragegies.EngineStrategy, int):
+    """:return: Configured strategy and the search depth"""
+    Player.verify_aggregates = verify_aggregates
+    if depth is None:
+        depth = 3 if time_budget is None else engine_stragegies.UNLIMITED_DEPTH
+    click.echo(f"Using {strategy} algorithm with depth {depth}")
+    strategy = engine_stragegies.strategies[strategy.lower()]
+    if tt_size:
+        strategy.transposition_table = TranspositionTable(tt_size * 1024 * 1024)
+    worker_pool.configure(workers, tt_size * 1024 * 1024)
+    engine_stragegies.greedy_f.split_ply = split_ply
+    engine_stragegies.parallel_alpha_beta.split_ply = split_ply
+    engine_stragegies.monte_carlo.iterations = iterations
+    strategy.endgame_distance = endgame_distance
+    strategy.collect_stats(stats)
+    if cache is not None:
+        strategy.position_cache = PositionCache(cache, cache_size)
+    return strategy, depth
+
+
+def print_game_status(p1, p2, track):
+    active_player: Player = p1 if p1.player_turn else p2
+    click.secho(f"{active_player.player_name}'s turn", fg=active_player.get_player_color(), nl=False)
+    click.echo(f" ({active_player.status()})")
+
+    p1_score = p1.get_current_score(track)
+    p2_score = p2.get_current_score(track)
+
+    def get_color(p1_, p2_):
+        if p1_ > p2_:
+            return 'green'
+        elif p1_ < p2_:
+            return 'red'
+        else:
+            return 'yellow'
+
+    def print_(p1_, p1_score, p2_score):
+        click.secho(f"{p1_.player_name}", fg=p1_.get_player_color(), nl=False)
+        click.echo("'s score: ", nl=False)
+        click.secho(p1_score, bg=(get_color(p1_score, p2_score)), fg='black')
+
+    print_(p1, p1_score, p2_score)
+    print_(p2, p2_score, p1_score)
+    click.echo()
+
+
+def print_delimiter(nl=False):
+    click.echo("-" * 50)
+    if nl:
+        click.echo()
+
+
+class KeyWatcher:
+    """Calls on_key once a key is pressed on the terminal while the watcher is entered, does nothing without a terminal"""
+
+    def __init__(self, on_key):
+        self.on_key = on_key
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+        self.__settings = None
+
+    def __enter__(self):
+        if termios is None or not sys.stdin.isatty():
+            return self
+        descriptor = sys.stdin.fileno()
+        self.__settings = termios.tcgetattr(descriptor)
+        tty.setcbreak(descriptor)
+        self.__thread = threading.Thread(target=self.__watch, args=(descriptor,), name="keys", daemon=True)
+        self.__thread.start()
+        return self
+
+    def __watch(self, descriptor: int):
+        while not self.__stop.is_set():
+            if select.select([descriptor], [], [], 0.1)[0]:
+                os.read(descriptor, 1024)
+                self.on_key()
+                return
+
+    def __exit__(self, *_):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, self.__settings)
+
+
+def search_live(strategy: engine_stragegies.EngineStrategy, p1: Player, p2: Player, pieces, track: TimeTrack, depth: int,
+                time_budget) -> Optional[GameState]:
+    """
+    :return: Result of analyze_turn, None if it was stopped before its first iteration completed. The best line is
+    printed whenever an iteration completes.
+    """
+    click.echo("Searching, press any key to take the best line so far\n")
+    result = None
+    with KeyWatcher(strategy.cancel):
+        for update in strategy.analyze_turn(p1, p2, pieces, track, depth, time_budget):
+            click.echo(f"depth {update.depth:3} margin {update.margin:+4} nodes {update.nodes:10} {update.seconds:7.2f}s  "
+                       f"{' '.join(turn_action.name for turn_action in update.line)}")
+            result = update.result
+    click.echo()
+    if result is None:
+        click.echo("The search was stopped before its first iteration completed\n")
+    return result
+
+
+def analyze(strategy: engine_stragegies.EngineStrategy, depth: int, time_budget, game_state: GameState,
+            profile: Optional[str] = None, ponderer: Optional[Ponderer] = None, live: bool = False) -> Optional[GameState]:
+    """
+    Calculates the turn of a snapshot's state (see GameSync.update) and prints the outcome
+    :return: Calculated state, None if a live search was stopped before it had a result
+    :param profile: File for the pstats dump of the search, None to not profile it
+    :param ponderer: Pondered since the previous turn, it gets stopped before the search
+    :param live: Print the search progress and stop it on a key press, see search_live
+    """
+    pieces, p1, p2, track = game_state.market, game_state.active_player, game_state.passive_player, game_state.time_track
+    print_delimiter(True)
+    print_game_status(p1, p2, track)
+    if ponderer is not None and ponderer.pondered:
+        click.echo(f"{ponderer.report(ponderer.matches(game_state))}\n")
+        ponderer.before_search()
+    if live and profile is not None:
+        raise click.UsageError("--profile only sees the search of calculate_turn, it does not work with --live")
+    profiler = cProfile.Profile() if profile is not None else None
+    timer = timeit.default_timer()
+    if profiler is not None:
+        profiler.enable()
+    if live:
+        calculated_game_state = search_live(strategy, p1, p2, pieces, track, depth, time_budget)
+    else:
+        calculated_game_state = strategy.calculate_turn(p1, p2, pieces, track, depth, time_budget)
+    if profiler is not None:
+        profiler.disable()
+    if calculated_game_state is None:
+        return None
+    time_needed = timeit.default_timer() - timer
+    click.secho(f"Time needed: {time_needed}")
+    if strategy.cache_hit:
+        click.secho(f"Taken from the position cache, searched to depth {strategy.depth_reached}\n")
+    elif strategy.endgame_solved:
+        click.secho(f"Endgame solved to the end of the game in {strategy.depth_reached} turns, Nodes: {strategy.nodes}\n")
+    else:
+        click.secho(f"Depth reached: {strategy.depth_reached}, Nodes: {strategy.nodes} "
+                    f"({strategy.nodes / max(time_needed, 1e-9):.0f} nodes/sec)\n")
+    if strategy.transposition_table is not None:
+        click.echo(f"{strategy.transposition_table.stats()}\n")
+    if strategy.position_cache is not None:
+        click.echo(f"{strategy.position_cache.stats()}\n")
+    if ponderer is not None and ponderer.pondered:
+        click.echo(f"{ponderer.reused()}\n")
+    if strategy.stats is not None:
+        click.echo(f"{strategy.stats.summary(time_needed, getattr(strategy, 'cutoffs', None), strategy.transposition_table)}\n")
+    if profiler is not None:
+        profiler.dump_stats(profile)
+        click.echo(f"Profile written to {profile}")
+        pstats.Stats(profiler, stream=click.get_text_stream("stdout")).sort_stats("cumulative").print_stats(15)
+    calculated_game_state.print_outcome()
+    return calculated_game_state
+
+
+def analyze_remote(socket_path: str, strategy: str, depth: Optional[int], time_budget: Optional[float], game_data: Dict) -> GameState:
+    """Like analyze, but the turn is calculated by the analysis server at socket_path, its progress is printed live"""
+    pieces, p1, p2, track = init_game(*parse_game_data(copy.deepcopy(game_data)))
+    print_delimiter(True)
+    print_game_status(p1, p2, track)
+    request = {"snapshot": game_data, "strategy": strategy, "depth": depth, "time_budget": time_budget}
+
+    async def follow() -> Dict:
+        async for event in analysis_server.request_events(socket_path, request):
+            click.echo(analysis_server.describe(event))
+            if event["event"] in analysis_server.FINAL_EVENTS:
+                return event
+
+    result = asyncio.run(follow())
+    if result["event"] == "error":
+        raise click.ClickException(result["message"])
+    click.echo()
+    calculated_game_state = GameState(p1, p2, pieces, track)
+    calculated_game_state.determine_active_player()
+    calculated_game_state.record_history = True
+    for name in result["line"]:
+        calculated_game_state.apply(TurnAction[name])
+    calculated_game_state.print_outcome()
+    return calculated_game_state
@@ -0,0 +1,361 @@
+import asyncio
+import copy
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import timeit
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import click
+
+import engine_stragegies
+import worker_pool
+from compact_state import StateCodec
+from components import GameState
+from game_data import parse_game_data, init_game, load_snapshot, read_snapshot
+from position_cache import PositionCache
+from transposition import TranspositionTable
+
+DEFAULT_SOCKET = "patchwork.sock"
+# Longest request or event line, a gamedatas object is far larger than the default of asyncio streams
+LINE_LIMIT = 64 * 1024 * 1024
+# Events after which no more events of a request follow
+FINAL_EVENTS = ("result", "error")
+
+
+def position_key(game_data: Dict) -> Tuple:
+    """Identical positions have the same key, whichever game and players they come from"""
+    market, p1, p2, track = init_game(*parse_game_data(copy.deepcopy(game_data)))
+    game_state = GameState(p1, p2, market, track)
+    game_state.determine_active_player()
+    codec = StateCodec(game_state)
+    return codec.ring, codec.encode(game_state)
+
+
+# Search state of a worker process, set by _init_worker
+_progress: Optional[multiprocessing.Queue] = None
+_table_bytes = 0
+_position_cache: Optional[PositionCache] = None
+
+
+def _init_worker(progress: multiprocessing.Queue, table_bytes: int, search_workers: int, cache: Optional[str], cache_size: int):
+    global _progress, _table_bytes, _position_cache
+    _progress, _table_bytes = progress, table_bytes
+    worker_pool.configure(search_workers, table_bytes)
+    if cache is not None:
+        _position_cache = PositionCache(cache, cache_size)
+
+
+def _search(job: int, game_data: Dict, strategy_name: str, depth: int, time_budget: Optional[float]) -> Dict:
+    """
+    Pool task: calculates the turn of a position, every completed iteration is sent to the progress queue.
+    The strategies of a worker keep their transposition tables across tasks.
+    :return: Result event without the request id
+    """
+    strategy = engine_stragegies.strategies[strategy_name]
+    if _table_bytes and strategy.transposition_table is None:
+        strategy.transposition_table = TranspositionTable(_table_bytes)
+    strategy.position_cache = _position_cache
+    timer = timeit.default_timer()
+
+    def report(_, depth_: int, line: List):
+        _progress.put((job, {"event": "progress", "depth": depth_, "nodes": strategy.nodes, "line": [action.name for action in line],
+                             "seconds": timeit.default_timer() - timer}))
+
+    strategy.on_iteration = report
+    _progress.put((job, {"event": "started", "pid": os.getpid()}))
+    market, p1, p2, track = init_game(*parse_game_data(game_data))
+    try:
+        result = strategy.calculate_turn(p1, p2, market, track, depth, time_budget)
+    finally:
+        strategy.on_iteration = None
+    return {
+        "event": "result",
+        "line": [step["turn_action"].name for step in result.history],
+        "depth": strategy.depth_reached,
+        "nodes": strategy.nodes,
+        "seconds": timeit.default_timer() - timer,
+        "endgame_solved": strategy.endgame_solved,
+        "cache_hit": strategy.cache_hit,
+    }
+
+
+class Job:
+    """A search in the pool and the event queues of the requests waiting for it"""
+
+    def __init__(self, id_: int, key: Tuple):
+        self.id = id_
+        self.key = key
+        self.subscribers: List[asyncio.Queue] = []
+        self.last_progress: Optional[Dict] = None
+
+    def publish(self, event: Dict):
+        if event["event"] == "progress":
+            self.last_progress = event
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+
+class AnalysisService:
+    """
+    Calculates turns of snapshots on a shared process pool. A request for a position which is already searched with
+    the same settings waits for that search instead of starting another one, the most recent results are kept.
+    Transport independent, see serve for the Unix socket server.
+    """
+
+    def __init__(self, processes: Optional[int] = None, table_bytes: int = 0, search_workers: int = 1,
+                 cache: Optional[str] = None, cache_size: int = 1_000_000, max_results: int = 256):
+        self.__progress = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(processes, initializer=_init_worker,
+                                            initargs=(self.__progress, table_bytes, search_workers, cache, cache_size))
+        self.max_results = max_results
+        self.results: OrderedDict[Tuple, Dict] = OrderedDict()
+        self.jobs: Dict[Tuple, Job] = {}
+        self.__jobs_by_id: Dict[int, Job] = {}
+        self.__ids = itertools.count()
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__relay: Optional[threading.Thread] = None
+        self.searches = 0
+        self.coalesced = 0
+        self.cached = 0
+
+    def start(self):
+        """Starts relaying progress of the workers to the event loop this is called in"""
+        self.__loop = asyncio.get_running_loop()
+        self.__relay = threading.Thread(target=self.__relay_progress, name="progress relay", daemon=True)
+        self.__relay.start()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        if self.__relay is not None:
+            self.__progress.put(None)
+            self.__relay.join()
+            self.__relay = None
+
+    def __relay_progress(self):
+        while True:
+            item = self.__progress.get()
+            if item is None:
+                return
+            self.__loop.call_soon_threadsafe(self.__publish_progress, *item)
+
+    def __publish_progress(self, job_id: int, event: Dict):
+        job = self.__jobs_by_id.get(job_id)
+        if job is not None:
+            job.publish(event)
+
+    async def analyze(self, request: Dict) -> AsyncIterator[Dict]:
+        """
+        :param request: snapshot (see load_snapshot), strategy, depth and time_budget as in analyze.py
+        :return: Events of the request: accepted (coalesced if it joined a running search), started, progress after
+        every completed iteration, and finally result or error. Results of recent searches are answered at once.
+        """
+        try:
+            _, game_data = read_snapshot(request["snapshot"])
+            strategy = request.get("strategy", "greedy_single_core").lower()
+            if strategy not in engine_stragegies.strategies:
+                raise ValueError(f"Unknown strategy {strategy}")
+            time_budget = request.get("time_budget")
+            depth = request.get("depth")
+            if depth is None:
+                depth = 3 if time_budget is None else engine_stragegies.UNLIMITED_DEPTH
+            key = position_key(game_data) + (strategy, depth, time_budget)
+        except (KeyError, IndexError, TypeError, ValueError, AttributeError) as error:
+            yield {"event": "error", "message": f"Invalid request: {error!r}"}
+            return
+
+        if key in self.results:
+            self.cached += 1
+            self.results.move_to_end(key)
+            yield self.results[key] | {"cached": True}
+            return
+
+        job = self.jobs.get(key)
+        coalesced = job is not None
+        if job is None:
+            job = self.__submit(key, game_data, strategy, depth, time_budget)
+        else:
+            self.coalesced += 1
+        queue = asyncio.Queue()
+        job.subscribers.append(queue)
+        try:
+            yield {"event": "accepted", "job": job.id, "coalesced": coalesced}
+            if job.last_progress is not None:
+                yield job.last_progress
+            while True:
+                event = await queue.get()
+                yield event
+                if event["event"] in FINAL_EVENTS:
+                    return
+        finally:
+            job.subscribers.remove(queue)
+
+    def __submit(self, key: Tuple, game_data: Dict, strategy: str, depth: int, time_budget: Optional[float]) -> Job:
+        job = Job(next(self.__ids), key)
+        self.jobs[key] = self.__jobs_by_id[job.id] = job
+        self.searches += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, _search, job.id, game_data, strategy, depth, time_budget)
+        future.add_done_callback(lambda done: self.__finish(job, done))
+        return job
+
+    def __finish(self, job: Job, future: asyncio.Future):
+        del self.jobs[job.key], self.__jobs_by_id[job.id]
+        if future.cancelled():
+            job.publish({"event": "error", "message": "Search cancelled"})
+            return
+        if future.exception() is not None:
+            job.publish({"event": "error", "message": f"Search failed: {future.exception()!r}"})
+            return
+        result = future.result()
+        self.results[job.key] = result
+        while len(self.results) > self.max_results:
+            self.results.popitem(last=False)
+        job.publish(result)
+
+    def stats(self) -> str:
+        return f"{self.searches} searches, {self.coalesced} coalesced and {self.cached} cached requests, " \
+               f"{len(self.jobs)} running"
+
+
+async def handle_connection(service: AnalysisService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Every line of a connection is a JSON request, its events are written back as JSON lines with the id of the
+    request. Requests of one connection run concurrently.
+    """
+    lock = asyncio.Lock()
+
+    async def send(event: Dict):
+        async with lock:
+            writer.write(json.dumps(event).encode() + b"\n")
+            await writer.drain()
+
+    async def answer(line: bytes):
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as error:
+            await send({"event": "error", "message": f"Invalid JSON: {error}"})
+            return
+        request_id = request.get("id") if isinstance(request, dict) else None
+        async for event in service.analyze(request if isinstance(request, dict) else {}):
+            await send(event | {"id": request_id})
+
+    tasks = set()
+    try:
+        while line := await reader.readline():
+            if line.strip():
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        for task in tasks:
+            task.cancel()
+    finally:
+        writer.close()
+
+
+async def serve(service: AnalysisService, path: str):
+    """Serves the service on a Unix socket at path until SIGINT or SIGTERM"""
+    if os.path.exists(path):
+        os.remove(path)
+    stop = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signal_number, stop.set)
+    service.start()
+    server = await asyncio.start_unix_server(lambda reader, writer: handle_connection(service, reader, writer), path,
+                                             limit=LINE_LIMIT)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        service.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def request_events(path: str, request: Dict) -> AsyncIterator[Dict]:
+    """Client: sends one request to the server at path and yields its events up to the result or error"""
+    reader, writer = await asyncio.open_unix_connection(path, limit=LINE_LIMIT)
+    try:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        while line := await reader.readline():
+            event = json.loads(line)
+            yield event
+            if event["event"] in FINAL_EVENTS:
+                return
+        raise ConnectionError(f"The analysis server at {path} closed the connection")
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def describe(event: Dict) -> str:
+    """One line of an event for the terminal"""
+    match event["event"]:
+        case "accepted":
+            return "Joined the running search of the same position" if event["coalesced"] else "Search queued"
+        case "started":
+            return f"Search started in process {event['pid']}"
+        case "progress":
+            return f"Depth {event['depth']}: {' '.join(event['line'])} ({event['nodes']} nodes, {event['seconds']:.1f}s)"
+        case "result":
+            source = "recent result" if event.get("cached") else "position cache" if event["cache_hit"] else \
+                "endgame solved" if event["endgame_solved"] else f"{event['nodes']} nodes"
+            return f"Best line to depth {event['depth']}: {' '.join(event['line'])} ({source}, {event['seconds']:.1f}s)"
+        case _:
+            return f"Error: {event.get('message')}"
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command("serve")
+@click.option("--socket", "socket_path", default=DEFAULT_SOCKET, show_default=True, type=click.Path(dir_okay=False))
+@click.option("--processes", "-p", default=None, help="Searches at once [default: cpu count]", type=int)
+@click.option("--tt-size", default=0, show_default=True, help="Transposition table size in MB per strategy and process, "
+                                                              "0 disables it", type=int)
+@click.option("--search-workers", default=1, show_default=True, help="Worker pool of the parallel strategies in every process", type=int)
+@click.option("--cache", default=None, help="Position cache file shared by the processes", type=click.Path(dir_okay=False))
+@click.option("--cache-size", default=1_000_000, show_default=True, help="Maximum entries of the position cache", type=int)
+@click.option("--results", default=256, show_default=True, help="Recent results answered without searching", type=int)
+def serve_command(socket_path, processes, tt_size, search_workers, cache, cache_size, results):
+    """
+    Calculates turns for any number of followed games (pw.py --server) on one process pool. Requests are JSON lines
+    with snapshot, strategy, depth and time_budget, answered with JSON lines of events.
+    """
+    service = AnalysisService(processes, tt_size * 1024 * 1024, search_workers, cache, cache_size, results)
+    click.echo(f"Serving on {socket_path}")
+    asyncio.run(serve(service, socket_path))
+    click.echo(service.stats())
+
+
+@cli.command("request")
+@click.argument("snapshots", nargs=-1, required=True, type=click.File("r"))
+@click.option("--socket", "socket_path", default=DEFAULT_SOCKET, show_default=True, type=click.Path(dir_okay=False))
+@click.option("--strategy", "-s", default="greedy_single_core", type=click.Choice(list(engine_stragegies.strategies), case_sensitive=False))
+@click.option("--depth", "-d", default=None, type=int)
+@click.option("--time-budget", "-t", default=None, type=float)
+def request_command(snapshots, socket_path, strategy, depth, time_budget):
+    """Sends SNAPSHOTS to the server at once and prints the events of every request"""
+    async def follow(snapshot):
+        _, game_data = load_snapshot(snapshot)
+        request = {"snapshot": game_data, "strategy": strategy, "depth": depth, "time_budget": time_budget}
+        async for event in request_events(socket_path, request):
+            click.echo(f"{snapshot.name}: {describe(event)}")
+
+    async def main():
+        await asyncio.gather(*(follow(snapshot) for snapshot in snapshots))
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    cli()
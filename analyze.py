@@ -0,0 +1,31 @@
+import click
+
+from analysis import strategy_options, configure_strategy, analyze, print_delimiter
+from game_data import load_snapshot
+from game_sync import GameSync
+
+
+@click.command()
+@click.argument("snapshots", nargs=-1, type=click.File("r"))
+@strategy_options
+def analyze_snapshots(snapshots, strategy, depth, tt_size, time_budget, workers, split_ply, iterations, endgame_distance,
+                      stats, profile, verify_aggregates, cache, cache_size, live):
+    """
+    Calculates the turn of recorded positions without a browser.
+    SNAPSHOTS are files written by pw.py --snapshot-dir or bare gamedatas JSON, - or none reads stdin.
+    Consecutive snapshots of a game update the state of the previous one, like pw.py --wait.
+    """
+    strategy, depth = configure_strategy(strategy, depth, tt_size, time_budget, workers, split_ply, iterations,
+                                         endgame_distance, stats, verify_aggregates, cache, cache_size)
+    sync = GameSync()
+    for snapshot in snapshots or (click.open_file("-"),):
+        turn, game_data = load_snapshot(snapshot)
+        print_delimiter()
+        click.echo(f"{snapshot.name}" + (f" (move {turn})" if turn is not None else ""))
+        game_state = sync.update(game_data)
+        click.echo(sync.summary())
+        analyze(strategy, depth, time_budget, game_state, profile, live=live)
+
+
+if __name__ == "__main__":
+    analyze_snapshots()
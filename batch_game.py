@@ -0,0 +1,265 @@
+from typing import Optional
+
+import numpy as np
+
+import quilt
+from components import GameState, TimeTrack, TurnAction, SPECIAL_PATCH_ID
+
+# (income phases, special spots) by start position and steps, see TimeTrack.crossings
+CROSSINGS = np.array(TimeTrack._crossings, dtype=np.int32)
+# Number of spots in a bitmask of special spots
+SPOT_COUNTS = np.array([bin(spots).count("1") for spots in range(1 << len(TimeTrack._special_spot_locations))], dtype=np.int32)
+REMAINING_INCOME_PHASES = np.array(TimeTrack._remaining_income_phases, dtype=np.int32)
+# Patches of the market order in an observation, the three choices and the ones after them
+OBSERVED_PATCHES = 6
+PLAYER_FEATURES = ("location", "buttons", "income", "empty_spaces", "special7x7")
+OBSERVATION_SIZE = 2 * len(PLAYER_FEATURES) + 4 * OBSERVED_PATCHES
+# A quilt in the arrays is two words, cells 0-63 and 64-80
+LOW_CELLS = 64
+LOW = (1 << LOW_CELLS) - 1
+
+
+def split_quilt(cells) -> (int, int):
+    return cells & LOW, cells >> LOW_CELLS
+
+
+def observe(game_state: GameState, agent_number: int) -> np.ndarray:
+    """Observation of a single game from the view of the agent, laid out like BatchGame.observations"""
+    agent, opponent = (game_state.active_player, game_state.passive_player) \
+        if game_state.active_player.player_number == agent_number else (game_state.passive_player, game_state.active_player)
+    features = []
+    for player in (agent, opponent):
+        features += [player.location, player.button_count, player.button_production, player.empty_spaces, player.owns_special7x7]
+    patches = (list(game_state.market.get_patch_choices()) + list(game_state.market.get_remaining_patches()))[:OBSERVED_PATCHES]
+    for patch in patches:
+        features += [patch.button_cost, patch.time_cost, patch.button_income, patch.size]
+    features += [0] * (OBSERVATION_SIZE - len(features))
+    return np.array(features, dtype=np.float32)
+
+
+def action_mask(game_state: GameState) -> np.ndarray:
+    return np.array([game_state.turn_action_possible(turn_action) for turn_action in TurnAction], dtype=bool)
+
+
+def score_margin(game_state: GameState, agent_number: int) -> int:
+    agent, opponent = (game_state.active_player, game_state.passive_player) \
+        if game_state.active_player.player_number == agent_number else (game_state.passive_player, game_state.active_player)
+    return agent.score - opponent.score
+
+
+class BatchGame:
+    """
+    n games on NumPy arrays, stepped together with the rules of GameState.apply. Side 0 of the player arrays is the
+    player to move in the start position (the agent), side 1 its opponent. The market of a game is a row of patch ids
+    in market order with a removed mask and the offset of the first choice, like Market. Quilts are bitboards in two
+    words per player, patches go to their first fit (see quilt.Placements), which needs the shapes of all patches.
+    """
+
+    def __init__(self, start: GameState, n: int, shuffle_market: bool = False, seed: Optional[int] = None):
+        self.n = n
+        self.shuffle_market = shuffle_market
+        self.random = np.random.default_rng(seed)
+        self.agent_number = start.active_player.player_number
+        table = start.market.patch_table
+        self.cost = np.array(table.button_cost, dtype=np.int32)
+        self.time = np.array(table.time_cost, dtype=np.int32)
+        self.income_of = np.array(table.button_income, dtype=np.int32)
+        self.size = np.array(table.size, dtype=np.int32)
+        self.__init_placements(table)
+
+        players = (start.active_player, start.passive_player)
+        self.__start = {
+            "location": np.array([player.location for player in players], dtype=np.int32),
+            "top": np.array([player.location_top for player in players], dtype=np.int32),
+            "buttons": np.array([player.button_count for player in players], dtype=np.int32),
+            "income": np.array([player.button_production for player in players], dtype=np.int32),
+            "empty_spaces": np.array([player.empty_spaces for player in players], dtype=np.int32),
+            "special7x7": np.array([player.owns_special7x7 for player in players], dtype=np.int32),
+            "quilt_low": np.array([split_quilt(player.quilt)[0] for player in players], dtype=np.uint64),
+            "quilt_high": np.array([split_quilt(player.quilt)[1] for player in players], dtype=np.uint64),
+        }
+        self.__start_ring = np.array(start.market.ring, dtype=np.int32)
+        self.__start_removed = np.array([bool(start.market.removed & (1 << index)) for index in range(len(start.market.ring))])
+        self.__start_offset = start.market.offset
+        self.__start_claimed = start.time_track.claimed
+        self.ring_size = len(self.__start_ring)
+
+        self.location = np.zeros((n, 2), dtype=np.int32)
+        self.top = np.zeros((n, 2), dtype=np.int32)
+        self.buttons = np.zeros((n, 2), dtype=np.int32)
+        self.income = np.zeros((n, 2), dtype=np.int32)
+        self.empty_spaces = np.zeros((n, 2), dtype=np.int32)
+        self.special7x7 = np.zeros((n, 2), dtype=np.int32)
+        self.quilt_low = np.zeros((n, 2), dtype=np.uint64)
+        self.quilt_high = np.zeros((n, 2), dtype=np.uint64)
+        self.active = np.zeros(n, dtype=np.int32)
+        self.claimed = np.zeros(n, dtype=np.int32)
+        self.ring = np.zeros((n, self.ring_size), dtype=np.int32)
+        self.removed = np.zeros((n, self.ring_size), dtype=bool)
+        self.offset = np.zeros(n, dtype=np.int32)
+        self.reset(np.ones(n, dtype=bool))
+
+    def __init_placements(self, table):
+        """Placement masks of every patch id in first fit order, padded with invalid placements"""
+        masks = []
+        for patch in table.patches:
+            if not isinstance(patch.placements, quilt.Placements):
+                raise ValueError(f"Shape of {patch} is unknown, BatchGame needs the shapes of all patches")
+            masks.append(patch.placements.masks)
+        width = max(len(patch_masks) for patch_masks in masks)
+        self.placement_low = np.zeros((len(masks), width), dtype=np.uint64)
+        self.placement_high = np.zeros((len(masks), width), dtype=np.uint64)
+        self.placement_valid = np.zeros((len(masks), width), dtype=bool)
+        for id_, patch_masks in enumerate(masks):
+            words = np.array([split_quilt(mask) for mask in patch_masks], dtype=np.uint64)
+            self.placement_low[id_, :len(patch_masks)] = words[:, 0]
+            self.placement_high[id_, :len(patch_masks)] = words[:, 1]
+            self.placement_valid[id_, :len(patch_masks)] = True
+        squares = np.array([split_quilt(square) for square in quilt.BONUS_SQUARES], dtype=np.uint64)
+        self.bonus_low, self.bonus_high = squares[:, 0], squares[:, 1]
+
+    def reset(self, games: np.ndarray):
+        """Puts the games of the boolean mask back to the start position, with a shuffled market if enabled"""
+        rows = np.nonzero(games)[0]
+        for name, values in self.__start.items():
+            getattr(self, name)[rows] = values
+        self.active[rows] = 0
+        self.claimed[rows] = self.__start_claimed
+        self.removed[rows] = self.__start_removed
+        self.offset[rows] = self.__start_offset
+        if not self.shuffle_market:
+            self.ring[rows] = self.__start_ring
+            return
+        available = np.nonzero(~self.__start_removed)[0]
+        keys = self.random.random((len(rows), len(available)))
+        ring = np.tile(self.__start_ring, (len(rows), 1))
+        ring[:, available] = self.__start_ring[available][np.argsort(keys, axis=1)]
+        self.ring[rows] = ring
+
+    def __order(self, rows: np.ndarray, start: np.ndarray) -> (np.ndarray, np.ndarray):
+        """:return: Ring indices from start on in market order and the rank of every available one (1 = first)"""
+        order = (start[:, None] + np.arange(self.ring_size)) % self.ring_size
+        available = ~self.removed[rows[:, None], order]
+        return order, np.where(available, np.cumsum(available, axis=1), 0)
+
+    def choices(self, rows: Optional[np.ndarray] = None, count: int = 3) -> np.ndarray:
+        """:return: Ring index of the first count choices of every game, -1 where the market has less patches"""
+        rows = np.arange(self.n) if rows is None else rows
+        order, rank = self.__order(rows, self.offset[rows])
+        result = np.full((len(rows), count), -1, dtype=np.int32)
+        for choice in range(count):
+            found = rank == choice + 1
+            result[:, choice] = np.where(found.any(axis=1), order[np.arange(len(rows)), found.argmax(axis=1)], -1)
+        return result
+
+    def first_fit(self, rows: np.ndarray, sides: np.ndarray, patches: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+        """:return: Whether each patch fits on the quilt of the side of its row and the two words of its first fit"""
+        low, high = self.placement_low[patches], self.placement_high[patches]
+        free = self.placement_valid[patches] & ((low & self.quilt_low[rows, sides][:, None]) == 0) \
+            & ((high & self.quilt_high[rows, sides][:, None]) == 0)
+        first = free.argmax(axis=1)
+        index = np.arange(len(rows))
+        fits = free[index, first]
+        return fits, np.where(fits, low[index, first], 0), np.where(fits, high[index, first], 0)
+
+    def action_masks(self) -> np.ndarray:
+        """Possible TurnActions of the player to move in every game, like GameState.turn_action_possible"""
+        rows = np.arange(self.n)
+        choices = self.choices(rows)
+        patches = self.ring[rows[:, None], np.maximum(choices, 0)]
+        buttons = self.buttons[rows, self.active]
+        masks = np.ones((self.n, len(TurnAction)), dtype=bool)
+        masks[:, :3] = (choices >= 0) & (buttons[:, None] >= self.cost[patches])
+        for choice in range(3):
+            candidates = np.nonzero(masks[:, choice])[0]
+            masks[candidates, choice] = self.first_fit(candidates, self.active[candidates], patches[candidates, choice])[0]
+        return masks
+
+    def step(self, actions: np.ndarray, games: Optional[np.ndarray] = None):
+        """
+        Applies a possible TurnAction to each game of the boolean mask (default: all) and determines the player to
+        move. The caller is responsible for only passing possible actions, see action_masks.
+        """
+        rows = np.arange(self.n) if games is None else np.nonzero(games)[0]
+        actions = np.asarray(actions)[rows]
+        side = self.active[rows]
+        other = 1 - side
+        location, other_location = self.location[rows, side], self.location[rows, other]
+        goal = TimeTrack._goal_id
+
+        take = actions != TurnAction.ADVANCE
+        choices = self.choices(rows)
+        index = choices[np.arange(len(rows)), np.where(take, actions, 0)]
+        patch = self.ring[rows, np.maximum(index, 0)]
+        cost = np.where(take, self.cost[patch], 0)
+        income = np.where(take, self.income_of[patch], 0)
+        steps = np.where(take, self.time[patch], other_location - location + 1)
+        phases, spots = np.moveaxis(CROSSINGS[np.minimum(location, goal), np.minimum(steps, goal + 1)], -1, 0)
+        specials = SPOT_COUNTS[spots & ~self.claimed[rows]]
+        self.claimed[rows] |= spots
+
+        new_location = np.where(take, location + steps, other_location + 1)
+        production = self.income[rows, side] + income
+        self.buttons[rows, side] += np.where(take, -cost, steps) + phases * production
+        self.income[rows, side] = production
+        self.location[rows, side] = new_location
+        self.top[rows, side] = (take & (new_location == other_location)).astype(np.int32)
+        self.__place(rows, side, take, patch, specials)
+
+        taken_rows, taken_index = rows[take], index[take]
+        self.removed[taken_rows, taken_index] = True
+        if len(taken_rows):
+            order, rank = self.__order(taken_rows, taken_index)
+            first = rank == 1
+            self.offset[taken_rows] = np.where(first.any(axis=1), order[np.arange(len(taken_rows)), first.argmax(axis=1)],
+                                               taken_index)
+
+        passed = new_location - self.top[rows, side] > other_location - self.top[rows, other]
+        self.active[rows] = np.where(passed, other, side)
+
+    def __place(self, rows: np.ndarray, side: np.ndarray, take: np.ndarray, patch: np.ndarray, specials: np.ndarray):
+        """
+        Puts the taken patches and then the special patches on the quilts, claims 7x7 squares they complete. Special
+        patches which do not fit any more are lost.
+        """
+        low, high = self.quilt_low[rows, side], self.quilt_high[rows, side]
+        placed = [(take, patch)] + [(specials > count, np.full(len(rows), SPECIAL_PATCH_ID)) for count in range(specials.max(initial=0))]
+        for placing, patches in placed:
+            index = np.nonzero(placing)[0]
+            fits, placed_low, placed_high = self.first_fit(rows[index], side[index], patches[index])
+            self.empty_spaces[rows[index], side[index]] -= np.where(fits, self.size[patches[index]], 0)
+            self.quilt_low[rows[index], side[index]] |= placed_low
+            self.quilt_high[rows[index], side[index]] |= placed_high
+
+        new_low, new_high = self.quilt_low[rows, side], self.quilt_high[rows, side]
+        added_low, added_high = new_low & ~low, new_high & ~high
+        completed = ((new_low[:, None] & self.bonus_low) == self.bonus_low) & ((new_high[:, None] & self.bonus_high) == self.bonus_high) \
+            & (((added_low[:, None] & self.bonus_low) | (added_high[:, None] & self.bonus_high)) != 0)
+        claims = completed.any(axis=1) & (self.special7x7[rows].sum(axis=1) == 0)
+        self.special7x7[rows[claims], side[claims]] = 1
+
+    def game_end(self) -> np.ndarray:
+        return (self.location >= TimeTrack._goal_id).all(axis=1)
+
+    def scores(self) -> np.ndarray:
+        """Player.score of both sides of every game"""
+        remaining = REMAINING_INCOME_PHASES[np.minimum(self.location, TimeTrack._goal_id)]
+        return self.buttons + self.income * remaining - 2 * self.empty_spaces + 7 * self.special7x7
+
+    def score_margins(self) -> np.ndarray:
+        """Score of the agent minus the score of the opponent"""
+        scores = self.scores()
+        return scores[:, 0] - scores[:, 1]
+
+    def observations(self) -> np.ndarray:
+        """Features of both players from the view of the agent followed by cost, time, income and size of the next patches"""
+        players = np.stack([self.location, self.buttons, self.income, self.empty_spaces, self.special7x7], axis=2)
+        choices = self.choices(count=OBSERVED_PATCHES)
+        patches = self.ring[np.arange(self.n)[:, None], np.maximum(choices, 0)]
+        stats = np.stack([self.cost[patches], self.time[patches], self.income_of[patches], self.size[patches]], axis=2)
+        stats[choices < 0] = 0
+        return np.concatenate([players.reshape(self.n, -1), stats.reshape(self.n, -1)], axis=1).astype(np.float32)
+
+    def random_actions(self, masks: np.ndarray) -> np.ndarray:
+        """A uniformly chosen possible action of every game"""
+        return np.argmax(self.random.random(masks.shape) * masks, axis=1)
@@ -0,0 +1,359 @@
+import copy
+import itertools
+import json
+import platform
+import random
+import subprocess
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+
+import engine_stragegies
+import quilt
+import worker_pool
+from components import Market, Player, TimeTrack, GameState, TurnAction
+from game_data import parse_game_data, init_game, load_snapshot
+from game_sync import GameSync
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+def fixture_names() -> List[str]:
+    return sorted(path.stem for path in FIXTURES_DIR.glob("*.json"))
+
+
+def load_fixture(name: str) -> (Market, Player, Player, TimeTrack):
+    """
+    Position fixtures are window.gameui.gamedatas of a game plus its move_nbr. A fixture where the player to move has
+    only one legal action measures nothing but that action, it is rejected.
+    """
+    with open(FIXTURES_DIR / f"{name}.json") as file:
+        _, game_data = load_snapshot(file)
+    market, p1, p2, track = init_game(*parse_game_data(game_data))
+    game_state = GameState(p1, p2, market, track)
+    game_state.determine_active_player()
+    legal_actions = [turn_action.name for turn_action in TurnAction if game_state.turn_action_possible(turn_action)]
+    if len(legal_actions) < 2:
+        raise ValueError(f"Fixture {name} is degenerate, the player to move can only {legal_actions}")
+    return market, p1, p2, track
+
+
+class DeepcopySearch:
+    """
+    The search as it was before GameState.apply/undo: every child is a deepcopy of its parent, including the scores
+    of every turn of the path to it
+    """
+
+    @staticmethod
+    def root(market: Market, p1: Player, p2: Player, track: TimeTrack) -> GameState:
+        game_state = GameState(p1, p2, market, track)
+        game_state.record_history = True
+        return game_state
+
+    def __init__(self):
+        self.nodes = 0
+
+    def calculate_state(self, game_state: GameState, max_depth, current_depth) -> Optional[GameState]:
+        best: Optional[GameState] = None
+        game_state.determine_active_player()
+
+        for turn_action in TurnAction:
+            if not game_state.turn_action_possible(turn_action):
+                continue
+
+            game_state_copy = copy.deepcopy(game_state)
+            game_state_copy.execute_turn(turn_action)
+            self.nodes += 1
+
+            if not game_state_copy.game_end() and current_depth < max_depth:
+                contender = self.calculate_state(game_state_copy, max_depth, current_depth + 1)
+                best = self.choose_winner(game_state.player, game_state.opponent, best, contender)
+            else:
+                best = self.choose_winner(game_state.player, game_state.opponent, best, game_state_copy)
+
+        return best
+
+    @staticmethod
+    def choose_winner(player: Player, opponent: Player, current_best: GameState, candidate: GameState):
+        if not current_best:
+            return candidate
+
+        current_outcome = current_best.history[-1]
+        candidate_outcome = candidate.history[-1]
+
+        return candidate if candidate_outcome[player.player_number] > candidate_outcome[opponent.player_number] \
+                            and candidate_outcome[player.player_number] > current_outcome[player.player_number] else current_best
+
+
+def scan_game_data(game_data: Dict) -> (Dict, str, Dict):
+    """parse_game_data as it was before TokenIndex: every player scans all tokens for its buttons and its patches"""
+    players = game_data['players']
+    for key, player in players.items():
+        player['income'] = game_data['counters'][f"income_{player['color']}_counter"]['counter_value']
+        player['empty_spaces'] = game_data['counters'][f"empties_{player['color']}_counter"]['counter_value']
+        player['players_turn'] = (game_data['gamestate']['active_player'] == player['id'])
+        player['buttons'] = sum([1 for token in game_data['tokens'].values() if token['location'] == f"buttons_{player['color']}"])
+        player['time_marker'] = {
+            'location': int(game_data['tokens'][f'timemarker_{player["color"]}']['location'].split('_')[1]),
+            'top': game_data['tokens'][f'timemarker_{player["color"]}']['state']
+        }
+        player['tile_special7x7'] = game_data['tokens']['tile_special7x7']['location'] == f"tableau_{player['color']}"
+        player['owned_patches'] = {patch['key'] for patch in
+                                   game_data['tokens'].values() if
+                                   patch['location'].startswith(f"square_{player['color']}")}
+
+    patches = {}
+    for id_ in Market.patch_keys:
+        patches[id_] = game_data['tokens'][id_] | game_data['token_types'][id_]
+
+    return patches, game_data['tokens']['token_neutral']['state'], players
+
+
+def _actions(history: List[Dict]) -> List[str]:
+    return [item["turn_action"].name for item in history]
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("--depth", "-d", default=4, help="Depth for movement calculation", type=int)
+def throughput(depth):
+    """Compares node throughput of the in place search against the deepcopy search"""
+    reference = DeepcopySearch()
+    market, p1, p2, track = load_fixture("early")
+    timer = timeit.default_timer()
+    expected = reference.calculate_state(reference.root(market, p1, p2, track), depth, 0)
+    deepcopy_time = timeit.default_timer() - timer
+
+    strategy = engine_stragegies.GreedySingleCoreStrategy()
+    market, p1, p2, track = load_fixture("early")
+    timer = timeit.default_timer()
+    result = strategy.calculate_turn(p1, p2, market, track, depth)
+    in_place_time = timeit.default_timer() - timer
+
+    click.echo(f"deepcopy: {reference.nodes} nodes in {deepcopy_time:.3f}s ({reference.nodes / deepcopy_time:.0f} nodes/s)")
+    click.echo(f"in place: {strategy.nodes} nodes in {in_place_time:.3f}s ({strategy.nodes / in_place_time:.0f} nodes/s)")
+    click.echo(f"Speedup: {deepcopy_time / in_place_time:.2f}x")
+    if _actions(expected.history) != _actions(result.history):
+        raise click.ClickException(f"Paths differ: {_actions(expected.history)} != {_actions(result.history)}")
+
+
+@cli.command()
+@click.option("--depth", "-d", default=6, help="Depth for movement calculation", type=int)
+@click.option("--max-workers", default=None, help="Largest pool to measure [default: cpu count]", type=int)
+@click.option("--split-ply", default=2, show_default=True, help="Ply at which the search is split into tasks", type=int)
+def scaling(depth, max_workers, split_ply):
+    """Measures parallel_alpha_beta with 1 to N worker processes on the early fixture"""
+    strategy = engine_stragegies.ParallelAlphaBetaStrategy(split_ply)
+    baseline = None
+    for workers in range(1, (max_workers or worker_pool.size()) + 1):
+        worker_pool.configure(workers)
+        worker_pool.get_pool()
+        market, p1, p2, track = load_fixture("early")
+        timer = timeit.default_timer()
+        strategy.calculate_turn(p1, p2, market, track, depth)
+        needed = timeit.default_timer() - timer
+        baseline = baseline or needed
+        click.echo(f"{workers} workers: {needed:.3f}s, {strategy.nodes} nodes, {strategy.tasks} tasks, "
+                   f"speedup {baseline / needed:.2f}x")
+    worker_pool.close()
+
+
+@cli.command()
+@click.option("--depth", "-d", default=5, show_default=True, help="Depth for movement calculation", type=int)
+@click.option("--fixture", "-f", default="early", show_default=True, type=click.Choice(fixture_names()))
+def memory(depth, fixture):
+    """Compares peak memory of the deepcopy search, which carries the scores of the whole path in every node,
+    with the searches which only keep the principal variation"""
+    reference = DeepcopySearch()
+    tracemalloc.start()
+    reference.calculate_state(reference.root(*load_fixture(fixture)), depth, 0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    click.echo(f"{'deepcopy history':20}: {peak / 1024:9.0f} KiB, {reference.nodes} nodes")
+
+    for strategy in (engine_stragegies.GreedySingleCoreStrategy(), engine_stragegies.AlphaBetaStrategy()):
+        market, p1, p2, track = load_fixture(fixture)
+        tracemalloc.start()
+        strategy.calculate_turn(p1, p2, market, track, depth)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        click.echo(f"{strategy.name:20}: {peak / 1024:9.0f} KiB, {strategy.nodes} nodes")
+
+
+def random_states(count: int, seed: int = 0) -> List[GameState]:
+    """Positions after random turns from the early fixture, stand-ins for search leaves"""
+    rng = random.Random(seed)
+    states = []
+    while len(states) < count:
+        market, p1, p2, track = load_fixture("early")
+        game_state = GameState(p1, p2, market, track)
+        game_state.determine_active_player()
+        for _ in range(rng.randrange(60)):
+            if game_state.game_end():
+                break
+            game_state.apply(rng.choice([turn_action for turn_action in TurnAction if game_state.turn_action_possible(turn_action)]))
+        states.append(game_state)
+    return states
+
+
+@cli.command()
+@click.option("--quilts", default=2000, show_default=True, help="Number of different quilts", type=int)
+@click.option("--repeat", default=5, show_default=True, help="Passes over the quilts with memoized fits", type=int)
+def placements(quilts, repeat):
+    """Measures first fit checks/s of the quilt bitboards, without and with memoized fits"""
+    covered = [state.player.quilt for state in random_states(quilts)]
+    shapes = list(quilt.SHAPES.values())
+
+    timer = timeit.default_timer()
+    fresh = [quilt.Placements(shape) for shape in shapes]
+    found = sum(placement.first_fit(cells) is not None for cells in covered for placement in fresh)
+    needed = timeit.default_timer() - timer
+    checks = len(covered) * len(shapes)
+    click.echo(f"uncached: {checks / needed:.0f} fit checks/s, {found} of {checks} fit")
+
+    timer = timeit.default_timer()
+    for _ in range(repeat):
+        for cells in covered:
+            for placement in fresh:
+                placement.first_fit(cells)
+    needed = timeit.default_timer() - timer
+    click.echo(f"cached:   {repeat * checks / needed:.0f} fit checks/s")
+
+    timer = timeit.default_timer()
+    placed = 0
+    for _ in range(repeat):
+        cells = 0
+        for placement in itertools.cycle(fresh):
+            mask = placement.first_fit(cells)
+            if mask is None:
+                break
+            cells |= mask
+            placed += 1
+    needed = timeit.default_timer() - timer
+    click.echo(f"placing:  {placed / needed:.0f} placements/s")
+
+
+@cli.command()
+@click.argument("snapshots", nargs=-1, required=True, type=click.File("r"))
+@click.option("--padding", default=0, show_default=True, help="Tokens added to every gamedatas, stand-ins for larger tables", type=int)
+@click.option("--repeat", default=20, show_default=True, help="Passes over the snapshots", type=int)
+def ingest(snapshots, padding, repeat):
+    """
+    Measures turning SNAPSHOTS of one game, in move order (e.g. pw.py --snapshot-dir), into engine states: token scans
+    against the TokenIndex and rebuilding every state against GameSync
+    """
+    games = []
+    for snapshot in snapshots:
+        _, game_data = load_snapshot(snapshot)
+        for number in range(padding):
+            game_data['tokens'][f"padding_{number}"] = {"key": f"padding_{number}", "location": "bank", "state": "0"}
+        games.append(game_data)
+    click.echo(f"{len(games)} snapshots of {sum(len(game_data['tokens']) for game_data in games) / len(games):.0f} tokens")
+
+    for name, parse in (("token scans", scan_game_data), ("TokenIndex", parse_game_data)):
+        copies = [copy.deepcopy(game_data) for game_data in games for _ in range(repeat)]
+        timer = timeit.default_timer()
+        for game_data in copies:
+            parse(game_data)
+        click.echo(f"{'parse, ' + name:24}: {(timeit.default_timer() - timer) / len(copies) * 1e6:8.0f} µs per snapshot")
+
+    copies = [copy.deepcopy(game_data) for _ in range(repeat) for game_data in games]
+    timer = timeit.default_timer()
+    for game_data in copies:
+        market, p1, p2, track = init_game(*parse_game_data(game_data))
+        GameState(p1, p2, market, track).determine_active_player()
+    click.echo(f"{'rebuild every state':24}: {(timeit.default_timer() - timer) / len(copies) * 1e6:8.0f} µs per snapshot")
+
+    copies = [copy.deepcopy(game_data) for _ in range(repeat) for game_data in games]
+    sync = GameSync()
+    timer = timeit.default_timer()
+    for game_data in copies:
+        sync.update(game_data)
+    click.echo(f"{'GameSync':24}: {(timeit.default_timer() - timer) / len(copies) * 1e6:8.0f} µs per snapshot, "
+               f"{sync.rebuilds} of {sync.updates} rebuilt")
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_case(strategy: engine_stragegies.EngineStrategy, fixture: str, depth: int, memory: bool) -> Dict:
+    market, p1, p2, track = load_fixture(fixture)
+    timer = timeit.default_timer()
+    result = strategy.calculate_turn(p1, p2, market, track, depth)
+    needed = timeit.default_timer() - timer
+    case = {
+        "fixture": fixture,
+        "strategy": strategy.name,
+        "depth": depth,
+        "seconds": needed,
+        "nodes": strategy.nodes,
+        "nodes_per_second": strategy.nodes / needed if needed else None,
+        "peak_memory_bytes": None,
+        "move": result.history[0]["turn_action"].name,
+    }
+    if memory:
+        # separate run, tracemalloc slows the search down; only allocations of this process are traced
+        market, p1, p2, track = load_fixture(fixture)
+        tracemalloc.start()
+        strategy.calculate_turn(p1, p2, market, track, depth)
+        case["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return case
+
+
+@cli.command()
+@click.option("--strategy", "-s", "strategy_names", multiple=True, help="Strategies to run [default: all]",
+              type=click.Choice(list(engine_stragegies.strategies), case_sensitive=False))
+@click.option("--fixture", "-f", "fixtures", multiple=True, help="Fixtures to run [default: all]", type=click.Choice(fixture_names()))
+@click.option("--depth", "-d", "depths", multiple=True, default=(2, 3, 4), show_default=True, help="Depths to run", type=int)
+@click.option("--memory/--no-memory", default=True, show_default=True, help="Measure peak memory with tracemalloc")
+@click.option("--output", "-o", default="bench_output.json", show_default=True, help="JSON result file", type=click.Path())
+def suite(strategy_names, fixtures, depths, memory, output):
+    """Runs strategies on the position fixtures at several depths"""
+    cases = []
+    for fixture in fixtures or fixture_names():
+        for name in strategy_names or engine_stragegies.strategies:
+            for depth in depths:
+                case = run_case(engine_stragegies.strategies[name.lower()], fixture, depth, memory)
+                cases.append(case)
+                peak = f"{case['peak_memory_bytes'] / 1024:.0f} KiB" if case["peak_memory_bytes"] is not None else "-"
+                click.echo(f"{fixture:8} {case['strategy']:20} depth {depth}: {case['seconds']:8.3f}s "
+                           f"{case['nodes']:9} nodes {case['nodes_per_second'] or 0:9.0f} nodes/s {peak:>10} {case['move']}")
+    worker_pool.close()
+
+    with open(output, "w") as file:
+        json.dump({"revision": _git_revision(), "python": platform.python_version(), "cases": cases}, file, indent=1)
+    click.echo(f"Written to {output}")
+
+
+@cli.command()
+@click.argument("baseline", type=click.Path(exists=True))
+@click.argument("contender", type=click.Path(exists=True))
+def compare(baseline, contender):
+    """Compares two suite outputs of different commits"""
+    def load(path):
+        with open(path) as file:
+            return {(case["fixture"], case["strategy"], case["depth"]): case for case in json.load(file)["cases"]}
+
+    before, after = load(baseline), load(contender)
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        moved = "" if old["move"] == new["move"] else f", move {old['move']} -> {new['move']}"
+        click.echo(f"{key[0]:8} {key[1]:20} depth {key[2]}: {old['seconds']:.3f}s -> {new['seconds']:.3f}s "
+                   f"({old['seconds'] / new['seconds']:.2f}x), nodes {old['nodes']} -> {new['nodes']}{moved}")
+
+
+if __name__ == "__main__":
+    cli()
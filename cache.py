@@ -0,0 +1,99 @@
+from typing import List
+
+import click
+
+import engine_stragegies
+from compact_state import StateCodec
+from components import GameState, TurnAction
+from game_data import parse_game_data, load_snapshot, init_game
+from position_cache import PositionCache, DEFAULT_PATH
+from transposition import TranspositionTable
+
+
+def opening_positions(game_state: GameState, plies: int) -> List[GameState]:
+    """
+    game_state and every distinct position reachable from it in up to plies turns, each with the player to move as
+    player_turn like a position read from the game
+    """
+    codec = StateCodec(game_state)
+    positions = {}
+    frontier = [codec.encode(game_state)]
+    for ply in range(plies + 1):
+        next_frontier = []
+        for state in frontier:
+            if state in positions:
+                continue
+            position = positions[state] = codec.decode(state)
+            if ply == plies or position.game_end():
+                continue
+            for turn_action in TurnAction:
+                if position.turn_action_possible(turn_action):
+                    position.apply(turn_action)
+                    next_frontier.append(codec.encode(position))
+                    position.undo()
+        frontier = next_frontier
+    return list(positions.values())
+
+
+def cache_option(function):
+    return click.option("--cache", "path", default=DEFAULT_PATH, show_default=True, help="Position cache file",
+                        type=click.Path(dir_okay=False))(function)
+
+
+@click.group()
+def cli():
+    """Maintains the persistent position cache of --cache"""
+
+
+@cli.command()
+@click.argument("snapshots", nargs=-1, required=True, type=click.File("r"))
+@cache_option
+@click.option("--cache-size", default=1_000_000, show_default=True, help="Maximum entries of the cache", type=int)
+@click.option("--strategy", "-s", default="alpha_beta", show_default=True, help="Strategy whose results get cached",
+              type=click.Choice([name for name, strategy in engine_stragegies.strategies.items() if strategy.cacheable],
+                                case_sensitive=False))
+@click.option("--depth", "-d", default=5, show_default=True, help="Search depth of every position", type=int)
+@click.option("--plies", default=2, show_default=True, help="Turns after the snapshots to precompute", type=int)
+@click.option("--tt-size", default=64, show_default=True, help="Transposition table size in MB, 0 disables it", type=int)
+def warmup(snapshots, path, cache_size, strategy, depth, plies, tt_size):
+    """
+    Searches the SNAPSHOTS (e.g. game starts recorded by pw.py --snapshot-dir) and every position up to --plies turns
+    after them, so later sessions with the same strategy and depth find them in the cache
+    """
+    engine = engine_stragegies.strategies[strategy.lower()]
+    engine.position_cache = PositionCache(path, cache_size)
+    if tt_size:
+        engine.transposition_table = TranspositionTable(tt_size * 1024 * 1024)
+    for snapshot in snapshots:
+        _, game_data = load_snapshot(snapshot)
+        market, p1, p2, track = init_game(*parse_game_data(game_data))
+        root = GameState(p1, p2, market, track)
+        root.determine_active_player()
+        positions = [position for position in opening_positions(root, plies) if not position.game_end()]
+        click.echo(f"{snapshot.name}: {len(positions)} positions")
+        with click.progressbar(positions) as bar:
+            for position in bar:
+                engine.calculate_turn(position.active_player, position.passive_player, position.market,
+                                      position.time_track, depth)
+    click.echo(engine.position_cache.stats())
+
+
+@cli.command()
+@cache_option
+def info(path):
+    """Prints the number of cached positions per depth"""
+    cache = PositionCache(path)
+    for depth, count in cache.connection.execute("SELECT depth, COUNT(*) FROM positions GROUP BY depth ORDER BY depth"):
+        click.echo(f"depth {depth}: {count}")
+    click.echo(f"{len(cache)} positions")
+
+
+@cli.command()
+@cache_option
+def clear(path):
+    """Removes every cached position"""
+    PositionCache(path).clear()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from typing import Dict, NamedTuple, Tuple
+
+from components import Market, Player, TimeTrack, GameState, PatchTable
+
+
+class CompactState(NamedTuple):
+    """
+    Everything a search node needs, as a flat tuple of ints. Player a is the player with the lower player number.
+    The market is the ring of StateCodec.ring: market_offset is the ring index of the first choice and
+    market_taken a bitmask of the ring indices which are already taken, like Market.offset and Market.removed.
+    special7x7: 0 if nobody owns the 7x7 tile, 1 for player a, 2 for player b
+    active: 0 if player a is to move, 1 for player b
+    a_quilt, b_quilt: covered cells as bitboard, see quilt.py
+    claimed_spots: special spots whose 1x1 patch is taken, like TimeTrack.claimed
+    """
+    a_location: int
+    a_top: int
+    a_buttons: int
+    a_income: int
+    a_empty_spaces: int
+    b_location: int
+    b_top: int
+    b_buttons: int
+    b_income: int
+    b_empty_spaces: int
+    special7x7: int
+    market_offset: int
+    market_taken: int
+    active: int
+    a_quilt: int
+    b_quilt: int
+    claimed_spots: int
+
+
+class StateCodec:
+    """
+    Converts between GameState (ingestion and display) and CompactState (search).
+    Holds the static part of a game: patch table, market ring and player names/colors.
+    """
+
+    def __init__(self, game_state: GameState):
+        self.patch_table: PatchTable = game_state.market.patch_table
+        self.ring: Tuple[int] = game_state.market.ring
+        self.players: Tuple[Dict, Dict] = tuple(
+            {"no": player.player_number, "name": player.player_name, "color": player.color_code}
+            for player in sorted((game_state.active_player, game_state.passive_player), key=lambda p: p.player_number))
+
+    def encode(self, game_state: GameState) -> CompactState:
+        a, b = sorted((game_state.active_player, game_state.passive_player), key=lambda p: p.player_number)
+        market = game_state.market
+        return CompactState(
+            a.location, a.location_top, a.button_count, a.button_production, a.empty_spaces,
+            b.location, b.location_top, b.button_count, b.button_production, b.empty_spaces,
+            1 if a.owns_special7x7 else 2 if b.owns_special7x7 else 0,
+            market.offset,
+            market.removed,
+            0 if game_state.active_player is a else 1,
+            a.quilt,
+            b.quilt,
+            game_state.time_track.claimed,
+        )
+
+    def decode(self, state: CompactState) -> GameState:
+        """The returned state has the player to move as player_turn, owned patches are not part of a CompactState"""
+        a = self.__decode_player(self.players[0], state[0:5], state.special7x7 == 1, state.active == 0, state.a_quilt)
+        b = self.__decode_player(self.players[1], state[5:10], state.special7x7 == 2, state.active == 1, state.b_quilt)
+        return GameState(a, b, Market.from_layout(self.patch_table, self.ring, state.market_offset, state.market_taken),
+                         TimeTrack(state.claimed_spots))
+
+    @staticmethod
+    def __decode_player(meta: Dict, fields: Tuple, owns_special7x7: bool, players_turn: bool, quilt: int) -> Player:
+        location, top, buttons, income, empty_spaces = fields
+        return Player({
+            "no": meta["no"],
+            "name": meta["name"],
+            "color": meta["color"],
+            "players_turn": players_turn,
+            "income": income,
+            "buttons": buttons,
+            "empty_spaces": empty_spaces,
+            "tile_special7x7": owns_special7x7,
+            "owned_patches": [],
+            "time_marker": {"location": location, "top": top},
+            "quilt": quilt,
+        }, {})
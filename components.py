@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-from collections import deque
+import hashlib
 from enum import IntEnum
-from typing import Dict, Set
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 import click
 import numpy as np
 from PIL import ImageColor
 
+import quilt
+
 
 class Patch:
 
@@ -24,6 +26,14 @@ class Patch:
             self.time_cost = int(args[0]['time'])
             self.button_income = int(args[0]['income'])
             self.size = int(args[0]['spaces'])
+        shape = quilt.shape_of(self.button_cost, self.time_cost, self.button_income, self.size)
+        self.shape = quilt.shape_array(shape, self.size)
+        # where the patch goes on a quilt, shared by every patch of the same shape
+        self.placements = quilt.placements(shape, self.size)
+
+    def __deepcopy__(self, memo):
+        # patches never change, copies of a game state share them
+        return self
 
     def __str__(self) -> str:
         return f"Id: {self.id_}, ButtonCost: {self.button_cost}, TimeCost: {self.time_cost}, " \
@@ -38,7 +48,46 @@ class Patch:
         convert.resize(s * 40 for s in convert.size).show()
 
 
+SPECIAL_PATCH_ID = 0
+
+
+def patch_id(patch: Patch) -> int:
+    """patch_1 ... patch_33 map to 1 ... 33, special 1x1 patches to SPECIAL_PATCH_ID"""
+    if patch.id_ in Market.patch_keys:
+        return int(patch.id_.split('_')[1])
+    return SPECIAL_PATCH_ID
+
+
+class PatchTable:
+    """Static patch stats indexed by patch id, built once per game and shared by every copy of the market"""
+
+    def __init__(self, patches: List[Patch]):
+        size = max([patch_id(patch) for patch in patches] + [SPECIAL_PATCH_ID]) + 1
+        self.patches: List[Patch] = [Market.special_patch] * size
+        for patch in patches:
+            self.patches[patch_id(patch)] = patch
+
+        self.button_cost: Tuple[int] = tuple(patch.button_cost for patch in self.patches)
+        self.time_cost: Tuple[int] = tuple(patch.time_cost for patch in self.patches)
+        self.button_income: Tuple[int] = tuple(patch.button_income for patch in self.patches)
+        self.size: Tuple[int] = tuple(patch.size for patch in self.patches)
+
+    def __getitem__(self, id_: int) -> Patch:
+        return self.patches[id_]
+
+    def __len__(self):
+        return len(self.patches)
+
+    def __deepcopy__(self, memo):
+        return self
+
+
 class Market:
+    """
+    The patches around the board as a fixed ring of patch ids. Patches which are still available are linked in ring
+    order by index arrays (next/previous), offset is the ring index of the first choice and removed a bitmask of the
+    ring indices which are taken. Taking one of the three choices and undoing it only relinks one ring index.
+    """
     special_patch = Patch()
 
     patch_keys = {
@@ -50,108 +99,229 @@ class Market:
 
     special_patch_keys = {"patch_0_0", "patch_0_1", "patch_0_2", "patch_0_3", "patch_0_4"}
 
-    def __init__(self, patches, token_position) -> None:
-        self.__deque = deque(maxlen=33)
-        token_position = int(token_position)
-        market_list = [patch for patch in sorted(patches.values(), key=lambda item: int(item['state'])) if patch['location'] == 'market']
-
-        for patch in market_list[token_position:] + market_list[0:token_position]:
-            self.__deque.append(Patch(patch))
+    @property
+    def patch_table(self) -> PatchTable:
+        return self.__table
 
-        self.__choices = [self.__deque.popleft(), self.__deque.popleft(), self.__deque.popleft()]
+    @property
+    def ring(self) -> Tuple[int]:
+        """Patch ids in market order, including taken patches"""
+        return self.__ring
 
-    def take_patch(self, patch_to_take: TurnAction) -> Patch:
-        choice_index = int(patch_to_take)
-        patch = self.__choices[choice_index]
-
-        match patch_to_take:
-            case TurnAction.PATCH_1:
-                self.__choices[0] = self.__choices[1]
-                self.__choices[1] = self.__choices[2]
-                self.__choices[2] = self.__deque.popleft()
-            case TurnAction.PATCH_2:
-                self.__deque.append(self.__choices[0])
-                self.__choices[0] = self.__choices[2]
-                self.__choices[1] = self.__deque.popleft()
-                self.__choices[2] = self.__deque.popleft()
-            case TurnAction.PATCH_3:
-                self.__deque.append(self.__choices[0])
-                self.__deque.append(self.__choices[1])
-                self.__choices[0] = self.__deque.popleft()
-                self.__choices[1] = self.__deque.popleft()
-                self.__choices[2] = self.__deque.popleft()
-            case _:
-                raise ValueError("Other value not allowed")
+    @property
+    def offset(self) -> int:
+        return self.__offset
 
-        return patch
+    @property
+    def removed(self) -> int:
+        return self.__removed
 
-    def get_patch(self, index: int):
-        return self.__choices[index]
+    def __init__(self, patches, token_position) -> None:
+        table = PatchTable([Patch(patch) for patch in patches.values()])
+        market_list = [patch for patch in sorted(patches.values(), key=lambda item: int(item['state'])) if patch['location'] == 'market']
+        ring = tuple(int(patch['key'].split('_')[1]) for patch in market_list)
+        self.__init_ring(table, ring, int(token_position) % len(ring) if ring else 0, 0)
+
+    def __init_ring(self, table: PatchTable, ring: Tuple[int], offset: int, removed: int):
+        self.__table = table
+        self.__patches = table.patches
+        self.__ring = ring
+        self.__positions: Dict[str, int] = {table[id_].id_: index for index, id_ in enumerate(ring)}
+        self.__offset = offset
+        self.__removed = removed
+        available = [index for index in range(len(ring)) if not removed & (1 << index)]
+        self.__size = len(available)
+        self.__next = list(range(len(ring)))
+        self.__previous = list(range(len(ring)))
+        for position, index in enumerate(available):
+            self.__next[index] = available[(position + 1) % len(available)]
+            self.__previous[index] = available[position - 1]
+
+    @classmethod
+    def from_ring(cls, patches: [Patch]) -> Market:
+        """Builds a market whose choices are the first patches of the given order"""
+        return cls.from_layout(PatchTable(patches), tuple(patch_id(patch) for patch in patches), 0, 0)
+
+    @classmethod
+    def from_layout(cls, table: PatchTable, ring: Tuple[int], offset: int, removed: int) -> Market:
+        """Builds a market from the ring of another market, see offset and removed"""
+        market = cls.__new__(cls)
+        market.__init_ring(table, ring, offset, removed)
+        return market
+
+    def __deepcopy__(self, memo):
+        market = Market.__new__(Market)
+        market.__table, market.__patches, market.__ring = self.__table, self.__patches, self.__ring
+        market.__positions = self.__positions
+        market.__offset, market.__removed, market.__size = self.__offset, self.__removed, self.__size
+        market.__next, market.__previous = list(self.__next), list(self.__previous)
+        return market
+
+    def __ring_index(self, choice_index: int) -> int:
+        if not 0 <= choice_index < self.__size:
+            raise IndexError(f"Market has no patch at {choice_index}, {self.__size} patches are left")
+        index = self.__offset
+        next_ = self.__next
+        for _ in range(choice_index):
+            index = next_[index]
+        return index
 
-    def get_patch_choices(self):
-        return self.__choices
+    def take_patch(self, patch_to_take: TurnAction) -> Patch:
+        """
+        The first three patches of the market order are the choices. The order continues behind the taken patch,
+        patches in front of it move to the end. Works the same if less than three patches are left.
+        """
+        if patch_to_take == TurnAction.ADVANCE:
+            raise ValueError("Other value not allowed")
+        index = self.__ring_index(int(patch_to_take))
+        next_, previous = self.__next[index], self.__previous[index]
+        self.__next[previous] = next_
+        self.__previous[next_] = previous
+        self.__removed |= 1 << index
+        self.__size -= 1
+        self.__offset = next_
+        return self.__patches[self.__ring[index]]
+
+    def undo_take_patch(self, taken_action: TurnAction, patch: Patch):
+        """Reverts the last take_patch(taken_action) which returned the given patch"""
+        index = self.__positions[patch.id_]
+        # the taken index kept its links, so it fits back in between its neighbours
+        self.__next[self.__previous[index]] = index
+        self.__previous[self.__next[index]] = index
+        self.__removed &= ~(1 << index)
+        self.__size += 1
+        for _ in range(int(taken_action)):
+            index = self.__previous[index]
+        self.__offset = index
+
+    def get_patch(self, index: int) -> Patch:
+        return self.__patches[self.__ring[self.__ring_index(index)]]
+
+    def first_patch(self) -> Optional[Patch]:
+        """First choice, None if the market is empty"""
+        return self.__patches[self.__ring[self.__offset]] if self.__size else None
+
+    def get_patch_choices(self) -> List[Patch]:
+        patches, ring, next_ = self.__patches, self.__ring, self.__next
+        choices = []
+        index = self.__offset
+        for _ in range(min(3, self.__size)):
+            choices.append(patches[ring[index]])
+            index = next_[index]
+        return choices
+
+    def neighbours(self, index: int) -> (Patch, Patch):
+        """Predecessor and successor of the choice at index in the cyclic market order"""
+        index = self.__ring_index(index)
+        return self.__patches[self.__ring[self.__previous[index]]], self.__patches[self.__ring[self.__next[index]]]
+
+    def get_remaining_patches(self) -> Iterator[Patch]:
+        """Patches behind the three choices, in market order"""
+        index = self.__offset
+        for position in range(self.__size):
+            if position >= 3:
+                yield self.__patches[self.__ring[index]]
+            index = self.__next[index]
 
     def __len__(self):
-        return len(self.__deque) + 3  # len of deque + 3 for the three elements in self.__choices
+        return self.__size
 
 
 class TimeTrack:
+    """
+    The track is static apart from the special spots: the first time marker which passes or lands on one of them
+    takes its 1x1 patch. claimed has bit i set once the patch of _special_spot_locations[i] is taken.
+    """
     _goal_id = 53
     _income_locations = [5, 11, 17, 23, 29, 35, 41, 47, _goal_id]
     _special_spot_locations = [26, 32, 38, 44, 50]
 
-    def get_remaining_income_phases(self, player) -> float:
-        return sum(1 for location in self._income_locations if location > player.location)
+    def __init__(self, claimed: int = 0):
+        self.claimed = claimed
+
+    @staticmethod
+    def count_remaining_income_phases(location: int) -> int:
+        return sum(1 for income_location in TimeTrack._income_locations if income_location > location)
+
+    def get_remaining_income_phases(self, player) -> int:
+        return player.remaining_income_phases
 
-    def take_patch_action(self, active_player: Player, passive_player: Player, patch: Patch) -> (bool, bool):
+    def take_patch_action(self, active_player: Player, passive_player: Player, patch: Patch) -> (int, int):
         """
-        :return: (bool, bool)
-        bool: Player gets income
-        bool: Player receives a special 1x1 patch
+        :return: (int, int)
+        int: Income phases the player passes
+        int: Special 1x1 patches the player takes
         """
-        trigger_income, trigger_special_patch = self.triggers_income_triggers_special_patch(active_player.location, patch.time_cost)
+        income_phases, spots = self.crossings(active_player.location, patch.time_cost)
         active_player.location += patch.time_cost
         active_player.location_top = 1 if active_player.location == passive_player.location else 0
-        return trigger_income, trigger_special_patch
+        return income_phases, self.claim(spots)
 
-    def take_advance_action(self, active_player: Player, passive_player: Player) -> (int, bool, bool):
+    def take_advance_action(self, active_player: Player, passive_player: Player) -> (int, int, int):
         """
-        :return: (int, bool)
-        int: Button count which the player will receive through potentially triggered income phase
-        bool: Player gets income
-        bool: Player receives a special 1x1 patch
+        :return: (int, int, int)
+        int: Button count which the player will receive
+        int: Income phases the player passes
+        int: Special 1x1 patches the player takes
         """
         buttons_to_receive: int = passive_player.location - active_player.location + 1
-        trigger_income, trigger_special_patch = self.triggers_income_triggers_special_patch(active_player.location, buttons_to_receive)
+        income_phases, spots = self.crossings(active_player.location, buttons_to_receive)
         active_player.location = passive_player.location + 1
         active_player.location_top = 0
-        return buttons_to_receive, trigger_income, trigger_special_patch
+        return buttons_to_receive, income_phases, self.claim(spots)
 
-    def triggers_income_triggers_special_patch(self, starting_position: int, steps_to_progress_on_track: int) -> (bool, bool):
-        ending_position = starting_position + steps_to_progress_on_track
+    def claim(self, spots: int) -> int:
+        """Marks the special spots of the bitmask as claimed, :return: Number of them whose patch was still there"""
+        unclaimed = spots & ~self.claimed
+        self.claimed |= spots
+        return unclaimed.bit_count()
 
-        def _triggers(l: [int]):
-            for i in l:
-                if i < starting_position:
-                    continue
-                elif i > ending_position:
-                    return False
-                else:
-                    return True
+    @classmethod
+    def crossings(cls, starting_position: int, steps_to_progress_on_track: int) -> (int, int):
+        """
+        Income locations and special spots which a time marker passes or lands on, the starting position itself
+        does not count. Looked up in tables which are precompiled at import.
+        :return: (income phases, bitmask of the special spots like claimed)
+        """
+        return cls._crossings[min(starting_position, cls._goal_id)][min(steps_to_progress_on_track, cls._goal_id + 1)]
 
-        return _triggers(self._income_locations), _triggers(self._special_spot_locations)
+    @classmethod
+    def count_crossings(cls, starting_position: int, steps_to_progress_on_track: int) -> (int, int):
+        """crossings without the tables"""
+        ending_position = starting_position + steps_to_progress_on_track
+        return sum(1 for location in cls._income_locations if starting_position < location <= ending_position), \
+            sum(1 << spot for spot, location in enumerate(cls._special_spot_locations)
+                if starting_position < location <= ending_position)
 
     def game_end(self, p1: Player, p2: Player):
         return p1.location >= self._goal_id and p2.location >= self._goal_id
 
 
+# Remaining income phases by track position, positions past the goal have none left
+TimeTrack._remaining_income_phases = tuple(TimeTrack.count_remaining_income_phases(location)
+                                           for location in range(TimeTrack._goal_id + 1))
+# Crossings by start position and steps, no more than goal + 1 steps are needed to pass every location
+TimeTrack._crossings = tuple(tuple(TimeTrack.count_crossings(start, steps) for steps in range(TimeTrack._goal_id + 2))
+                             for start in range(TimeTrack._goal_id + 1))
+
+
 class Player:
+    """
+    Remaining income phases and score are counters which the setter of location, take_patch_action and
+    receive_buttons update in O(1). With verify_aggregates every update is cross-checked against a full
+    recalculation.
+    """
+    verify_aggregates = False
 
     @property
     def player_turn(self):
-        # Initial Player turn - do not change
+        # Initial Player turn - do not change during a search
         return self.__player_turn
 
+    def set_player_turn(self, players_turn: bool):
+        """Moves the initial player turn to a new snapshot of the game, see game_sync.py"""
+        self.__player_turn = players_turn
+
     def __init__(self, player_data: Dict, patch_data: Dict):
         self.player_number = int(player_data["no"])
         self.__player_turn = player_data["players_turn"]
@@ -164,8 +334,28 @@ class Player:
 
         self.owned_patches: Set[Patch] = {Patch(patch_data[patch_name]) if patch_name in patch_data else Patch() for patch_name in player_data["owned_patches"]}
 
-        self.location = int(player_data["time_marker"]["location"])
+        # covered cells of the 9x9 quilt as bitboard, see quilt.py
+        self.quilt = player_data["quilt"] if "quilt" in player_data else \
+            quilt.pack([patch.placements for patch in sorted(self.owned_patches, key=patch_id)], quilt.CELLS - self.empty_spaces)
+        self.quilt_hash = Zobrist.quilt(self.player_number, self.quilt)
+
+        self.__location = int(player_data["time_marker"]["location"])
         self.location_top = int(player_data["time_marker"]["top"])
+        self.remaining_income_phases = TimeTrack._remaining_income_phases[min(self.__location, TimeTrack._goal_id)]
+        self.score = self.calculate_score()
+
+    @property
+    def location(self) -> int:
+        return self.__location
+
+    @location.setter
+    def location(self, location: int):
+        remaining_income_phases = TimeTrack._remaining_income_phases[min(location, TimeTrack._goal_id)]
+        self.score += self.button_production * (remaining_income_phases - self.remaining_income_phases)
+        self.remaining_income_phases = remaining_income_phases
+        self.__location = location
+        if self.verify_aggregates:
+            self.check_aggregates()
 
     def __str__(self) -> str:
         return f"{self.player_name}"
@@ -175,39 +365,163 @@ class Player:
                f"ButtonProduction: {self.button_production}, Time: {self.location}, EmptySpaces: {self.empty_spaces}"
 
     def get_current_score(self, track):
+        return self.score
+
+    def calculate_score(self) -> int:
+        """Score recalculated from scratch, see score"""
         return -(self.empty_spaces * 2) \
                + self.button_count \
-               + self.button_production * track.get_remaining_income_phases(self) \
-               + 0 if not self.owns_special7x7 else 7
+               + self.button_production * TimeTrack.count_remaining_income_phases(self.__location) \
+               + (7 if self.owns_special7x7 else 0)
+
+    def check_aggregates(self):
+        remaining_income_phases = TimeTrack.count_remaining_income_phases(self.__location)
+        if self.remaining_income_phases != remaining_income_phases:
+            raise AssertionError(f"{self}: remaining income phases {self.remaining_income_phases}, recalculated {remaining_income_phases}")
+        score = self.calculate_score()
+        if self.score != score:
+            raise AssertionError(f"{self}: score {self.score}, recalculated {score}")
+        quilt_hash = Zobrist.quilt(self.player_number, self.quilt)
+        if self.quilt_hash != quilt_hash:
+            raise AssertionError(f"{self}: quilt hash {self.quilt_hash}, recalculated {quilt_hash}")
 
     def get_player_color(self):
         return ImageColor.getcolor(f"#{self.color_code}", "RGB")
 
-    def __handle_triggers(self, triggers_income: bool, triggers_special_patch: bool):
-        if triggers_income:
-            self.button_count += self.button_production
-        if triggers_special_patch:
+    def __place(self, patch: Patch) -> bool:
+        """Puts the patch on its first fit, :return: False if it does not fit"""
+        mask = patch.placements.first_fit(self.quilt)
+        if mask is None:
+            return False
+        self.quilt |= mask
+        self.quilt_hash ^= Zobrist.quilt(self.player_number, mask)
+        return True
+
+    def can_place_patch(self, patch: Patch) -> bool:
+        return patch.placements.fits(self.quilt)
+
+    def claim_special7x7(self):
+        self.owns_special7x7 = True
+        self.score += 7
+
+    def __handle_triggers(self, income_phases: int, special_patches: int):
+        if income_phases:
+            self.button_count += income_phases * self.button_production
+            self.score += income_phases * self.button_production
+        # a special patch which does not fit on a full quilt is lost
+        placed = sum(1 for _ in range(special_patches) if self.__place(Market.special_patch))
+        if placed:
             self.owned_patches.add(Market.special_patch)
-
-    def __recalculate_empty_spaces(self):
-        self.empty_spaces = 81 - sum([patch.size for patch in self.owned_patches])
-
-    def take_patch_action(self, patch: Patch, triggers_income: bool, triggers_special_patch: bool):
+            self.empty_spaces -= placed * Market.special_patch.size
+            self.score += 2 * placed * Market.special_patch.size
+        if self.verify_aggregates:
+            self.check_aggregates()
+
+    def take_patch_action(self, patch: Patch, income_phases: int, special_patches: int):
+        # empty spaces are counted down instead of summed up over owned_patches, a player decoded from a
+        # CompactState only knows its counters and not which patches it owns
+        if not self.__place(patch):
+            raise ValueError(f"{patch} does not fit on the quilt of {self}")
         self.button_count -= patch.button_cost
         self.button_production += patch.button_income
         self.owned_patches.add(patch)
-        self.__handle_triggers(triggers_income, triggers_special_patch)
-        self.__recalculate_empty_spaces()
+        self.empty_spaces -= patch.size
+        self.score += patch.button_income * self.remaining_income_phases + 2 * patch.size - patch.button_cost
+        self.__handle_triggers(income_phases, special_patches)
 
-    def receive_buttons(self, button_to_receive, triggers_income: bool, triggers_special_patch: bool):
+    def receive_buttons(self, button_to_receive, income_phases: int, special_patches: int):
         self.button_count += button_to_receive
-        self.__handle_triggers(triggers_income, triggers_special_patch)
-        if triggers_special_patch:
-            self.__recalculate_empty_spaces()
+        self.score += button_to_receive
+        self.__handle_triggers(income_phases, special_patches)
 
     def can_afford_patch(self, patch: Patch):
         return self.button_count >= patch.button_cost
 
+    def memento(self) -> tuple:
+        """
+        Captures everything take_patch_action/receive_buttons and the time track mutate, see restore
+        """
+        return self.button_count, self.button_production, self.empty_spaces, self.__location, self.location_top, \
+            Market.special_patch in self.owned_patches, self.remaining_income_phases, self.score, self.quilt, \
+            self.quilt_hash, self.owns_special7x7
+
+    def restore(self, memento: tuple, taken_patch: Optional[Patch] = None):
+        """
+        Reverts the player to a memento
+        :param taken_patch: Patch which was bought after the memento was taken
+        """
+        self.button_count, self.button_production, self.empty_spaces, self.__location, self.location_top, \
+            had_special_patch, self.remaining_income_phases, self.score, self.quilt, self.quilt_hash, \
+            self.owns_special7x7 = memento
+        if taken_patch is not None:
+            self.owned_patches.discard(taken_patch)
+        if not had_special_patch:
+            self.owned_patches.discard(Market.special_patch)
+
+
+class Zobrist:
+    """
+    64-bit keys for the features of a position. Keys are derived from the feature itself,
+    so hashes are stable across processes and sessions.
+    """
+    _keys: Dict[tuple, int] = {}
+    # Hashes of the cells of patch placements, by player number and cells
+    _quilt_keys: Dict[Tuple[int, int], int] = {}
+
+    @classmethod
+    def key(cls, *feature) -> int:
+        key = cls._keys.get(feature)
+        if key is None:
+            key = int.from_bytes(hashlib.blake2b(repr(feature).encode(), digest_size=8).digest(), "little")
+            cls._keys[feature] = key
+        return key
+
+    @classmethod
+    def player(cls, player: Player) -> int:
+        number = player.player_number
+        return cls.key(number, "location", player.location) ^ cls.key(number, "top", player.location_top) \
+            ^ cls.key(number, "buttons", player.button_count) ^ cls.key(number, "income", player.button_production) \
+            ^ cls.key(number, "empty", player.empty_spaces) ^ (cls.key(number, "7x7") if player.owns_special7x7 else 0) \
+            ^ player.quilt_hash
+
+    @classmethod
+    def quilt(cls, number: int, cells: int) -> int:
+        """Hash of covered quilt cells, XOR of one key per cell, so placing a patch only adds the keys of its cells"""
+        hash_ = cls._quilt_keys.get((number, cells))
+        if hash_ is None:
+            hash_ = 0
+            remaining = cells
+            while remaining:
+                cell = remaining & -remaining
+                hash_ ^= cls.key(number, "cell", cell.bit_length() - 1)
+                remaining ^= cell
+            cls._quilt_keys[number, cells] = hash_
+        return hash_
+
+    @classmethod
+    def market_front(cls, market: Market) -> int:
+        patch = market.first_patch()
+        return cls.key("front", patch.id_) if patch is not None else 0
+
+    @classmethod
+    def market(cls, market: Market) -> int:
+        """Hash of the cyclic market order (every patch paired with its successor) and the first choice"""
+        order = list(market.get_patch_choices()) + list(market.get_remaining_patches())
+        hash_ = cls.market_front(market)
+        for index, patch in enumerate(order):
+            hash_ ^= cls.key("next", patch.id_, order[(index + 1) % len(order)].id_)
+        return hash_
+
+    @classmethod
+    def market_take(cls, market: Market, index: int) -> int:
+        """Change of the market order hash when the choice at index gets taken, without the first choice"""
+        patch = market.get_patch(index)
+        if len(market) == 1:
+            return cls.key("next", patch.id_, patch.id_)
+        previous, next_ = market.neighbours(index)
+        return cls.key("next", previous.id_, patch.id_) ^ cls.key("next", patch.id_, next_.id_) \
+            ^ cls.key("next", previous.id_, next_.id_)
+
 
 class TurnAction(IntEnum):
     PATCH_1 = 0,
@@ -246,6 +560,11 @@ class GameState:
     def history(self) -> [(Player, TurnAction, int, int)]:
         return self._history
 
+    @property
+    def hash_key(self) -> int:
+        """Zobrist hash of the position, maintained incrementally by apply/undo"""
+        return self._hash
+
     def __init__(self, p1: Player, p2: Player, market: Market, track: TimeTrack):
         self._active_player: Player
         self._passive_player: Player
@@ -260,21 +579,36 @@ class GameState:
         self._market: Market = market
         self._track: TimeTrack = track
         self._history: [(Player, TurnAction, int, int)] = []
+        self._undo_stack: [tuple] = []
+        # Search nodes only carry what the evaluation needs, the scores along a line are recorded when the
+        # calculated line gets replayed, see EngineStrategy.replay
+        self.record_history = False
+        # Per root action statistics of the engine which calculated this state, e.g. visit counts
+        self.action_stats: Dict[TurnAction, Dict[str, object]] = {}
+        self._hash: int = Zobrist.player(p1) ^ Zobrist.player(p2) ^ Zobrist.market(market) \
+            ^ Zobrist.key("active", self._active_player.player_number) ^ Zobrist.key("claimed", track.claimed)
 
     def __take_patch(self, player: Player, action: TurnAction):
         patch = self._market.take_patch(action)
-        trigger_income, trigger_special_patch = self._track.take_patch_action(self.active_player, self.passive_player, patch)
-        player.take_patch_action(patch, trigger_income, trigger_special_patch)
+        income_phases, special_patches = self._track.take_patch_action(self.active_player, self.passive_player, patch)
+        player.take_patch_action(patch, income_phases, special_patches)
 
     def __advance(self, player: Player):
-        received_button_count, trigger_income, trigger_special_patch = self._track.take_advance_action(self.active_player, self.passive_player)
-        player.receive_buttons(received_button_count, trigger_income, trigger_special_patch)
+        received_button_count, income_phases, special_patches = self._track.take_advance_action(self.active_player, self.passive_player)
+        player.receive_buttons(received_button_count, income_phases, special_patches)
 
     def execute_turn(self, turn_action: TurnAction):
+        player = self.active_player
+        covered = player.quilt
         if turn_action == TurnAction.ADVANCE:
-            self.__advance(self.active_player)
+            self.__advance(player)
         else:
-            self.__take_patch(self.active_player, turn_action)
+            self.__take_patch(player, turn_action)
+        if player.quilt != covered and not player.owns_special7x7 and not self.passive_player.owns_special7x7 \
+                and quilt.completes_bonus_square(player.quilt, player.quilt & ~covered):
+            player.claim_special7x7()
+        if not self.record_history:
+            return
         self._history.append({
             self.active_player.player_number: self.active_player.get_current_score(self._track),
             self.passive_player.player_number: self.passive_player.get_current_score(self._track),
@@ -282,11 +616,65 @@ class GameState:
             "turn_action": turn_action
         })
 
+    def apply(self, turn_action: TurnAction):
+        """
+        Executes the turn and determines the next active player in place. Every apply can be reverted with undo,
+        which lets the search walk the tree on a single state instead of copying it for every child.
+        """
+        active_player = self._active_player
+        memento = active_player.memento()
+        claimed = self._track.claimed
+        previous_hash = self._hash
+        new_hash = previous_hash ^ Zobrist.player(active_player)
+
+        patch = None
+        if turn_action != TurnAction.ADVANCE:
+            patch = self._market.get_patch(int(turn_action))
+            new_hash ^= Zobrist.market_take(self._market, int(turn_action)) ^ Zobrist.market_front(self._market)
+
+        self.execute_turn(turn_action)
+
+        new_hash ^= Zobrist.player(active_player)
+        if patch is not None:
+            new_hash ^= Zobrist.market_front(self._market)
+        if self._track.claimed != claimed:
+            new_hash ^= Zobrist.key("claimed", claimed) ^ Zobrist.key("claimed", self._track.claimed)
+        self._hash = new_hash
+        self.determine_active_player()
+        self._undo_stack.append((turn_action, active_player, memento, claimed, patch, previous_hash, self.record_history))
+
+    def undo(self):
+        """Reverts the last apply"""
+        turn_action, active_player, memento, self._track.claimed, patch, self._hash, recorded = self._undo_stack.pop()
+        if self._active_player is not active_player:
+            self._passive_player = self._active_player
+            self._active_player = active_player
+        if recorded:
+            self._history.pop()
+        if patch is not None:
+            self._market.undo_take_patch(turn_action, patch)
+        active_player.restore(memento, patch)
+
+    @property
+    def ply(self) -> int:
+        """Number of applied turns which can be undone"""
+        return len(self._undo_stack)
+
+    def rewind(self, ply: int):
+        """Undoes applied turns until only ply of them are left, e.g. after a search got interrupted"""
+        while len(self._undo_stack) > ply:
+            self.undo()
+
+    def clear_undo(self):
+        """The current position becomes ply 0, the applied turns can no longer be undone"""
+        self._undo_stack.clear()
+
     def determine_active_player(self):
         if self.active_player.location - self.active_player.location_top > self.passive_player.location - self.passive_player.location_top:
             temp = self._active_player
             self._active_player = self.passive_player
             self._passive_player = temp
+            self._hash ^= Zobrist.key("active", temp.player_number) ^ Zobrist.key("active", self._active_player.player_number)
 
     def turn_action_possible(self, turn_action):
         match turn_action:
@@ -297,7 +685,7 @@ class GameState:
                 if not len(self._market) >= patch_index + 1:
                     return False
                 patch: Patch = self._market.get_patch(patch_index)
-                return self.active_player.can_afford_patch(patch)
+                return self.active_player.can_afford_patch(patch) and self.active_player.can_place_patch(patch)
             case _:
                 raise NotImplementedError(f"{turn_action} not yet implemented")
 
@@ -331,6 +719,12 @@ class GameState:
             click.echo(f"{player_name}'s turn: {item['turn_action'].name} ({self.player.player_name}: "
                        f"{item[self.player.player_number]}, {self.opponent.player_name}: {item[self.opponent.player_number]})")
 
+        if self.action_stats:
+            click.echo()
+            click.echo("Root actions:")
+            for turn_action, stats in self.action_stats.items():
+                click.echo(f"{turn_action.name}: " + ", ".join(f"{key}: {value}" for key, value in stats.items()))
+
         click.echo()
 
     def game_end(self):
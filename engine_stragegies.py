@@ -1,107 +1,1115 @@
 import copy
+import math
+import queue
+import random
+import threading
+import timeit
 from abc import ABC, abstractmethod
 from multiprocessing import Pool
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
-from components import Player, Market, TimeTrack, GameState, TurnAction
+import worker_pool
+from compact_state import StateCodec, CompactState
+from components import Player, Market, TimeTrack, GameState, TurnAction, Zobrist
+from position_cache import PositionCache
+from search_stats import SearchStats, InstrumentedGameState
+from transposition import TranspositionTable, Bound
+
+INFINITY = 1_000_000
+# Every turn moves a time marker, so no game lasts longer than this
+UNLIMITED_DEPTH = 128
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchUpdate(NamedTuple):
+    """Best line of analyze_turn so far"""
+    line: List[TurnAction]
+    # Score of the maximized player minus the score of the opponent at the end of the line
+    margin: int
+    depth: int
+    nodes: int
+    seconds: float
+    # The result of calculate_turn, None for the update of a completed iteration
+    result: Optional[GameState] = None
 
 
 class EngineStrategy(ABC):
+    # Sum of both players' distances to the goal at which calculate_turn solves the rest of the game exactly, 0 disables it.
+    # Solving takes up to 0.2s at 16, 0.9s at 20 and 5s at 26 with plenty of buttons on both sides.
+    endgame_distance = 16
+    # Methods which score positions, timed as evaluation while stats are collected
+    evaluation_methods: Tuple[str, ...] = ("evaluate",)
+    # Whether results go to the position cache, results of randomized searches are not worth keeping
+    cacheable = True
+
+    def __init__(self):
+        # Nodes (applied turns) visited by the last calculate_turn in this process
+        self.nodes = 0
+        # Deepest completed iteration of the last calculate_turn
+        self.depth_reached = 0
+        # Set when the last search cut off a line before the game ended
+        self.depth_limited = False
+        self.transposition_table: Optional[TranspositionTable] = None
+        self._deadline: Optional[float] = None
+        # Set when the last calculate_turn solved the endgame instead of searching
+        self.endgame_solved = False
+        self.stats: Optional[SearchStats] = None
+        self._cancelled = False
+        self.position_cache: Optional[PositionCache] = None
+        # Set when the last calculate_turn was answered by the position cache
+        self.cache_hit = False
+        # Called with the root state, the depth and the line of every completed iteration of iterate
+        self.on_iteration: Optional[Callable[[GameState, int, List[TurnAction]], None]] = None
+        # Number of the search on the worker pool this strategy or pool task belongs to, see worker_pool.new_search
+        self._pool_search = 0
 
     @property
     @abstractmethod
     def name(self) -> str:
         pass
 
-    @abstractmethod
-    def calculate_turn(self, player1: Player, player2: Player, patches: Market, track: TimeTrack, max_depth: int) -> GameState:
-        pass
+    def calculate_turn(self, player1: Player, player2: Player, patches: Market, track: TimeTrack, max_depth: int,
+                       time_budget: Optional[float] = None) -> GameState:
+        """
+        Takes the turn from the position cache if it holds the position at least max_depth deep, otherwise solves the
+        endgame or searches with search_turn and caches the result
+        :param max_depth: Depth to search, the maximum depth if there is a time_budget
+        :param time_budget: Seconds after which the deepest completed iteration is returned
+        """
+        self.nodes = 0
+        self._pool_search = 0
+        game_state = self.root_state(player1, player2, patches, track)
+        result = self.cached_turn(game_state, max_depth)
+        if result is not None:
+            return result
+        result = self.solve_endgame(game_state, time_budget)
+        if result is None:
+            try:
+                result = self.search_turn(game_state, max_depth, time_budget)
+            except SearchTimeout:
+                # a search cancelled before its first iteration completed leaves the players and the market as it found them
+                game_state.rewind(0)
+                raise
+        self.cache_turn(game_state, result)
+        return result
 
-    @abstractmethod
-    def calculate_state(self, game_state: GameState, max_depth, current_depth) -> GameState:
-        pass
+    def analyze_turn(self, player1: Player, player2: Player, patches: Market, track: TimeTrack, max_depth: int,
+                     time_budget: Optional[float] = None) -> Iterator[SearchUpdate]:
+        """
+        Anytime calculate_turn: searches in a background thread and yields the line of every completed iteration,
+        the last update carries the result. cancel (e.g. from a key press) ends the search with the deepest completed
+        iteration as result, closing the generator stops the search without result. Nothing is yielded after a
+        cancel before the first iteration completed.
+        """
+        updates = queue.Queue()
+        start = timeit.default_timer()
+
+        def report(game_state: GameState, depth: int, line: List[TurnAction]):
+            updates.put(SearchUpdate(list(line), self.line_margin(game_state, line), depth, self.nodes,
+                                     timeit.default_timer() - start))
+
+        def search():
+            try:
+                result = self.calculate_turn(player1, player2, patches, track, max_depth, time_budget)
+                player, opponent = result.player.player_number, result.opponent.player_number
+                updates.put(SearchUpdate([step["turn_action"] for step in result.history],
+                                         result.history[-1][player] - result.history[-1][opponent] if result.history else 0,
+                                         self.depth_reached, self.nodes, timeit.default_timer() - start, result))
+            except SearchTimeout:
+                pass
+            except Exception as error:
+                updates.put(error)
+            finally:
+                updates.put(None)
+
+        self._cancelled = False
+        self.on_iteration = report
+        thread = threading.Thread(target=search, name="analysis", daemon=True)
+        thread.start()
+        try:
+            while (update := updates.get()) is not None:
+                if isinstance(update, Exception):
+                    raise update
+                yield update
+        finally:
+            self.cancel()
+            thread.join()
+            self.on_iteration = None
+            self._cancelled = False
 
     @staticmethod
+    def line_margin(game_state: GameState, line: List[TurnAction]) -> int:
+        """Score margin of the maximized player after playing line from game_state, which is left unchanged"""
+        root_ply = game_state.ply
+        for turn_action in line:
+            game_state.apply(turn_action)
+        track = game_state.time_track
+        margin = game_state.player.get_current_score(track) - game_state.opponent.get_current_score(track)
+        game_state.rewind(root_ply)
+        return margin
+
     @abstractmethod
-    def choose_winner(player: Player, opponent: Player, current_best: GameState, candidate: GameState):
+    def search_turn(self, game_state: GameState, max_depth: int, time_budget: Optional[float]) -> GameState:
+        """
+        Searches in place on the root state of calculate_turn
+        :return: The best line replayed on a copy of game_state
+        """
         pass
 
+    def collect_stats(self, enabled: bool):
+        """
+        Instruments the following searches: nodes per ply, action checks, time in apply/undo, evaluation and copies.
+        Without stats the search runs on a plain GameState and is not slowed down.
+        """
+        for name in self.evaluation_methods:
+            self.__dict__.pop(name, None)
+        self.stats = SearchStats() if enabled else None
+        if enabled:
+            for name in self.evaluation_methods:
+                setattr(self, name, self.stats.timed("evaluate", getattr(self, name)))
+
+    def __getstate__(self):
+        """Worker processes get the strategy without instrumentation"""
+        state = dict(self.__dict__)
+        for name in self.evaluation_methods:
+            state.pop(name, None)
+        state["stats"] = None
+        state["on_iteration"] = None
+        return state
+
+    def root_state(self, player1: Player, player2: Player, patches: Market, track: TimeTrack) -> GameState:
+        if self.stats is None:
+            game_state = GameState(player1, player2, patches, track)
+        else:
+            self.stats.reset()
+            self.stats.start_table(self.transposition_table)
+            game_state = InstrumentedGameState(player1, player2, patches, track, self.stats)
+        game_state.determine_active_player()
+        return game_state
+
+    def copy_state(self, game_state: GameState) -> GameState:
+        if self.stats is None:
+            return copy.deepcopy(game_state)
+        start = timeit.default_timer()
+        copied = copy.deepcopy(game_state)
+        self.stats.add_time("copy", timeit.default_timer() - start)
+        return copied
+
+    @staticmethod
+    def evaluate(game_state: GameState) -> int:
+        """Score difference from the view of the player to move"""
+        track = game_state.time_track
+        return game_state.active_player.get_current_score(track) - game_state.passive_player.get_current_score(track)
+
+    def cancel(self):
+        """
+        Stops a running search from another thread, it raises SearchTimeout or returns its deepest completed iteration.
+        Its tasks on the worker pool stop as well.
+        """
+        self._cancelled = True
+        if self._pool_search:
+            worker_pool.cancel_search(self._pool_search)
+
+    def stopped(self) -> bool:
+        """Whether the search got cancelled, in a pool task by the process which started the search"""
+        return self._cancelled or (self._pool_search != 0 and worker_pool.search_cancelled(self._pool_search))
+
+    def _start_pool_search(self):
+        """Numbers the search before its tasks go to the worker pool, so cancel reaches them"""
+        self._pool_search = worker_pool.new_search()
+        if self._cancelled:
+            worker_pool.cancel_search(self._pool_search)
+
+    def _count_node(self):
+        self.nodes += 1
+        if not self.nodes & 255 and (self.stopped() or (self._deadline is not None and timeit.default_timer() >= self._deadline)):
+            raise SearchTimeout()
+
+    def iterate(self, game_state: GameState, search: Callable[[int], List[TurnAction]], max_depth: int,
+                time_budget: Optional[float]) -> List[TurnAction]:
+        """
+        Iterative deepening: runs search with depth 1, 2, ... up to max_depth, until the time budget is used up or the
+        search reached the end of the game. The first iteration always completes.
+        :return: Line of the deepest completed iteration
+        """
+        deadline = None if time_budget is None else timeit.default_timer() + time_budget
+        root_ply = game_state.ply
+        line = None
+        for depth in range(min(1, max_depth), max_depth + 1):
+            self._deadline = deadline if line is not None else None
+            self.depth_limited = False
+            try:
+                line = search(depth)
+            except SearchTimeout:
+                game_state.rewind(root_ply)
+                if line is None:
+                    # only a cancelled search stops during the first iteration
+                    raise
+                break
+            self.depth_reached = depth
+            if self.on_iteration is not None:
+                self.on_iteration(game_state, depth, line)
+            if not self.depth_limited or self._cancelled or (deadline is not None and timeit.default_timer() >= deadline):
+                break
+        self._deadline = None
+        return line
+
+    @staticmethod
+    def remaining_distance(game_state: GameState) -> int:
+        goal = TimeTrack._goal_id
+        return max(goal - game_state.active_player.location, 0) + max(goal - game_state.passive_player.location, 0)
+
+    def solve_endgame(self, game_state: GameState, time_budget: Optional[float] = None) -> Optional[GameState]:
+        """
+        Solves the game to TimeTrack.game_end if it is within endgame_distance: alpha-beta on the final score difference
+        without depth limit, memoized with bounds on the CompactState of every position. Every root action is solved
+        with a full window, so its margin is exact.
+        :param time_budget: The solver takes at most half of it, so a search still has time if the solver gives up
+        :return: Best line with the proven final score margin of every root action in action_stats,
+        None if the game is not close enough to the end or the time ran out
+        """
+        self.endgame_solved = False
+        if not self.endgame_distance or game_state.game_end() or self.remaining_distance(game_state) > self.endgame_distance:
+            return None
+
+        codec = StateCodec(game_state)
+        memo: Dict[CompactState, Tuple[int, Optional[TurnAction], Bound]] = {}
+        root_ply = game_state.ply
+        mover = game_state.active_player
+        margins: Dict[TurnAction, int] = {}
+        line = []
+        self._deadline = None if time_budget is None else timeit.default_timer() + time_budget / 2
+        try:
+            for turn_action in TurnAction:
+                if not game_state.turn_action_possible(turn_action):
+                    continue
+                game_state.apply(turn_action)
+                self._count_node()
+                value = self.__solve(game_state, codec, memo, -INFINITY, INFINITY)
+                margins[turn_action] = value if game_state.active_player is mover else -value
+                game_state.undo()
+
+            # a full window search leaves an exact entry with the best action at every position of the line
+            line.append(max(margins, key=margins.get))
+            game_state.apply(line[0])
+            while not game_state.game_end():
+                self.__solve(game_state, codec, memo, -INFINITY, INFINITY)
+                line.append(memo[codec.encode(game_state)][1])
+                game_state.apply(line[-1])
+        except SearchTimeout:
+            return None
+        finally:
+            game_state.rewind(root_ply)
+            self._deadline = None
+
+        self.depth_reached = len(line)
+        self.depth_limited = False
+        self.endgame_solved = True
+        result = self.replay(game_state, line)
+        result.action_stats = {turn_action: {"proven margin": margin} for turn_action, margin in margins.items()}
+        return result
+
+    def __solve(self, game_state: GameState, codec: StateCodec, memo: Dict[CompactState, Tuple[int, Optional[TurnAction], Bound]],
+                alpha: int, beta: int) -> int:
+        """
+        :return: Final score difference for the player to move with perfect play of both players, a lower bound if it
+        is at least beta, an upper bound if it is at most alpha
+        """
+        if game_state.game_end():
+            return self.evaluate(game_state)
+        state = codec.encode(game_state)
+        solved = memo.get(state)
+        memo_action = None
+        if solved is not None:
+            value, memo_action, bound = solved
+            if bound == Bound.EXACT or (bound == Bound.LOWER and value >= beta) or (bound == Bound.UPPER and value <= alpha):
+                return value
+
+        original_alpha = alpha
+        mover = game_state.active_player
+        best_value, best_action = -INFINITY, None
+        actions = list(TurnAction)
+        if memo_action is not None:
+            actions.remove(memo_action)
+            actions.insert(0, memo_action)
+        for turn_action in actions:
+            if not game_state.turn_action_possible(turn_action):
+                continue
+            game_state.apply(turn_action)
+            self._count_node()
+            if game_state.active_player is mover:
+                value = self.__solve(game_state, codec, memo, alpha, beta)
+            else:
+                value = -self.__solve(game_state, codec, memo, -beta, -alpha)
+            game_state.undo()
+            if value > best_value:
+                best_value, best_action = value, turn_action
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        bound = Bound.UPPER if best_value <= original_alpha else Bound.LOWER if best_value >= beta else Bound.EXACT
+        memo[state] = best_value, best_action, bound
+        return best_value
+
+    def cache_key(self, game_state: GameState) -> int:
+        """Results depend on the strategy and the player whose score it maximizes"""
+        return game_state.hash_key ^ Zobrist.key("cache", self.name, game_state.player.player_number)
+
+    def cached_turn(self, game_state: GameState, max_depth: int) -> Optional[GameState]:
+        """
+        :return: Cached line of a search at least max_depth deep, walked from the best actions stored for the positions
+        along it, None if the position is not cached that deep
+        """
+        self.cache_hit = False
+        cache = self.position_cache
+        if cache is None or not self.cacheable:
+            return None
+        entry = cache.probe(self.cache_key(game_state), max_depth)
+        if entry is None or entry.best_action is None:
+            return None
+
+        root_ply = game_state.ply
+        line = []
+        next_entry = entry
+        while next_entry is not None and next_entry.best_action is not None and not game_state.game_end() \
+                and game_state.turn_action_possible(next_entry.best_action):
+            line.append(next_entry.best_action)
+            game_state.apply(next_entry.best_action)
+            next_entry = cache.lookup(self.cache_key(game_state))
+        game_state.rewind(root_ply)
+
+        self.cache_hit = True
+        self.depth_reached = len(line) if entry.depth == UNLIMITED_DEPTH else entry.depth
+        self.depth_limited = entry.depth != UNLIMITED_DEPTH
+        result = self.replay(game_state, line)
+        result.action_stats = {line[0]: {"cached depth": entry.depth, "margin": entry.value}}
+        return result
+
+    def cache_turn(self, game_state: GameState, result: GameState):
+        """
+        Stores every position of the calculated line with its best action and the final margin of the line for the
+        maximized player. Lines which reached the end of the game are stored with UNLIMITED_DEPTH.
+        """
+        cache = self.position_cache
+        if cache is None or not self.cacheable or not result.history:
+            return
+        player, opponent = game_state.player.player_number, game_state.opponent.player_number
+        value = result.history[-1][player] - result.history[-1][opponent]
+        root_ply = game_state.ply
+        entries = []
+        for ply, step in enumerate(result.history):
+            depth = max(self.depth_reached - ply, 0) if self.depth_limited else UNLIMITED_DEPTH
+            entries.append((self.cache_key(game_state), depth, value, step["turn_action"], Bound.EXACT))
+            game_state.apply(step["turn_action"])
+        game_state.rewind(root_ply)
+        cache.store_many(entries)
+
+    def replay(self, game_state: GameState, line: List[TurnAction]) -> GameState:
+        """
+        Applies the calculated line to a copy of the root state, so the returned state carries the history of the best
+        path with the scores after every turn
+        """
+        result = self.copy_state(game_state)
+        result.record_history = True
+        for turn_action in line:
+            result.apply(turn_action)
+        return result
+
 
 class GreedySingleCoreStrategy(EngineStrategy):
+    evaluation_methods = ("evaluate", "outcome")
 
     @property
     def name(self) -> str:
         return "greedy_single_core"
 
-    def calculate_turn(self, player1: Player, player2: Player, patches: Market, track: TimeTrack, max_depth: int) -> GameState:
-        game_state = GameState(player1, player2, patches, track)
-        return self.calculate_state(game_state, max_depth, 0)
+    def search_turn(self, game_state: GameState, max_depth: int, time_budget: Optional[float]) -> GameState:
+        # iterations only pay off if the search may stop early or somebody follows them, see analyze_turn
+        if time_budget is None and self.on_iteration is None:
+            self.depth_reached = max_depth
+            return self.replay(game_state, self.search(game_state, max_depth))
+        return self.replay(game_state, self.iterate(
+            game_state, lambda depth: self.search(game_state, depth), max_depth, time_budget))
 
-    def calculate_state(self, game_state: GameState, max_depth, current_depth) -> GameState:
-        best: Optional[GameState] = None
-        game_state.determine_active_player()
+    def search(self, game_state: GameState, max_depth: int) -> List[TurnAction]:
+        return self.complete_line(game_state, self.calculate_state(game_state, max_depth, 0)[1], max_depth, 0)
+
+    def complete_line(self, game_state: GameState, line: List[TurnAction], max_depth: int, current_depth: int) -> List[TurnAction]:
+        """
+        A line ends early where the search returned a transposition table entry, the rest of it is walked from
+        the best actions stored in the table
+        """
+        table = self.transposition_table
+        if table is None:
+            return line
+
+        root_ply = game_state.ply
+        player_number = game_state.player.player_number
+        line = list(line)
+        for turn_action in line:
+            game_state.apply(turn_action)
+        depth = current_depth + len(line)
+        while depth <= max_depth and not game_state.game_end():
+            turn_action = table.best_action(game_state.hash_key ^ Zobrist.key("greedy", player_number, max_depth - depth))
+            if turn_action is None or not game_state.turn_action_possible(turn_action):
+                break
+            game_state.apply(turn_action)
+            line.append(turn_action)
+            depth += 1
+        game_state.rewind(root_ply)
+        return line
+
+    def calculate_state(self, game_state: GameState, max_depth, current_depth) -> Optional[Tuple[Dict[int, int], List[TurnAction]]]:
+        """
+        Searches in place on game_state, every applied turn is undone before returning
+        :return: Scores by player number at the end of the best path and the turns of the path from game_state, the
+        path ends after the first turn if it was taken from the transposition table (see complete_line)
+        """
+        best: Optional[Tuple[Dict[int, int], List[TurnAction]]] = None
+        player, opponent = game_state.player, game_state.opponent
+
+        # The best path below a node only depends on the position, the remaining depth and whose score is maximized.
+        # Entries hold the scores of player and opponent at the end of the best path and its first turn.
+        table = self.transposition_table
+        if table is not None:
+            key = game_state.hash_key ^ Zobrist.key("greedy", player.player_number, max_depth - current_depth)
+            entry = table.probe(key, 0)
+            if entry is not None:
+                self.depth_limited = True
+                player_score, opponent_score = entry.value
+                return {player.player_number: player_score, opponent.player_number: opponent_score}, [entry.best_action]
 
         for turn_action in TurnAction:
             if not game_state.turn_action_possible(turn_action):
                 continue
 
-            game_state_copy = copy.deepcopy(game_state)
-            game_state_copy.execute_turn(turn_action)
+            game_state.apply(turn_action)
+            self._count_node()
 
-            if not game_state_copy.game_end() and current_depth < max_depth:
-                contender = self.calculate_state(game_state_copy, max_depth, current_depth + 1)
-                best = self.choose_winner(game_state.player, game_state.opponent, best, contender)
+            if not game_state.game_end() and current_depth < max_depth:
+                candidate = self.calculate_state(game_state, max_depth, current_depth + 1)
             else:
-                best = self.choose_winner(game_state.player, game_state.opponent, best, game_state_copy)
+                self.depth_limited |= not game_state.game_end()
+                candidate = self.outcome(game_state), []
+            if self.choose_winner(player, opponent, best, candidate) is candidate:
+                best = candidate[0], [turn_action] + candidate[1]
+
+            game_state.undo()
+
+        if table is not None:
+            table.store(key, max_depth - current_depth, (best[0][player.player_number], best[0][opponent.player_number]), best[1][0])
 
         return best
 
     @staticmethod
-    def choose_winner(player: Player, opponent, current_best: GameState, candidate: GameState):
+    def outcome(game_state: GameState) -> Dict[int, int]:
+        track = game_state.time_track
+        return {game_state.active_player.player_number: game_state.active_player.get_current_score(track),
+                game_state.passive_player.player_number: game_state.passive_player.get_current_score(track)}
+
+    @staticmethod
+    def choose_winner(player: Player, opponent, current_best: Optional[Tuple[Dict[int, int], List[TurnAction]]],
+                      candidate: Tuple[Dict[int, int], List[TurnAction]]):
         if not current_best:
             return candidate
 
-        current_outcome = current_best.history[-1]
-        candidate_outcome = candidate.history[-1]
+        current_outcome = current_best[0]
+        candidate_outcome = candidate[0]
 
         return candidate if candidate_outcome[player.player_number] > candidate_outcome[opponent.player_number] \
                             and candidate_outcome[player.player_number] > current_outcome[player.player_number] else current_best
 
 
 class GreedyFourCoreStrategy(GreedySingleCoreStrategy):
+    """
+    Expands the first split_ply turns in this process and searches every distinct position at that ply as a task on
+    the long-lived worker pool, like ParallelAlphaBetaStrategy. Every worker keeps its own transposition table across
+    tasks and turns. The lines of the tasks are combined with choose_winner over the expanded turns, so the result is
+    the line of greedy_single_core.
+    """
+
+    def __init__(self, split_ply: int = 2):
+        super().__init__()
+        self.split_ply = split_ply
+        self.tasks = 0
 
     @property
     def name(self) -> str:
         return "greedy_four_core"
 
-    def calculate_turn(self, player1: Player, player2: Player, patches: Market, track: TimeTrack, max_depth: int) -> GameState:
-        pool = Pool(4)
-        game_state = GameState(player1, player2, patches, track)
+    def search_turn(self, game_state: GameState, max_depth: int, time_budget: Optional[float]) -> GameState:
+        codec = StateCodec(game_state)
+        pool = worker_pool.get_pool()
+        self._start_pool_search()
+        if time_budget is None and self.on_iteration is None:
+            self.depth_reached = max_depth
+            return self.replay(game_state, self.calculate_root(pool, codec, game_state, max_depth))
+        return self.replay(game_state, self.iterate(
+            game_state, lambda depth: self.calculate_root(pool, codec, game_state, depth), max_depth, time_budget))
+
+    def calculate_root(self, pool: Pool, codec: StateCodec, game_state: GameState, max_depth: int) -> List[TurnAction]:
+        split_ply = min(self.split_ply, max_depth)
+        tasks: Dict[CompactState, int] = {}
+        tree = self.__expand(game_state, codec, split_ply, 0, tasks)
 
-        args = []
+        payloads = [(codec, state, max_depth, split_ply, game_state.player.player_number, self._deadline, self._pool_search)
+                    for state in tasks]
+        results = pool.starmap(_greedy_subtree, payloads, chunksize=1)
+        if any(result is None for result in results):
+            raise SearchTimeout()
+        for _, nodes, depth_limited in results:
+            self.nodes += nodes
+            self.depth_limited |= depth_limited
+        self.tasks = len(payloads)
+
+        return self.__combine(game_state.player, game_state.opponent, tree, results)[1]
+
+    def __expand(self, game_state: GameState, codec: StateCodec, split_ply: int, current_depth: int,
+                 tasks: Dict[CompactState, int]) -> Tuple:
+        """
+        :return: ("outcome", scores) for finished games, ("task", index) at the split ply, otherwise
+        ("node", [(turn_action, child)])
+        """
+        if current_depth == split_ply:
+            return "task", tasks.setdefault(codec.encode(game_state), len(tasks))
+
+        children = []
         for turn_action in TurnAction:
             if not game_state.turn_action_possible(turn_action):
                 continue
+            game_state.apply(turn_action)
+            self._count_node()
+            if game_state.game_end():
+                children.append((turn_action, ("outcome", self.outcome(game_state))))
+            else:
+                children.append((turn_action, self.__expand(game_state, codec, split_ply, current_depth + 1, tasks)))
+            game_state.undo()
+        return "node", children
+
+    def __combine(self, player: Player, opponent: Player, tree: Tuple,
+                  results: List[Tuple]) -> Tuple[Dict[int, int], List[TurnAction]]:
+        kind, content = tree
+        if kind == "outcome":
+            return content, []
+        if kind == "task":
+            return results[content][0]
+
+        best = None
+        for turn_action, child in content:
+            candidate = self.__combine(player, opponent, child, results)
+            if self.choose_winner(player, opponent, best, candidate) is candidate:
+                best = candidate[0], [turn_action] + candidate[1]
+        return best
+
+
+class AlphaBetaStrategy(EngineStrategy):
+    """
+    Negamax with alpha-beta pruning on the score difference of the player to move. A player can move several times
+    in a row, so the value is only negated when the player to move changes.
+    Like the greedy strategies, max_depth + 1 turns are searched.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.killers: List[List[TurnAction]] = []
+        self.cutoffs = 0
+        self.principal_variation: List[TurnAction] = []
+
+    @property
+    def name(self) -> str:
+        return "alpha_beta"
+
+    def search_turn(self, game_state: GameState, max_depth: int, time_budget: Optional[float]) -> GameState:
+        self.cutoffs = 0
+        self.killers = [[] for _ in range(max_depth + 2)]
+        self.principal_variation = []
+        return self.replay(game_state, self.iterate(game_state, lambda depth: self.search(game_state, depth), max_depth, time_budget))
+
+    def search(self, game_state: GameState, depth: int) -> List[TurnAction]:
+        _, line = self.negamax(game_state, depth + 1, 0, -INFINITY, INFINITY, True)
+        self.principal_variation = self.complete_line(game_state, line, depth + 1)
+        return self.principal_variation
+
+    def complete_line(self, game_state: GameState, line: List[TurnAction], plies: int) -> List[TurnAction]:
+        """
+        A line ends early where the search returned a transposition table entry, the rest of it is walked from
+        the best actions stored in the table
+        """
+        table = self.transposition_table
+        if table is None or len(line) >= plies:
+            return line
+
+        root_ply = game_state.ply
+        line = list(line)
+        for turn_action in line:
+            game_state.apply(turn_action)
+        while len(line) < plies and not game_state.game_end():
+            turn_action = table.best_action(game_state.hash_key)
+            if turn_action is None or not game_state.turn_action_possible(turn_action):
+                break
+            game_state.apply(turn_action)
+            line.append(turn_action)
+        game_state.rewind(root_ply)
+        return line
+
+    def negamax(self, game_state: GameState, depth: int, ply: int, alpha: int, beta: int,
+                on_principal_variation: bool = False) -> Tuple[int, List[TurnAction]]:
+        """
+        :param on_principal_variation: Node lies on the principal variation of the previous iteration
+        :return: Value for the player to move and the principal variation
+        """
+        if game_state.game_end():
+            return self.evaluate(game_state), []
+        if depth == 0:
+            self.depth_limited = True
+            return self.evaluate(game_state), []
+
+        table = self.transposition_table
+        table_action = None
+        original_alpha = alpha
+        if table is not None:
+            entry = table.probe(game_state.hash_key, depth)
+            if entry is not None and ply > 0:
+                self.depth_limited = True
+                if entry.bound == Bound.EXACT:
+                    return entry.value, [entry.best_action]
+                elif entry.bound == Bound.LOWER:
+                    alpha = max(alpha, entry.value)
+                else:
+                    beta = min(beta, entry.value)
+                if alpha >= beta:
+                    return entry.value, [entry.best_action]
+            table_action = table.best_action(game_state.hash_key)
+
+        principal_action = None
+        if on_principal_variation and ply < len(self.principal_variation):
+            principal_action = self.principal_variation[ply]
+
+        mover = game_state.active_player
+        best_value, best_line = -INFINITY, []
+        for turn_action in self.order_actions(game_state, ply, table_action, principal_action):
+            game_state.apply(turn_action)
+            self._count_node()
+            follows = turn_action == principal_action
+            if game_state.active_player is mover:
+                value, line = self.negamax(game_state, depth - 1, ply + 1, alpha, beta, follows)
+            else:
+                value, line = self.negamax(game_state, depth - 1, ply + 1, -beta, -alpha, follows)
+                value = -value
+            game_state.undo()
+
+            if value > best_value:
+                best_value, best_line = value, [turn_action] + line
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self.cutoffs += 1
+                self.__store_killer(ply, turn_action)
+                break
+
+        if table is not None:
+            bound = Bound.UPPER if best_value <= original_alpha else Bound.LOWER if best_value >= beta else Bound.EXACT
+            table.store(game_state.hash_key, depth, best_value, best_line[0], bound)
+
+        return best_value, best_line
+
+    def order_actions(self, game_state: GameState, ply: int, table_action: Optional[TurnAction],
+                      principal_action: Optional[TurnAction] = None) -> List[TurnAction]:
+        """Previous principal variation, TT move, killer moves, affordable patches by income per time, advance"""
+        patches = [turn_action for turn_action in (TurnAction.PATCH_1, TurnAction.PATCH_2, TurnAction.PATCH_3)
+                   if game_state.turn_action_possible(turn_action)]
+        market = game_state.market
+        patches.sort(key=lambda turn_action: self.__income_per_time(market.get_patch(int(turn_action))), reverse=True)
+        ordered = patches + [TurnAction.ADVANCE]
+
+        killers = self.killers[ply] if ply < len(self.killers) else []
+        for turn_action in reversed([principal_action, table_action] + killers):
+            if turn_action in ordered:
+                ordered.remove(turn_action)
+                ordered.insert(0, turn_action)
+        return ordered
+
+    @staticmethod
+    def __income_per_time(patch) -> float:
+        return patch.button_income / max(patch.time_cost, 1)
+
+    def __store_killer(self, ply: int, turn_action: TurnAction):
+        if ply >= len(self.killers):
+            return
+        killers = self.killers[ply]
+        if turn_action in killers:
+            return
+        killers.insert(0, turn_action)
+        del killers[2:]
+
+
+class ParallelAlphaBetaStrategy(AlphaBetaStrategy):
+    """
+    Expands the first split_ply turns in this process and searches every distinct position at that ply as a task on
+    the long-lived worker pool. Tasks are compact states, every worker keeps its own transposition table across tasks
+    and turns. The values of the tasks are combined with negamax over the expanded turns.
+    """
+
+    def __init__(self, split_ply: int = 2):
+        super().__init__()
+        self.split_ply = split_ply
+        self.tasks = 0
+
+    @property
+    def name(self) -> str:
+        return "parallel_alpha_beta"
+
+    def search_turn(self, game_state: GameState, max_depth: int, time_budget: Optional[float]) -> GameState:
+        codec = StateCodec(game_state)
+        pool = worker_pool.get_pool()
+        self._start_pool_search()
+        return self.replay(game_state, self.iterate(
+            game_state, lambda depth: self.search_parallel(pool, codec, game_state, depth), max_depth, time_budget))
+
+    def search_parallel(self, pool: Pool, codec: StateCodec, game_state: GameState, depth: int) -> List[TurnAction]:
+        plies = depth + 1
+        split_ply = min(self.split_ply, plies)
+        tasks: Dict[CompactState, int] = {}
+        tree = self.__expand(game_state, codec, split_ply, tasks)
+
+        payloads = [(codec, state, plies - split_ply, self._deadline, self._pool_search) for state in tasks]
+        results = pool.starmap(_search_compact, payloads, chunksize=1)
+        if any(result is None for result in results):
+            raise SearchTimeout()
+        for _, _, nodes, depth_limited in results:
+            self.nodes += nodes
+            self.depth_limited |= depth_limited
+        self.tasks = len(payloads)
+
+        return self.__combine(tree, results)[1]
+
+    def __expand(self, game_state: GameState, codec: StateCodec, plies: int, tasks: Dict[CompactState, int]) -> Tuple:
+        """
+        :return: ("value", value) for finished games, ("task", index) at the split ply, otherwise
+        ("node", [(turn_action, same player to move, child)])
+        """
+        if game_state.game_end():
+            return "value", self.evaluate(game_state)
+        if plies == 0:
+            return "task", tasks.setdefault(codec.encode(game_state), len(tasks))
+
+        children = []
+        mover = game_state.active_player
+        for turn_action in TurnAction:
+            if not game_state.turn_action_possible(turn_action):
+                continue
+            game_state.apply(turn_action)
+            self._count_node()
+            children.append((turn_action, game_state.active_player is mover, self.__expand(game_state, codec, plies - 1, tasks)))
+            game_state.undo()
+        return "node", children
+
+    def __combine(self, tree: Tuple, results: List[Tuple]) -> Tuple[int, List[TurnAction]]:
+        kind, content = tree
+        if kind == "value":
+            return content, []
+        if kind == "task":
+            value, line, _, _ = results[content]
+            return value, line
+
+        best_value, best_line = -INFINITY, []
+        for turn_action, same_mover, child in content:
+            value, line = self.__combine(child, results)
+            if not same_mover:
+                value = -value
+            if value > best_value:
+                best_value, best_line = value, [turn_action] + line
+        return best_value, best_line
+
+
+class MonteCarloNode:
+    __slots__ = ("turn_action", "parent", "mover", "children", "untried", "visits", "reward")
+
+    def __init__(self, turn_action: Optional[TurnAction], parent: Optional["MonteCarloNode"], mover: int,
+                 untried: List[TurnAction]):
+        self.turn_action = turn_action
+        self.parent = parent
+        # Player number of the player who made turn_action, reward is counted for this player
+        self.mover = mover
+        self.children: List[MonteCarloNode] = []
+        self.untried = untried
+        self.visits = 0
+        self.reward = 0.0
+
+
+class MonteCarloStrategy(EngineStrategy):
+    """
+    Monte Carlo tree search with UCT selection and rollouts to the end of the game. A rollout counts as win (1),
+    draw (0.5) or loss (0) for the player who made the turn into a node. Runs for a number of iterations or until the
+    time budget is used up, max_depth is not used. If the worker pool has more than one process, the workers grow
+    independent trees of chunk_iterations iterations from the root (root parallelization) and the root statistics are
+    summed up after every tree.
+    """
+    cacheable = False
+    # Iterations between two on_iteration calls of a search in this process
+    report_iterations = 500
+    # Iterations of one tree on the worker pool, the merged statistics are reported and cancel is checked after every tree
+    chunk_iterations = 500
+
+    def __init__(self, iterations: int = 2000, exploration: float = 1.4, heuristic_rollouts: bool = True,
+                 seed: Optional[int] = None):
+        super().__init__()
+        self.iterations = iterations
+        self.exploration = exploration
+        self.heuristic_rollouts = heuristic_rollouts
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    @property
+    def name(self) -> str:
+        return "mcts"
+
+    def search_turn(self, game_state: GameState, max_depth: int, time_budget: Optional[float]) -> GameState:
+        self.depth_reached = 0
+        deadline = None if time_budget is None else timeit.default_timer() + time_budget
+        pooled = worker_pool.size() > 1
+        trees = self.__pooled_trees(game_state, deadline) if pooled \
+            else [self.search(game_state, self.iterations if deadline is None else None, deadline)]
+
+        action_stats: Dict[TurnAction, List] = {}
+        lines: List[List[TurnAction]] = []
+        for root_stats, line, nodes, depth in trees:
+            self.nodes += nodes
+            self.depth_reached = max(self.depth_reached, depth)
+            lines.append(line)
+            for turn_action, (visits, reward) in root_stats.items():
+                stats = action_stats.setdefault(turn_action, [0, 0.0])
+                stats[0] += visits
+                stats[1] += reward
+            if pooled and action_stats and self.on_iteration is not None:
+                self.on_iteration(game_state, self.depth_reached, self.__best_line(action_stats, lines))
+
+        if not action_stats:
+            raise SearchTimeout()
+
+        result = self.replay(game_state, self.__best_line(action_stats, lines))
+        result.action_stats = {turn_action: {"visits": visits, "win rate": f"{reward / max(visits, 1):.1%}"}
+                               for turn_action, (visits, reward) in sorted(action_stats.items())}
+        return result
+
+    def __pooled_trees(self, game_state: GameState, deadline: Optional[float]) -> Iterator[Tuple[Dict, List[TurnAction], int, int]]:
+        """
+        Results of search for trees grown on the worker pool, in the order they complete. Hands out one round of a
+        tree per worker at a time, until the iterations or the time budget are used up or the search got cancelled.
+        """
+        codec = StateCodec(game_state)
+        state = codec.encode(game_state)
+        pool = worker_pool.get_pool()
+        workers = worker_pool.size()
+        self._start_pool_search()
+        remaining = self.iterations
+        while not self.stopped() and (remaining > 0 if deadline is None else timeit.default_timer() < deadline):
+            if deadline is None:
+                chunks = [min(self.chunk_iterations, remaining - start)
+                          for start in range(0, min(remaining, workers * self.chunk_iterations), self.chunk_iterations)]
+                remaining -= sum(chunks)
+            else:
+                chunks = [self.chunk_iterations] * workers
+            payloads = [(codec, state, iterations, deadline, self.random.randrange(1 << 30), self.exploration,
+                         self.heuristic_rollouts, self._pool_search) for iterations in chunks]
+            yield from pool.imap_unordered(_monte_carlo_task, payloads)
+
+    @staticmethod
+    def __best_line(action_stats: Dict[TurnAction, List], lines: List[List[TurnAction]]) -> List[TurnAction]:
+        """Most visited root action, continued by the longest line of a tree which chose it as well"""
+        best_action = max(action_stats, key=lambda turn_action: action_stats[turn_action][0])
+        return max((line for line in lines if line and line[0] == best_action), key=len, default=[best_action])
+
+    def search(self, game_state: GameState, iterations: Optional[int], deadline: Optional[float]) -> Tuple[Dict, List[TurnAction], int, int]:
+        """
+        Grows a tree in place on game_state until it ran the iterations or the deadline passed, None for no limit
+        :return: (visits, reward) per root action, most visited line, nodes and depth of the tree
+        """
+        self.nodes = 0
+        root_ply = game_state.ply
+        root = MonteCarloNode(None, None, game_state.passive_player.player_number, self.__possible_actions(game_state))
+        max_depth = 0
+
+        iteration = 0
+        while not self.stopped() and (iterations is None or iteration < iterations) \
+                and (deadline is None or timeit.default_timer() < deadline):
+            iteration += 1
+            node = root
+            depth = 0
+            while not node.untried and node.children:
+                node = self.__select(node)
+                game_state.apply(node.turn_action)
+                self.nodes += 1
+                depth += 1
+
+            if node.untried:
+                turn_action = node.untried.pop(self.random.randrange(len(node.untried)))
+                mover = game_state.active_player.player_number
+                game_state.apply(turn_action)
+                self.nodes += 1
+                depth += 1
+                child = MonteCarloNode(turn_action, node, mover, self.__possible_actions(game_state))
+                node.children.append(child)
+                node = child
+            max_depth = max(max_depth, depth)
+
+            winner = self.rollout(game_state)
+            game_state.rewind(root_ply)
+
+            while node is not None:
+                node.visits += 1
+                node.reward += 1.0 if winner == node.mover else 0.5 if winner is None else 0.0
+                node = node.parent
+            if self.on_iteration is not None and not iteration % self.report_iterations:
+                self.on_iteration(game_state, max_depth, self.__most_visited_line(root))
+
+        root_stats = {child.turn_action: (child.visits, child.reward) for child in root.children}
+        return root_stats, self.__most_visited_line(root), self.nodes, max_depth
+
+    @staticmethod
+    def __most_visited_line(root: MonteCarloNode) -> List[TurnAction]:
+        line = []
+        node = root
+        while node.children:
+            node = max(node.children, key=lambda child: child.visits)
+            line.append(node.turn_action)
+        return line
+
+    def rollout(self, game_state: GameState) -> Optional[int]:
+        """
+        Plays until the end of the game, the caller has to rewind game_state
+        :return: Player number of the winner, None for a draw
+        """
+        while not game_state.game_end():
+            actions = self.__possible_actions(game_state)
+            if self.heuristic_rollouts and len(actions) > 1 and self.random.random() < 0.75:
+                turn_action = max(actions, key=lambda action: self.__rollout_value(game_state, action))
+            else:
+                turn_action = actions[self.random.randrange(len(actions))]
+            game_state.apply(turn_action)
+            self.nodes += 1
+
+        margin = self.evaluate(game_state)
+        if margin == 0:
+            return None
+        return (game_state.active_player if margin > 0 else game_state.passive_player).player_number
+
+    def __select(self, node: MonteCarloNode) -> MonteCarloNode:
+        log_visits = math.log(node.visits)
+        return max(node.children, key=lambda child: child.reward / child.visits
+                   + self.exploration * math.sqrt(log_visits / child.visits))
+
+    @staticmethod
+    def __possible_actions(game_state: GameState) -> List[TurnAction]:
+        if game_state.game_end():
+            return []
+        return [turn_action for turn_action in TurnAction if game_state.turn_action_possible(turn_action)]
+
+    @staticmethod
+    def __rollout_value(game_state: GameState, turn_action: TurnAction) -> float:
+        """Buttons a turn is worth until the end of the game, per time step"""
+        if turn_action == TurnAction.ADVANCE:
+            return 1.0
+        patch = game_state.market.get_patch(int(turn_action))
+        player = game_state.active_player
+        value = patch.button_income * game_state.time_track.get_remaining_income_phases(player) + 2 * patch.size - patch.button_cost
+        return value / max(patch.time_cost, 1)
+
+
+def _monte_carlo_task(payload: Tuple[StateCodec, CompactState, int, Optional[float], int, float, bool, int]) \
+        -> Tuple[Dict, List[TurnAction], int, int]:
+    """
+    Pool task of MonteCarloStrategy, grows one independent tree
+    :param payload: codec, state, iterations, deadline, seed, exploration, heuristic_rollouts and pool_search
+    """
+    codec, state, iterations, deadline, seed, exploration, heuristic_rollouts, pool_search = payload
+    strategy = MonteCarloStrategy(iterations, exploration, heuristic_rollouts, seed)
+    strategy._pool_search = pool_search
+    return strategy.search(codec.decode(state), iterations, deadline)
+
+
+# Search state of a worker process, see _search_compact
+_worker_strategy: Optional[AlphaBetaStrategy] = None
+
+
+def _search_compact(codec: StateCodec, state: CompactState, plies: int, deadline: Optional[float],
+                    pool_search: int) -> Optional[Tuple[int, List[TurnAction], int, bool]]:
+    """
+    Pool task of ParallelAlphaBetaStrategy
+    :return: Value, principal variation, nodes and whether the search was depth limited, None if the deadline passed
+    or the search got cancelled
+    """
+    global _worker_strategy
+    if _worker_strategy is None:
+        _worker_strategy = AlphaBetaStrategy()
+        if worker_pool.worker_table_bytes:
+            _worker_strategy.transposition_table = TranspositionTable(worker_pool.worker_table_bytes)
+
+    strategy = _worker_strategy
+    strategy.nodes = 0
+    strategy.depth_limited = False
+    strategy.killers = [[] for _ in range(plies + 1)]
+    strategy.principal_variation = []
+    strategy._deadline = deadline
+    strategy._pool_search = pool_search
+    game_state = codec.decode(state)
+    try:
+        value, line = strategy.negamax(game_state, plies, 0, -INFINITY, INFINITY)
+        line = strategy.complete_line(game_state, line, plies)
+    except SearchTimeout:
+        return None
+    finally:
+        strategy._deadline = None
+    return value, line, strategy.nodes, strategy.depth_limited
 
-            game_state_copy = copy.deepcopy(game_state)
-            game_state_copy.execute_turn(turn_action)
 
-            if not game_state_copy.game_end():
-                args.append((game_state_copy, max_depth, 1))
+# Search state of a worker process, see _greedy_subtree
+_worker_greedy: Optional[GreedySingleCoreStrategy] = None
 
-        game_states = pool.starmap(self.calculate_state, args)
 
-        current_winner = game_states.pop()
-        for candidate in game_states:
-            current_winner = self.choose_winner(current_winner.player, current_winner.opponent, current_winner, candidate)
+def _greedy_subtree(codec: StateCodec, state: CompactState, max_depth: int, current_depth: int, player_number: int,
+                    deadline: Optional[float], pool_search: int) -> Optional[Tuple[Tuple[Dict[int, int], List[TurnAction]], int, bool]]:
+    """
+    Pool task of GreedyFourCoreStrategy, the scores of player_number are maximized
+    :return: Scores at the end of the best path and its turns, nodes and whether the search was depth limited,
+    None if the deadline passed or the search got cancelled
+    """
+    global _worker_greedy
+    if _worker_greedy is None:
+        _worker_greedy = GreedySingleCoreStrategy()
+        if worker_pool.worker_table_bytes:
+            _worker_greedy.transposition_table = TranspositionTable(worker_pool.worker_table_bytes)
 
-        return current_winner
+    strategy = _worker_greedy
+    strategy.nodes = 0
+    strategy.depth_limited = False
+    strategy._deadline = deadline
+    strategy._pool_search = pool_search
+    game_state = codec.decode(state)
+    for player in (game_state.active_player, game_state.passive_player):
+        player.set_player_turn(player.player_number == player_number)
+    try:
+        outcome, line = strategy.calculate_state(game_state, max_depth, current_depth)
+        best = outcome, strategy.complete_line(game_state, line, max_depth, current_depth)
+    except SearchTimeout:
+        return None
+    finally:
+        strategy._deadline = None
+    return best, strategy.nodes, strategy.depth_limited
 
 
 greedy_s = GreedySingleCoreStrategy()
 greedy_f = GreedyFourCoreStrategy()
+alpha_beta = AlphaBetaStrategy()
+parallel_alpha_beta = ParallelAlphaBetaStrategy()
+monte_carlo = MonteCarloStrategy()
 
 strategies: Dict[str, EngineStrategy] = {
     greedy_s.name.lower(): greedy_s,
     greedy_f.name.lower(): greedy_f,
+    alpha_beta.name.lower(): alpha_beta,
+    parallel_alpha_beta.name.lower(): parallel_alpha_beta,
+    monte_carlo.name.lower(): monte_carlo,
 }
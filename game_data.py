@@ -0,0 +1,96 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Set, TextIO
+
+from components import Market, Player, TimeTrack
+
+
+class TokenIndex:
+    """Keys of the gamedatas tokens by location and the patches on every quilt by player color, built in one pass"""
+
+    def __init__(self, tokens: Dict):
+        self.locations: Dict[str, List[str]] = {}
+        self.quilts: Dict[str, List[str]] = {}
+        for key, token in tokens.items():
+            location = token['location']
+            self.locations.setdefault(location, []).append(key)
+            if location.startswith("square_"):
+                self.quilts.setdefault(location.split('_')[1], []).append(key)
+
+    def count(self, location: str) -> int:
+        return len(self.locations.get(location, ()))
+
+    def owned_patches(self, color: str) -> Set[str]:
+        return set(self.quilts.get(color, ()))
+
+    def claimed_spots(self) -> int:
+        """Special spots of the time track without their 1x1 patch on them, as TimeTrack.claimed"""
+        claimed = 0
+        for spot, location in enumerate(TimeTrack._special_spot_locations):
+            if not Market.special_patch_keys.intersection(self.locations.get(f"timetrack_{location}", ())):
+                claimed |= 1 << spot
+        return claimed
+
+
+def parse_game_data(game_data: Dict) -> (Dict, str, Dict, int):
+    """
+    Extracts the engine input from window.gameui.gamedatas
+    :return: patches, token position, players, claimed special spots as init_game takes them
+    """
+    tokens = game_data['tokens']
+    index = TokenIndex(tokens)
+    players = game_data['players']
+    for key, player in players.items():
+        player['income'] = game_data['counters'][f"income_{player['color']}_counter"]['counter_value']
+        player['empty_spaces'] = game_data['counters'][f"empties_{player['color']}_counter"]['counter_value']
+        player['players_turn'] = (game_data['gamestate']['active_player'] == player['id'])
+        player['buttons'] = index.count(f"buttons_{player['color']}")
+        player['time_marker'] = {
+            'location': int(tokens[f'timemarker_{player["color"]}']['location'].split('_')[1]),
+            'top': tokens[f'timemarker_{player["color"]}']['state']
+        }
+        player['tile_special7x7'] = tokens['tile_special7x7']['location'] == f"tableau_{player['color']}"
+        player['owned_patches'] = index.owned_patches(player['color'])
+
+    patches = {}
+    for id_ in Market.patch_keys:
+        patches[id_] = tokens[id_] | game_data['token_types'][id_]
+
+    return patches, tokens['token_neutral']['state'], players, index.claimed_spots()
+
+
+def init_game(patches: Dict, token_position, players: Dict, claimed_spots: int) -> (Market, Player, Player, TimeTrack):
+    pieces = Market(patches, token_position)
+    player1 = players.popitem()[1]
+    player2 = players.popitem()[1]
+    p1 = Player(player1, patches)
+    p2 = Player(player2, patches)
+    track = TimeTrack(claimed_spots)
+    return pieces, p1, p2, track
+
+
+def save_snapshot(directory: str, game: str, turn: int, game_data: Dict) -> Path:
+    """
+    Writes the unparsed gamedatas of a turn as <game>_<move_nbr>.json, the format of load_snapshot
+    :return: Path of the snapshot
+    """
+    path = Path(directory) / f"{game}_{turn:03}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"move_nbr": turn, "gamedatas": game_data}, file)
+    return path
+
+
+def load_snapshot(file: TextIO) -> (int, Dict):
+    """
+    Reads a snapshot of save_snapshot, a bare gamedatas object is accepted as well
+    :return: move number (None if unknown), gamedatas
+    """
+    return read_snapshot(json.load(file))
+
+
+def read_snapshot(snapshot: Dict) -> (int, Dict):
+    """load_snapshot of an already decoded snapshot"""
+    if "gamedatas" in snapshot:
+        return snapshot.get("move_nbr"), snapshot["gamedatas"]
+    return None, snapshot
@@ -0,0 +1,95 @@
+from typing import Dict, List, Optional
+
+from components import GameState, TurnAction, patch_id
+from game_data import parse_game_data, init_game
+
+
+def market_order(patches: Dict, token_position) -> List[int]:
+    """Patch ids of a snapshot's market from the first choice on, the order of Market.get_patch_choices and get_remaining_patches"""
+    market = [patch for patch in sorted(patches.values(), key=lambda item: int(item['state'])) if patch['location'] == 'market']
+    if not market:
+        return []
+    offset = int(token_position) % len(market)
+    return [int(patch['key'].split('_')[1]) for patch in market[offset:] + market[:offset]]
+
+
+class GameSync:
+    """
+    Keeps the engine state of a followed game across turns. The turns played since the last snapshot are recognized
+    from the diff to the new one (the time marker of the player to move moved, a patch of the market choices is on
+    its quilt or not) and applied to the kept state, so market, players and hashes are updated in place instead of
+    rebuilt. If the applied turns do not end in the counters, time markers, special spots and market of the snapshot,
+    e.g. after a placement the quilt model did not expect, the state is rebuilt.
+    """
+    # Most turns recognized between two snapshots
+    MAX_TURNS = 6
+
+    def __init__(self):
+        self.game_state: Optional[GameState] = None
+        # Turns applied by the last update, None if it rebuilt the state
+        self.turns: Optional[List[TurnAction]] = None
+        self.updates = 0
+        self.rebuilds = 0
+
+    def update(self, game_data: Dict) -> GameState:
+        """:return: State of the snapshot with the player to move as player_turn, the kept state if it could be synced"""
+        patches, token_position, players, claimed_spots = parse_game_data(game_data)
+        targets = {player['color']: player for player in players.values()}
+        order = market_order(patches, token_position)
+        self.updates += 1
+        self.turns = self.__sync(targets, order, claimed_spots) if self.game_state is not None else None
+        if self.turns is None:
+            self.rebuilds += 1
+            market, p1, p2, track = init_game(patches, token_position, players, claimed_spots)
+            self.game_state = GameState(p1, p2, market, track)
+        else:
+            # the turns of earlier snapshots are never undone, keeping them would grow the stack over the whole game
+            self.game_state.clear_undo()
+        for player in (self.game_state.active_player, self.game_state.passive_player):
+            player.set_player_turn(targets[player.color_code]['players_turn'])
+        self.game_state.determine_active_player()
+        return self.game_state
+
+    def __sync(self, targets: Dict[str, Dict], order: List[int], claimed_spots: int) -> Optional[List[TurnAction]]:
+        """:return: Turns applied to reach the snapshot, None if they are not recognized"""
+        game_state = self.game_state
+        players = (game_state.active_player, game_state.passive_player)
+        if {player.color_code for player in players} != set(targets):
+            return None
+        ply = game_state.ply
+        turns = []
+        while not self.matches(game_state, targets, order, claimed_spots):
+            if len(turns) == self.MAX_TURNS or game_state.game_end():
+                game_state.rewind(ply)
+                return None
+            owned = targets[game_state.active_player.color_code]['owned_patches']
+            taken = [choice for choice, patch in enumerate(game_state.market.get_patch_choices()) if patch.id_ in owned]
+            turn_action = TurnAction(taken[0]) if taken else TurnAction.ADVANCE
+            if not game_state.turn_action_possible(turn_action):
+                game_state.rewind(ply)
+                return None
+            game_state.apply(turn_action)
+            turns.append(turn_action)
+        return turns
+
+    def summary(self) -> str:
+        if self.turns is None:
+            return "Init data structure..."
+        if not self.turns:
+            return "Same position as the previous snapshot"
+        return f"Applied {', '.join(turn_action.name for turn_action in self.turns)} to the state of the previous snapshot"
+
+    @staticmethod
+    def matches(game_state: GameState, targets: Dict[str, Dict], order: List[int], claimed_spots: int) -> bool:
+        if game_state.time_track.claimed != claimed_spots:
+            return False
+        for player in (game_state.active_player, game_state.passive_player):
+            target = targets[player.color_code]
+            if (player.location, player.location_top, player.button_count, player.button_production, player.empty_spaces,
+                    player.owns_special7x7) != (target['time_marker']['location'], int(target['time_marker']['top']),
+                                                target['buttons'], int(target['income']), int(target['empty_spaces']),
+                                                target['tile_special7x7']):
+                return False
+        market = game_state.market
+        return [patch_id(patch) for patch in market.get_patch_choices()] + \
+            [patch_id(patch) for patch in market.get_remaining_patches()] == order
@@ -1,22 +1,70 @@
-import os
-import gym
+import timeit
 
-environment_name = 'CartPole-v0'
-env = gym.make(environment_name)
+import click
+import numpy as np
+from stable_baselines3 import PPO
+from stable_baselines3.common.vec_env import DummyVecEnv
 
-episodes = 5
+from components import GameState
+from game_data import parse_game_data, load_snapshot, init_game
+from patchwork_env import PatchworkEnv, VectorPatchworkEnv
 
-for episode in range(1, episodes + 1):
-    state = env.reset()
-    done = False
-    score = 0
 
-    while not done:
-        env.render()
-        action = env.action_space.sample()
-        n_state, reward, done, info = env.step(action)
-        score += reward
+def start_position(snapshot) -> GameState:
+    _, game_data = load_snapshot(snapshot)
+    market, p1, p2, track = init_game(*parse_game_data(game_data))
+    game_state = GameState(p1, p2, market, track)
+    game_state.determine_active_player()
+    return game_state
 
-    print(f"{episode : }, {score :}")
 
-env.close()
+def random_steps(env, steps: int, seed: int) -> float:
+    """:return: Environment steps per second with uniformly random possible actions"""
+    random = np.random.default_rng(seed)
+    env.reset()
+    start = timeit.default_timer()
+    for _ in range(steps):
+        masks = np.array(env.env_method("action_masks"))
+        env.step(np.argmax(random.random(masks.shape) * masks, axis=1))
+    return steps * env.num_envs / (timeit.default_timer() - start)
+
+
+@click.group()
+def cli():
+    """Reinforcement learning on Patchwork games which start at a snapshot (see analyze.py)"""
+
+
+@cli.command()
+@click.argument("snapshot", type=click.File("r"))
+@click.option("--envs", "-n", default=256, show_default=True, help="Games stepped together", type=int)
+@click.option("--steps", default=200, show_default=True, help="Steps of every game", type=int)
+@click.option("--seed", default=0, show_default=True, type=int)
+def benchmark(snapshot, envs, steps, seed):
+    """Environment steps per second of GameState environments in a DummyVecEnv and of VectorPatchworkEnv"""
+    start = start_position(snapshot)
+    naive = DummyVecEnv([lambda env=env: PatchworkEnv(start, shuffle_market=True, seed=seed + env) for env in range(envs)])
+    naive_rate = random_steps(naive, steps, seed)
+    click.echo(f"GameState (DummyVecEnv): {naive_rate:,.0f} env-steps/sec")
+    vectorized_rate = random_steps(VectorPatchworkEnv(start, envs, shuffle_market=True, seed=seed), steps, seed)
+    click.echo(f"VectorPatchworkEnv: {vectorized_rate:,.0f} env-steps/sec ({vectorized_rate / naive_rate:.1f}x)")
+
+
+@cli.command()
+@click.argument("snapshot", type=click.File("r"))
+@click.option("--envs", "-n", default=64, show_default=True, help="Games stepped together", type=int)
+@click.option("--timesteps", default=1_000_000, show_default=True, type=int)
+@click.option("--shuffle-market/--no-shuffle-market", default=True, show_default=True,
+              help="Start every game with a random market order")
+@click.option("--output", "-o", default="patchwork_ppo", show_default=True, help="File of the trained model")
+@click.option("--seed", default=0, show_default=True, type=int)
+def train(snapshot, envs, timesteps, shuffle_market, output, seed):
+    """Trains PPO on VectorPatchworkEnv against a random opponent, the reward is the score margin"""
+    env = VectorPatchworkEnv(start_position(snapshot), envs, shuffle_market, seed)
+    model = PPO("MlpPolicy", env, verbose=1, seed=seed)
+    model.learn(total_timesteps=timesteps)
+    model.save(output)
+    click.echo(f"Model written to {output}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,152 @@
+import copy
+from typing import Optional
+
+import gym
+import numpy as np
+from gym import spaces
+from stable_baselines3.common.vec_env import VecEnv
+
+from batch_game import BatchGame, OBSERVATION_SIZE, observe, action_mask, score_margin
+from components import GameState, Market, TurnAction
+
+
+def observation_space() -> spaces.Box:
+    return spaces.Box(low=-1000, high=1000, shape=(OBSERVATION_SIZE,), dtype=np.float32)
+
+
+def action_space() -> spaces.Discrete:
+    return spaces.Discrete(len(TurnAction))
+
+
+class PatchworkEnv(gym.Env):
+    """
+    One game on a GameState. The agent is the player to move in the start position, the opponent plays uniformly
+    random possible turns until it is the agent's turn again. The reward of a step is the change of the score margin
+    of the agent, an impossible action advances instead (info["illegal_action"]).
+    """
+    metadata = {"render.modes": ["human"]}
+
+    def __init__(self, start: GameState, shuffle_market: bool = False, seed: Optional[int] = None):
+        self.start = copy.deepcopy(start)
+        self.start.determine_active_player()
+        self.agent_number = self.start.active_player.player_number
+        self.shuffle_market = shuffle_market
+        self.observation_space = observation_space()
+        self.action_space = action_space()
+        self.random = np.random.default_rng(seed)
+        self.game: Optional[GameState] = None
+
+    def seed(self, seed: Optional[int] = None):
+        self.random = np.random.default_rng(seed)
+        return [seed]
+
+    def reset(self) -> np.ndarray:
+        game = copy.deepcopy(self.start)
+        if self.shuffle_market:
+            market = game.market
+            available = [index for index in range(len(market.ring)) if not market.removed & (1 << index)]
+            ring = list(market.ring)
+            for index, id_ in zip(available, self.random.permutation([ring[index] for index in available])):
+                ring[index] = int(id_)
+            game = GameState(game.active_player, game.passive_player,
+                             Market.from_layout(market.patch_table, tuple(ring), market.offset, market.removed), game.time_track)
+            # the constructor takes the player to move from player_turn, the time markers decide it like in the start position
+            game.determine_active_player()
+        self.game = game
+        return observe(self.game, self.agent_number)
+
+    def step(self, action: int):
+        turn_action = TurnAction(int(action))
+        illegal = not self.game.turn_action_possible(turn_action)
+        if illegal:
+            turn_action = TurnAction.ADVANCE
+        before = score_margin(self.game, self.agent_number)
+        self.game.apply(turn_action)
+        while not self.game.game_end() and self.game.active_player.player_number != self.agent_number:
+            possible = [turn_action for turn_action in TurnAction if self.game.turn_action_possible(turn_action)]
+            self.game.apply(possible[self.random.integers(len(possible))])
+        margin = score_margin(self.game, self.agent_number)
+        info = {"illegal_action": illegal, "margin": margin}
+        return observe(self.game, self.agent_number), float(margin - before), self.game.game_end(), info
+
+    def action_masks(self) -> np.ndarray:
+        return action_mask(self.game)
+
+    def render(self, mode="human"):
+        for player in (self.game.active_player, self.game.passive_player):
+            print(player.status())
+
+
+class VectorPatchworkEnv(VecEnv):
+    """
+    num_envs games of PatchworkEnv stepped together on a BatchGame. Finished games are reset right away, their last
+    observation is in info["terminal_observation"] like in the stable-baselines3 vectorized environments.
+    """
+
+    def __init__(self, start: GameState, num_envs: int, shuffle_market: bool = False, seed: Optional[int] = None):
+        start = copy.deepcopy(start)
+        start.determine_active_player()
+        self.batch = BatchGame(start, num_envs, shuffle_market, seed)
+        self.__actions: Optional[np.ndarray] = None
+        super().__init__(num_envs, observation_space(), action_space())
+
+    def reset(self) -> np.ndarray:
+        self.batch.reset(np.ones(self.num_envs, dtype=bool))
+        return self.batch.observations()
+
+    def step_async(self, actions: np.ndarray):
+        self.__actions = np.asarray(actions, dtype=np.int32)
+
+    def step_wait(self):
+        batch = self.batch
+        masks = batch.action_masks()
+        illegal = ~masks[np.arange(self.num_envs), self.__actions]
+        actions = np.where(illegal, int(TurnAction.ADVANCE), self.__actions)
+        before = batch.score_margins()
+        batch.step(actions)
+        self.__play_opponent()
+
+        margins = batch.score_margins()
+        dones = batch.game_end()
+        observations = batch.observations()
+        infos = [{"illegal_action": bool(illegal[game]), "margin": int(margins[game])} for game in range(self.num_envs)]
+        if dones.any():
+            for game in np.nonzero(dones)[0]:
+                infos[game]["terminal_observation"] = observations[game]
+            batch.reset(dones)
+            observations[dones] = batch.observations()[dones]
+        return observations, (margins - before).astype(np.float32), dones, infos
+
+    def __play_opponent(self):
+        batch = self.batch
+        while True:
+            turn = (batch.active == 1) & ~batch.game_end()
+            if not turn.any():
+                return
+            batch.step(batch.random_actions(batch.action_masks()), turn)
+
+    def action_masks(self) -> np.ndarray:
+        return self.batch.action_masks()
+
+    def close(self):
+        pass
+
+    def seed(self, seed: Optional[int] = None):
+        self.batch.random = np.random.default_rng(seed)
+        return [seed] * self.num_envs
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        """action_masks returns the mask of every game, any other method is called once per index"""
+        indices = list(self._get_indices(indices))
+        if method_name == "action_masks":
+            return list(self.action_masks()[indices])
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in indices]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
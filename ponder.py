@@ -0,0 +1,88 @@
+import copy
+import threading
+import timeit
+from typing import Optional
+
+import engine_stragegies
+from components import GameState
+from transposition import TranspositionTable
+
+
+class Ponderer:
+    """
+    Searches the position after the predicted turn in a background thread while the opponent thinks. The search fills
+    the transposition table of the strategy, so the next calculate_turn starts with the pondered results.
+    """
+
+    def __init__(self, strategy: engine_stragegies.EngineStrategy):
+        if strategy.transposition_table is None:
+            strategy.transposition_table = TranspositionTable()
+        self.strategy = strategy
+        self.__search: Optional[engine_stragegies.EngineStrategy] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__position: Optional[GameState] = None
+        self.__started = 0.0
+        self.seconds = 0.0
+        self.__table_entries = 0
+        self.__table_hits = 0
+
+    def start(self, calculated: GameState):
+        """Starts pondering the position after the first turn of a calculated line"""
+        self.stop()
+        if not calculated.ply:
+            return
+        position = copy.deepcopy(calculated)
+        position.rewind(1)
+        if position.game_end():
+            return
+        self.__position = copy.deepcopy(position)
+
+        search = copy.copy(self.strategy)
+        search.collect_stats(False)
+        search.endgame_solved = False
+        self.__search = search
+        self.__table_entries = len(self.strategy.transposition_table)
+        self.__started = timeit.default_timer()
+        self.__thread = threading.Thread(target=self.__ponder, args=(search, position), name="ponder", daemon=True)
+        self.__thread.start()
+
+    @staticmethod
+    def __ponder(search: engine_stragegies.EngineStrategy, position: GameState):
+        try:
+            search.calculate_turn(position.active_player, position.passive_player, position.market, position.time_track,
+                                  engine_stragegies.UNLIMITED_DEPTH, float("inf"))
+        except engine_stragegies.SearchTimeout:
+            pass
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        self.__search.cancel()
+        self.__thread.join()
+        self.__thread = None
+        self.seconds = timeit.default_timer() - self.__started
+
+    @property
+    def pondered(self) -> bool:
+        return self.__search is not None
+
+    def matches(self, game_state: GameState) -> bool:
+        """Stops pondering, :return: Whether game_state is the pondered position"""
+        self.stop()
+        return self.__position is not None and self.__position.hash_key == game_state.hash_key
+
+    def before_search(self):
+        self.__table_hits = self.strategy.transposition_table.hits
+
+    def report(self, hit: bool) -> str:
+        """Summary of the last pondering, hit: the pondered position arrived"""
+        search = self.__search
+        table = self.strategy.transposition_table
+        pondered = f"{search.nodes} nodes to depth {search.depth_reached} in {self.seconds:.1f}s, " \
+                   f"{len(table) - self.__table_entries} new TT entries"
+        if hit:
+            return f"Ponder hit, the predicted turn was played: {pondered}"
+        return f"Ponder miss, another turn was played: {pondered}"
+
+    def reused(self) -> str:
+        return f"Reused: {self.strategy.transposition_table.hits - self.__table_hits} TT hits in this search"
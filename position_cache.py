@@ -0,0 +1,159 @@
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+
+from components import TurnAction
+from transposition import TTEntry, Bound
+
+# Position cache of the command line tools unless another path is given
+DEFAULT_PATH = "positions.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    key INTEGER PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    best_action INTEGER,
+    bound INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS positions_used ON positions (used);
+"""
+
+
+def _signed(key: int) -> int:
+    """Zobrist keys are unsigned 64-bit, SQLite integers are signed"""
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class PositionCache:
+    """
+    Search results which outlive the process, in an SQLite file in WAL mode: any number of processes read
+    concurrently while one of them writes. Entries are keyed like the transposition table, an entry is only replaced
+    by a result of at least the same depth. Holds at most max_entries, the least recently used entries are evicted
+    once it grows beyond that.
+    """
+    # A hit only refreshes the last use of an entry after this many seconds, so reading mostly does not write
+    TOUCH_SECONDS = 600
+    # Stores between checks of the size cap (at most the share), eviction removes this share of max_entries at once
+    EVICT_INTERVAL = 64
+    EVICT_SHARE = 0.1
+
+    def __init__(self, path: str = DEFAULT_PATH, max_entries: int = 1_000_000):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.__connection: Optional[sqlite3.Connection] = None
+        self.__lock = threading.Lock()
+        self.__unchecked_stores = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Opened on first use, so a pickled cache reconnects in the worker process"""
+        if self.__connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self.__connection = connection
+        return self.__connection
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_PositionCache__connection"] = None
+        state["_PositionCache__lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def probe(self, key: int, depth: int) -> Optional[TTEntry]:
+        """:return: Entry for key if it was searched at least depth deep"""
+        with self.__lock:
+            row = self.__row(key)
+            if row is None or row[0] < depth:
+                self.misses += 1
+                return None
+            self.hits += 1
+            now = time.time()
+            if now - row[4] > self.TOUCH_SECONDS:
+                self.connection.execute("UPDATE positions SET used = ? WHERE key = ?", (now, _signed(key)))
+        return self.__entry(row)
+
+    def lookup(self, key: int) -> Optional[TTEntry]:
+        """Entry for key at any depth, not counted in the hit rate, e.g. for the positions along a probed line"""
+        with self.__lock:
+            row = self.__row(key)
+        return None if row is None else self.__entry(row)
+
+    def __row(self, key: int) -> Optional[tuple]:
+        return self.connection.execute("SELECT depth, value, best_action, bound, used FROM positions WHERE key = ?",
+                                       (_signed(key),)).fetchone()
+
+    @staticmethod
+    def __entry(row: tuple) -> TTEntry:
+        return TTEntry(row[0], row[1], None if row[2] is None else TurnAction(row[2]), Bound(row[3]))
+
+    def store(self, key: int, depth: int, value: int, best_action: Optional[TurnAction], bound: Bound = Bound.EXACT):
+        self.store_many([(key, depth, value, best_action, bound)])
+
+    def store_many(self, entries: Iterable[Tuple[int, int, int, Optional[TurnAction], Bound]]):
+        """Stores (key, depth, value, best_action, bound) tuples in one transaction"""
+        now = time.time()
+        rows = [(_signed(key), depth, value, None if best_action is None else int(best_action), int(bound), now)
+                for key, depth, value, best_action, bound in entries]
+        with self.__lock:
+            connection = self.connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(
+                    "INSERT INTO positions (key, depth, value, best_action, bound, used) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET depth = excluded.depth, value = excluded.value, "
+                    "best_action = excluded.best_action, bound = excluded.bound, used = excluded.used "
+                    "WHERE excluded.depth >= positions.depth", rows)
+                self.__unchecked_stores += len(rows)
+                if self.__unchecked_stores >= min(self.EVICT_INTERVAL, self.max_entries * self.EVICT_SHARE):
+                    self.__unchecked_stores = 0
+                    self.__evict(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        self.stores += len(rows)
+
+    def __evict(self, connection: sqlite3.Connection):
+        excess = connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0] - self.max_entries
+        if excess <= 0:
+            return
+        count = excess + int(self.max_entries * self.EVICT_SHARE)
+        connection.execute("DELETE FROM positions WHERE key IN (SELECT key FROM positions ORDER BY used LIMIT ?)", (count,))
+        self.evictions += count
+
+    @property
+    def hit_rate(self) -> float:
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def clear(self):
+        with self.__lock:
+            self.connection.execute("DELETE FROM positions")
+        self.hits = self.misses = self.stores = self.evictions = 0
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+    def stats(self) -> str:
+        return f"Cache {self.path}: {len(self)}/{self.max_entries} entries, hits: {self.hits}, misses: {self.misses}, " \
+               f"hit rate: {self.hit_rate:.1%}, stores: {self.stores}, evictions: {self.evictions}"
+
+    def __len__(self):
+        with self.__lock:
+            return self.connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
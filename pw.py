@@ -1,5 +1,5 @@
-import timeit
-from typing import Dict
+from typing import Dict, Optional
+from urllib.parse import urlparse, parse_qs
 
 import click
 from selenium.webdriver import Firefox
@@ -7,8 +7,10 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.support.wait import WebDriverWait
 
-import engine_stragegies
-from components import Market, Player, TimeTrack, TurnAction, GameState
+from analysis import strategy_options, configure_strategy, analyze, analyze_remote, print_delimiter
+from game_data import save_snapshot
+from game_sync import GameSync
+from ponder import Ponderer
 
 
 def wait_for_player_turn():
@@ -20,70 +22,16 @@ def wait_for_player_turn():
     return _predicate
 
 
-def read_game_state(driver):
+def read_game_data(driver, snapshot_dir: Optional[str] = None, game: str = "game") -> (int, Dict):
+    """:return: move number and the unparsed gamedatas"""
     click.echo("Read data...")
     WebDriverWait(driver, 30).until(wait_for_player_turn())
 
     game_data = driver.execute_script("return window.gameui.gamedatas;")
-
-    players = game_data['players']
-    for key, player in players.items():
-        player['income'] = game_data['counters'][f"income_{player['color']}_counter"]['counter_value']
-        player['empty_spaces'] = game_data['counters'][f"empties_{player['color']}_counter"]['counter_value']
-        player['players_turn'] = (game_data['gamestate']['active_player'] == player['id'])
-        player['buttons'] = sum([1 for token in game_data['tokens'].values() if token['location'] == f"buttons_{player['color']}"])
-        player['time_marker'] = {
-            'location': int(game_data['tokens'][f'timemarker_{player["color"]}']['location'].split('_')[1]),
-            'top': game_data['tokens'][f'timemarker_{player["color"]}']['state']
-        }
-        player['tile_special7x7'] = game_data['tokens']['tile_special7x7']['location'] == f"tableau_{player['color']}"
-        player['owned_patches'] = {patch['key'] for patch in
-                                   game_data['tokens'].values() if
-                                   patch['location'].startswith(f"square_{player['color']}")}
-
-    patches = {}
-    for id_ in Market.patch_keys:
-        patches[id_] = game_data['tokens'][id_] | game_data['token_types'][id_]
-
-    turn = driver.find_element(By.ID, "move_nbr").text
-    return int(turn), patches, game_data['tokens']['token_neutral']['state'], players
-
-
-def init_game(patches: Dict, token_position, players: Dict) -> (Market, Player, Player, TimeTrack):
-    click.echo("Init data structure...")
-    pieces = Market(patches, token_position)
-    player1 = players.popitem()[1]
-    player2 = players.popitem()[1]
-    p1 = Player(player1, patches)
-    p2 = Player(player2, patches)
-    track = TimeTrack()
-    return pieces, p1, p2, track
-
-
-def print_game_status(p1, p2, track):
-    active_player: Player = p1 if p1.player_turn else p2
-    click.secho(f"{active_player.player_name}'s turn", fg=active_player.get_player_color(), nl=False)
-    click.echo(f" ({active_player.status()})")
-
-    p1_score = p1.get_current_score(track)
-    p2_score = p2.get_current_score(track)
-
-    def get_color(p1_, p2_):
-        if p1_ > p2_:
-            return 'green'
-        elif p1_ < p2_:
-            return 'red'
-        else:
-            return 'yellow'
-
-    def print_(p1_, p1_score, p2_score):
-        click.secho(f"{p1_.player_name}", fg=p1_.get_player_color(), nl=False)
-        click.echo("'s score: ", nl=False)
-        click.secho(p1_score, bg=(get_color(p1_score, p2_score)), fg='black')
-
-    print_(p1, p1_score, p2_score)
-    print_(p2, p2_score, p1_score)
-    click.echo()
+    turn = int(driver.find_element(By.ID, "move_nbr").text)
+    if snapshot_dir is not None:
+        click.echo(f"Snapshot written to {save_snapshot(snapshot_dir, game, turn, game_data)}")
+    return turn, game_data
 
 
 def wait_for_player_choice(turn, driver):
@@ -98,25 +46,31 @@ def wait_for_player_choice(turn, driver):
     WebDriverWait(driver, 180).until(wait_for_player_turn())
 
 
-def print_delimiter(nl=False):
-    click.echo("-" * 50)
-    if nl:
-        click.echo()
-
-
 @click.command()
 @click.argument("url")
-@click.option("--strategy", "-s", default="greedy_single_core", help="Turn calculation Algorithm",
-              type=click.Choice(["greedy_single_core", "greedy_four_core"], case_sensitive=False))
-@click.option("--depth", "-d", default=3, help="Depth for movement calculation", type=int)
+@strategy_options
 @click.option("--wait", "-w", is_flag=True, show_default=True, default=False, help="If this is true, there will be ongoing evaluation if a player makes a turn")
-def go_play(url, strategy, depth, wait):
+@click.option("--ponder", is_flag=True, default=False, help="With --wait, search the position after the predicted turn "
+                                                             "while waiting and reuse the transposition table")
+@click.option("--snapshot-dir", default=None, help="Directory to save the gamedatas of every analyzed turn for analyze.py",
+              type=click.Path(file_okay=False))
+@click.option("--server", default=None, help="Unix socket of an analysis server (analysis_server.py serve) which calculates "
+                                             "the turns, only --strategy, --depth and --time-budget are passed on",
+              type=click.Path(dir_okay=False))
+def go_play(url, strategy, depth, tt_size, time_budget, workers, split_ply, iterations, endgame_distance, stats, profile,
+            verify_aggregates, cache, cache_size, live, wait, ponder, snapshot_dir, server):
+    if server is not None and ponder:
+        raise click.UsageError("--ponder needs the search in this process, it does not work with --server")
     options = Options()
     options.add_argument('--headless')
     click.clear()
+    game = parse_qs(urlparse(url).query).get("table", ["game"])[0]
     with Firefox(options=options) as driver:
-        click.echo(f"Using {strategy} algorithm with depth {depth}")
-        strategy = engine_stragegies.strategies[strategy.lower()]
+        if server is None:
+            strategy, depth = configure_strategy(strategy, depth, tt_size, time_budget, workers, split_ply, iterations,
+                                                 endgame_distance, stats, verify_aggregates, cache, cache_size)
+        ponderer = Ponderer(strategy) if wait and ponder else None
+        sync = GameSync()
         click.echo(f"Starting Browser...")
         driver.start_client()
         click.echo(f"Trying to connect to {url}... (this takes a while)")
@@ -124,15 +78,16 @@ def go_play(url, strategy, depth, wait):
         click.clear()
         while True:
             print_delimiter()
-            turn, patches, token_position, players = read_game_state(driver)
-            pieces, p1, p2, track = init_game(patches, token_position, players)
-            print_delimiter(True)
-            print_game_status(p1, p2, track)
-            timer = timeit.default_timer()
-            calculated_game_state: GameState = strategy.calculate_turn(p1, p2, pieces, track, depth)
-            click.secho(f"Time needed: {timeit.default_timer() - timer}\n")
-            calculated_game_state.print_outcome()
+            turn, game_data = read_game_data(driver, snapshot_dir, game)
+            if server is not None:
+                calculated_game_state = analyze_remote(server, strategy, depth, time_budget, game_data)
+            else:
+                game_state = sync.update(game_data)
+                click.echo(sync.summary())
+                calculated_game_state = analyze(strategy, depth, time_budget, game_state, profile, ponderer, live)
             if wait:
+                if ponderer is not None and calculated_game_state is not None:
+                    ponderer.start(calculated_game_state)
                 wait_for_player_choice(turn, driver)
             else:
                 break
@@ -0,0 +1,203 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# A quilt board is an int with bit row * SIZE + column set for every covered cell
+SIZE = 9
+CELLS = SIZE * SIZE
+FULL = (1 << CELLS) - 1
+BONUS_SIZE = 7
+
+# Shapes of the patches by (button cost, time cost, button income, size), the stats gamedatas has in token_types
+SHAPES: Dict[Tuple[int, int, int, int], Tuple[str, ...]] = {
+    (2, 1, 0, 2): ("XX",),
+    (2, 2, 0, 3): ("XXX",),
+    (3, 1, 0, 3): ("XX", "X."),
+    (1, 3, 0, 3): ("XX", ".X"),
+    (3, 3, 1, 4): ("XXXX",),
+    (2, 2, 0, 4): ("XXX", ".X."),
+    (6, 5, 2, 4): ("XX", "XX"),
+    (4, 6, 2, 4): ("XXX", "X.."),
+    (4, 2, 1, 4): ("X..", "XXX"),
+    (3, 2, 1, 4): (".XX", "XX."),
+    (7, 6, 3, 4): ("X.", "XX", ".X"),
+    (1, 2, 0, 5): ("X.X", "XXX"),
+    (2, 3, 1, 5): ("X..", "XXX", "..X"),
+    (5, 5, 2, 5): ("XXX", ".X.", ".X."),
+    (5, 4, 2, 5): (".X.", "XXX", ".X."),
+    (10, 3, 2, 5): ("X...", "XXXX"),
+    (7, 1, 1, 5): ("XXXXX",),
+    (1, 4, 1, 5): ("XXX.", "..XX"),
+    (3, 4, 1, 5): ("XXXX", ".X.."),
+    (10, 4, 3, 5): ("XX.", "XXX"),
+    (8, 6, 3, 5): ("XXX", "XX."),
+    (0, 3, 1, 6): (".X.", "XXX", "X.X"),
+    (2, 3, 0, 6): ("X.X.", "XXXX"),
+    (7, 2, 2, 6): ("XXXX", "X..X"),
+    (4, 2, 0, 6): ("XX..", ".XXX", ".X.."),
+    (10, 5, 3, 6): ("XXXX", "XX.."),
+    (1, 5, 1, 6): ("X...", "XXXX", "X..."),
+    (5, 3, 1, 6): (".XX.", "XXXX"),
+    (3, 6, 2, 6): (".X..", "XXXX", ".X.."),
+    (1, 2, 0, 7): ("X.X", "XXX", "X.X"),
+    (2, 1, 0, 6): (".X.", "XXX", ".X.", ".X."),
+    (7, 4, 2, 7): ("X..", "XXX", "XXX"),
+    (10, 5, 3, 7): (".X.", ".X.", "XXX", ".X.", ".X."),
+}
+# Shape of the special 1x1 patches
+SINGLE = ("X",)
+
+
+def orientations(shape: Tuple[str, ...]) -> List[Tuple[Tuple[int, int], ...]]:
+    """Distinct rotations and reflections of a shape as sorted (row, column) cells, moved to the top left corner"""
+    cells = [(row, column) for row, line in enumerate(shape) for column, cell in enumerate(line) if cell == "X"]
+    result = []
+    for _ in range(2):
+        for _ in range(4):
+            cells = [(column, -row) for row, column in cells]
+            top, left = min(row for row, _ in cells), min(column for _, column in cells)
+            normalized = tuple(sorted((row - top, column - left) for row, column in cells))
+            if normalized not in result:
+                result.append(normalized)
+        cells = [(row, -column) for row, column in cells]
+    return result
+
+
+class Placements:
+    """
+    Every way to put one shape on a quilt. The placement a player makes is the first fit: the lowest anchor (top left
+    corner of the bounding box in row-major order) at which one of the orientations fits, the first orientation there.
+    First fits are memoized per quilt, a search asks for the same quilts over and over.
+    """
+    CACHE_ENTRIES = 1 << 16
+
+    def __init__(self, shape: Tuple[str, ...]):
+        self.shape = shape
+        self.size = sum(line.count("X") for line in shape)
+        # per orientation: cell offsets from the anchor, mask at anchor 0 and the anchors at which it is on the board
+        self.orientations: List[Tuple[Tuple[int, ...], int, int]] = []
+        for cells in orientations(shape):
+            height, width = max(row for row, _ in cells) + 1, max(column for _, column in cells) + 1
+            offsets = tuple(row * SIZE + column for row, column in cells)
+            anchors = 0
+            for row in range(SIZE - height + 1):
+                for column in range(SIZE - width + 1):
+                    anchors |= 1 << (row * SIZE + column)
+            self.orientations.append((offsets, sum(1 << offset for offset in offsets), anchors))
+        self.__cache: Dict[int, Optional[int]] = {}
+
+    @property
+    def masks(self) -> List[int]:
+        """Masks of all placements in first fit order"""
+        return [mask << anchor for anchor in range(CELLS)
+                for _, mask, anchors in self.orientations if anchors >> anchor & 1]
+
+    def first_fit(self, quilt: int) -> Optional[int]:
+        """:return: Mask of the cells the shape covers when placed on quilt, None if it does not fit anywhere"""
+        cache = self.__cache
+        if quilt in cache:
+            return cache[quilt]
+        free = ~quilt & FULL
+        best_anchor, best_mask = CELLS, None
+        for offsets, mask, anchors in self.orientations:
+            fits = anchors
+            for offset in offsets:
+                fits &= free >> offset
+                if not fits:
+                    break
+            else:
+                anchor = (fits & -fits).bit_length() - 1
+                if anchor < best_anchor:
+                    best_anchor, best_mask = anchor, mask << anchor
+        if len(cache) >= self.CACHE_ENTRIES:
+            cache.clear()
+        cache[quilt] = best_mask
+        return best_mask
+
+    def fits(self, quilt: int) -> bool:
+        return self.first_fit(quilt) is not None
+
+    def __reduce__(self):
+        # unpickled as the shared instance of the process, without the memoized fits
+        return placements, (self.shape, self.size)
+
+
+class LooseCells:
+    """Placements of a patch whose shape is unknown: it covers the lowest free cells, it fits if there are enough"""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def first_fit(self, quilt: int) -> Optional[int]:
+        mask = 0
+        free = ~quilt & FULL
+        for _ in range(self.size):
+            if not free:
+                return None
+            cell = free & -free
+            mask |= cell
+            free ^= cell
+        return mask
+
+    def fits(self, quilt: int) -> bool:
+        return bin(~quilt & FULL).count("1") >= self.size
+
+
+def shape_of(button_cost: int, time_cost: int, button_income: int, size: int) -> Optional[Tuple[str, ...]]:
+    """:return: Shape of the patch with these stats, None if it is unknown"""
+    return SHAPES.get((button_cost, time_cost, button_income, size), SINGLE if size == 1 else None)
+
+
+_placements: Dict[Tuple[str, ...], Placements] = {}
+
+
+def placements(shape: Optional[Tuple[str, ...]], size: int):
+    """:return: Placements of a shape, shared by all patches of the same shape"""
+    if shape is None:
+        return LooseCells(size)
+    if shape not in _placements:
+        _placements[shape] = Placements(shape)
+    return _placements[shape]
+
+
+def shape_array(shape: Optional[Tuple[str, ...]], size: int) -> np.ndarray:
+    """Shape as 0/1 array, a row of size cells if it is unknown"""
+    if shape is None:
+        return np.ones((1, size), dtype=int)
+    return np.array([[1 if cell == "X" else 0 for cell in line] for line in shape], dtype=int)
+
+
+# The 7x7 bonus goes to the first player who covers one of these squares completely
+BONUS_SQUARES = tuple(sum(1 << ((top + row) * SIZE + left + column) for row in range(BONUS_SIZE) for column in range(BONUS_SIZE))
+                      for top in range(SIZE - BONUS_SIZE + 1) for left in range(SIZE - BONUS_SIZE + 1))
+
+
+def completes_bonus_square(quilt: int, placed: int) -> bool:
+    """
+    Whether placing the cells placed completed a 7x7 square of quilt (which includes them). Squares which were
+    complete before, e.g. in a rebuilt quilt, do not count.
+    """
+    for square in BONUS_SQUARES:
+        if placed & square and quilt & square == square:
+            return True
+    return False
+
+
+def pack(patch_placements: List, covered: int) -> int:
+    """
+    Rebuilds a quilt from the patches a player owns (their positions are not in the gamedatas): first fit of the
+    largest patches first. If that does not cover exactly covered cells, the first covered cells in row-major order.
+    """
+    quilt = 0
+    for placement in sorted(patch_placements, key=lambda placement: -placement.size):
+        mask = placement.first_fit(quilt)
+        if mask is None:
+            break
+        quilt |= mask
+    if bin(quilt).count("1") != covered:
+        return (1 << min(max(covered, 0), CELLS)) - 1
+    return quilt
+
+
+def show(quilt: int) -> str:
+    return "\n".join("".join("X" if quilt >> (row * SIZE + column) & 1 else "." for column in range(SIZE)) for row in range(SIZE))
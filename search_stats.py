@@ -0,0 +1,122 @@
+import copy
+import timeit
+from typing import Callable, Dict, List, Optional
+
+from components import GameState, TurnAction, Player, Market, TimeTrack
+from transposition import TranspositionTable
+
+
+class SearchStats:
+    """
+    Counters and timers of one calculate_turn. Only collected while EngineStrategy.stats is set, the search then runs
+    on an InstrumentedGameState.
+    """
+
+    def __init__(self):
+        self.nodes_per_ply: List[int] = []
+        self.action_checks = 0
+        self.pruned_actions = 0
+        self.times: Dict[str, float] = {}
+        # Counters of the transposition table when the search started, it keeps counting across turns
+        self.table_baseline = (0, 0)
+
+    def reset(self):
+        self.__init__()
+
+    def count_node(self, ply: int):
+        while len(self.nodes_per_ply) <= ply:
+            self.nodes_per_ply.append(0)
+        self.nodes_per_ply[ply] += 1
+
+    def add_time(self, category: str, seconds: float):
+        self.times[category] = self.times.get(category, 0.0) + seconds
+
+    def timed(self, category: str, function: Callable) -> Callable:
+        def _timed(*args, **kwargs):
+            start = timeit.default_timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add_time(category, timeit.default_timer() - start)
+
+        return _timed
+
+    @property
+    def nodes(self) -> int:
+        return sum(self.nodes_per_ply)
+
+    @property
+    def effective_branching_factor(self) -> float:
+        """b with b + b^2 + ... + b^d = nodes for the deepest ply d, found by bisection"""
+        depth = len(self.nodes_per_ply) - 1
+        if depth < 1:
+            return 0.0
+        low, high = 1.0, float(max(self.nodes, 1))
+        for _ in range(60):
+            branching = (low + high) / 2
+            if sum(branching ** ply for ply in range(1, depth + 1)) < self.nodes:
+                low = branching
+            else:
+                high = branching
+        return low
+
+    def start_table(self, table: Optional[TranspositionTable]):
+        self.table_baseline = (table.hits, table.misses) if table is not None else (0, 0)
+
+    def summary(self, total_time: float, cutoffs: Optional[int] = None, table: Optional[TranspositionTable] = None) -> str:
+        """Summary table, nodes of worker processes are not included"""
+        lines = ["Nodes per ply of all iterations in this process:", f"{'Ply':>5} {'Nodes':>10} {'Branching':>10}"]
+        for ply in range(1, len(self.nodes_per_ply)):
+            nodes = self.nodes_per_ply[ply]
+            previous = self.nodes_per_ply[ply - 1] if ply > 1 else 1
+            lines.append(f"{ply:>5} {nodes:>10} {nodes / previous if previous else 0.0:>10.2f}")
+        lines.append(f"Nodes: {self.nodes}, effective branching factor: {self.effective_branching_factor:.2f}")
+        lines.append(f"Actions checked: {self.action_checks}, pruned by turn_action_possible: {self.pruned_actions}")
+        if cutoffs is not None:
+            lines.append(f"Cutoffs: {cutoffs}")
+        if table is not None:
+            hits, misses = table.hits - self.table_baseline[0], table.misses - self.table_baseline[1]
+            lines.append(f"TT hits: {hits}/{hits + misses} ({hits / max(hits + misses, 1):.1%})")
+        measured = sum(self.times.values())
+        lines.append("Time: " + ", ".join(f"{category} {seconds:.3f}s ({seconds / max(total_time, 1e-9):.0%})"
+                                          for category, seconds in sorted(self.times.items()))
+                     + f", other {max(total_time - measured, 0.0):.3f}s of {total_time:.3f}s")
+        return "\n".join(lines)
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class InstrumentedGameState(GameState):
+    """GameState which counts every applied turn per ply, the action checks and the time spent in apply/undo"""
+
+    def __init__(self, p1: Player, p2: Player, market: Market, track: TimeTrack, stats: SearchStats):
+        super().__init__(p1, p2, market, track)
+        self.stats = stats
+
+    def apply(self, turn_action: TurnAction):
+        start = timeit.default_timer()
+        super().apply(turn_action)
+        self.stats.add_time("execute", timeit.default_timer() - start)
+        self.stats.count_node(self.ply)
+
+    def undo(self):
+        start = timeit.default_timer()
+        super().undo()
+        self.stats.add_time("execute", timeit.default_timer() - start)
+
+    def turn_action_possible(self, turn_action) -> bool:
+        possible = super().turn_action_possible(turn_action)
+        self.stats.action_checks += 1
+        if not possible:
+            self.stats.pruned_actions += 1
+        return possible
+
+    def __deepcopy__(self, memo):
+        """Copies are plain GameStates, e.g. the replayed result or the subtrees sent to worker processes"""
+        copied = GameState.__new__(GameState)
+        memo[id(self)] = copied
+        for key, value in self.__dict__.items():
+            if key != "stats":
+                copied.__dict__[key] = copy.deepcopy(value, memo)
+        return copied
@@ -0,0 +1,32 @@
+import random
+from typing import Iterator
+
+import pytest
+
+from benchmark import fixture_names, load_fixture
+from components import GameState, TurnAction
+
+# Random games played from every fixture
+GAMES = 10
+
+
+def start_position(name: str) -> GameState:
+    market, p1, p2, track = load_fixture(name)
+    game_state = GameState(p1, p2, market, track)
+    game_state.determine_active_player()
+    return game_state
+
+
+def random_game(game_state: GameState, rng: random.Random) -> Iterator[TurnAction]:
+    """Applies random possible turns until the game ends, yields every turn after it was applied"""
+    while not game_state.game_end():
+        turn_action = rng.choice([turn_action for turn_action in TurnAction if game_state.turn_action_possible(turn_action)])
+        game_state.apply(turn_action)
+        yield turn_action
+
+
+@pytest.fixture(params=[(name, seed) for name in fixture_names() for seed in range(GAMES)], ids=lambda param: f"{param[0]}-{param[1]}")
+def game(request):
+    """Start position of a fixture and the random number generator of one game"""
+    name, seed = request.param
+    return start_position(name), random.Random(seed)
@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import pytest
+
+from analysis_server import AnalysisService
+from benchmark import FIXTURES_DIR
+
+
+def fixture_snapshot() -> dict:
+    with open(FIXTURES_DIR / "mid.json") as file:
+        return json.load(file)
+
+
+def drop_player(game_data: dict):
+    game_data["players"].popitem()
+
+
+def cut_time_marker(game_data: dict):
+    token = next(token for key, token in game_data["tokens"].items() if key.startswith("timemarker_"))
+    token["location"] = "timetrack"
+
+
+def drop_neutral_token(game_data: dict):
+    del game_data["tokens"]["token_neutral"]
+
+
+def drop_counters(game_data: dict):
+    game_data["counters"] = {}
+
+
+def drop_patch_types(game_data: dict):
+    game_data["token_types"] = {}
+
+
+@pytest.fixture
+def service():
+    service = AnalysisService(processes=1)
+    yield service
+    service.close()
+
+
+async def collect(service: AnalysisService, request: dict) -> list:
+    return [event async for event in service.analyze(request)]
+
+
+@pytest.mark.parametrize("truncate", [drop_player, cut_time_marker, drop_neutral_token, drop_counters, drop_patch_types])
+def test_truncated_gamedatas_is_answered_with_an_error(service, truncate):
+    snapshot = fixture_snapshot()
+    truncate(snapshot["gamedatas"])
+    events = asyncio.run(collect(service, {"snapshot": snapshot}))
+    assert [event["event"] for event in events] == ["error"]
+    assert events[0]["message"].startswith("Invalid request")
+    assert service.searches == 0
+
+
+def test_missing_snapshot_is_answered_with_an_error(service):
+    events = asyncio.run(collect(service, {}))
+    assert [event["event"] for event in events] == ["error"]
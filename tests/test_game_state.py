@@ -0,0 +1,78 @@
+from compact_state import StateCodec
+from components import GameState, Zobrist
+from conftest import random_game
+
+
+def snapshot(game_state: GameState) -> tuple:
+    """Everything apply changes"""
+    players = []
+    for player in (game_state.active_player, game_state.passive_player):
+        players.append((player.player_number, player.location, player.location_top, player.button_count,
+                        player.button_production, player.empty_spaces, player.owns_special7x7, player.quilt,
+                        player.quilt_hash, player.score, player.remaining_income_phases,
+                        sorted(patch.id_ for patch in player.owned_patches)))
+    market = game_state.market
+    return tuple(players), market.offset, market.removed, len(market), [patch.id_ for patch in market.get_patch_choices()], \
+        [patch.id_ for patch in market.get_remaining_patches()], game_state.time_track.claimed, game_state.hash_key, \
+        game_state.ply
+
+
+def full_hash(game_state: GameState) -> int:
+    """Zobrist hash of the position computed from scratch"""
+    return Zobrist.player(game_state.active_player) ^ Zobrist.player(game_state.passive_player) \
+        ^ Zobrist.market(game_state.market) ^ Zobrist.key("active", game_state.active_player.player_number) \
+        ^ Zobrist.key("claimed", game_state.time_track.claimed)
+
+
+def test_incremental_hash_matches_full_hash(game):
+    game_state, rng = game
+    assert game_state.hash_key == full_hash(game_state)
+    for _ in random_game(game_state, rng):
+        assert game_state.hash_key == full_hash(game_state)
+    while game_state.ply:
+        game_state.undo()
+        assert game_state.hash_key == full_hash(game_state)
+
+
+def test_undo_restores_every_ply(game):
+    game_state, rng = game
+    snapshots = [snapshot(game_state)]
+    for _ in random_game(game_state, rng):
+        snapshots.append(snapshot(game_state))
+    while game_state.ply:
+        game_state.undo()
+        snapshots.pop()
+        assert snapshot(game_state) == snapshots[-1]
+
+
+def test_rewind_restores_the_root(game):
+    game_state, rng = game
+    root = snapshot(game_state)
+    for _ in random_game(game_state, rng):
+        pass
+    game_state.rewind(0)
+    assert snapshot(game_state) == root
+
+
+def test_clear_undo_makes_the_position_the_root(game):
+    game_state, rng = game
+    turns = random_game(game_state, rng)
+    for _ in zip(range(rng.randrange(1, 20)), turns):
+        pass
+    game_state.clear_undo()
+    assert game_state.ply == 0
+    root = snapshot(game_state)
+    for _ in turns:
+        pass
+    game_state.rewind(0)
+    assert snapshot(game_state) == root
+
+
+def test_codec_round_trip_keeps_the_position(game):
+    game_state, rng = game
+    codec = StateCodec(game_state)
+    for _ in random_game(game_state, rng):
+        state = codec.encode(game_state)
+        decoded = codec.decode(state)
+        assert decoded.hash_key == game_state.hash_key
+        assert codec.encode(decoded) == state
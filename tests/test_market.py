@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from benchmark import fixture_names, load_fixture
+from components import Market, TurnAction
+
+PATCH_ACTIONS = (TurnAction.PATCH_1, TurnAction.PATCH_2, TurnAction.PATCH_3)
+
+
+def patch_order(market: Market) -> list:
+    """Ids of the patches left, in market order starting with the choices"""
+    return [patch.id_ for patch in market.get_patch_choices()] + [patch.id_ for patch in market.get_remaining_patches()]
+
+
+def take_from_list(order: list, choice_index: int) -> list:
+    """The market as a plain list: the order continues behind the taken patch, the patches in front of it move to the end"""
+    return order[choice_index + 1:] + order[:choice_index]
+
+
+@pytest.fixture(params=fixture_names())
+def market(request) -> Market:
+    return load_fixture(request.param)[0]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_taking_until_exhausted_matches_list(market, seed):
+    rng = random.Random(seed)
+    order = patch_order(market)
+    while order:
+        turn_action = rng.choice(PATCH_ACTIONS[:len(order)])
+        taken = market.take_patch(turn_action)
+        assert taken.id_ == order[int(turn_action)]
+        order = take_from_list(order, int(turn_action))
+        assert patch_order(market) == order
+        assert len(market) == len(order)
+
+    assert market.first_patch() is None
+    assert market.get_patch_choices() == []
+    assert list(market.get_remaining_patches()) == []
+    with pytest.raises(IndexError):
+        market.take_patch(TurnAction.PATCH_1)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_undo_restores_order(market, seed):
+    rng = random.Random(seed)
+    orders, taken = [], []
+    while len(market):
+        orders.append((patch_order(market), market.offset, market.removed))
+        turn_action = rng.choice(PATCH_ACTIONS[:len(market)])
+        taken.append((turn_action, market.take_patch(turn_action)))
+    while taken:
+        market.undo_take_patch(*taken.pop())
+        assert (patch_order(market), market.offset, market.removed) == orders.pop()
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_from_layout_continues_like_the_original(market, seed):
+    rng = random.Random(seed)
+    for _ in range(rng.randrange(len(market))):
+        market.take_patch(rng.choice(PATCH_ACTIONS[:len(market)]))
+
+    rebuilt = Market.from_layout(market.patch_table, market.ring, market.offset, market.removed)
+    assert patch_order(rebuilt) == patch_order(market)
+    assert len(rebuilt) == len(market)
+    while len(market):
+        turn_action = rng.choice(PATCH_ACTIONS[:len(market)])
+        assert rebuilt.take_patch(turn_action) is market.take_patch(turn_action)
+        assert (patch_order(rebuilt), rebuilt.offset, rebuilt.removed) == (patch_order(market), market.offset, market.removed)
+
+
+def test_neighbours_skip_removed_patches(market):
+    rng = random.Random(0)
+    while len(market) > 3:
+        order = patch_order(market)
+        for index in range(3):
+            predecessor, successor = market.neighbours(index)
+            assert (predecessor.id_, successor.id_) == (order[index - 1], order[(index + 1) % len(order)])
+        market.take_patch(rng.choice(PATCH_ACTIONS))
+    assert bin(market.removed).count("1") == len(market.ring) - len(market)
+
+
+def test_advance_is_no_patch(market):
+    with pytest.raises(ValueError):
+        market.take_patch(TurnAction.ADVANCE)
@@ -0,0 +1,155 @@
+import itertools
+
+import pytest
+
+from compact_state import StateCodec
+from components import GameState, TurnAction
+from conftest import random_game
+from engine_stragegies import INFINITY, AlphaBetaStrategy, EngineStrategy, GreedyFourCoreStrategy, GreedySingleCoreStrategy, \
+    ParallelAlphaBetaStrategy
+from transposition import TranspositionTable
+
+# Every EVERY_PLY-th position of the random games is searched, the deepest with max_depth MAX_DEPTH (MAX_DEPTH + 1 plies)
+EVERY_PLY = 3
+MAX_DEPTH = 4
+
+
+class SerialPool:
+    """Runs the pool tasks of a search in this process"""
+
+    @staticmethod
+    def starmap(function, payloads, chunksize=1):
+        return list(itertools.starmap(function, payloads))
+
+
+def minimax(game_state: GameState, plies: int) -> int:
+    """Value for the player to move without pruning, the reference of the alpha-beta searches"""
+    if game_state.game_end() or plies == 0:
+        return EngineStrategy.evaluate(game_state)
+    mover = game_state.active_player
+    best_value = -INFINITY
+    for turn_action in TurnAction:
+        if not game_state.turn_action_possible(turn_action):
+            continue
+        game_state.apply(turn_action)
+        value = minimax(game_state, plies - 1)
+        best_value = max(best_value, value if game_state.active_player is mover else -value)
+        game_state.undo()
+    return best_value
+
+
+def line_value(game_state: GameState, line) -> int:
+    """Value for the player to move after playing line, game_state is left unchanged"""
+    root_ply = game_state.ply
+    mover = game_state.active_player
+    for turn_action in line:
+        game_state.apply(turn_action)
+    value = EngineStrategy.evaluate(game_state)
+    if game_state.active_player is not mover:
+        value = -value
+    game_state.rewind(root_ply)
+    return value
+
+
+def positions(game):
+    game_state, rng = game
+    yield game_state
+    for _ in random_game(game_state, rng):
+        if game_state.ply % EVERY_PLY == 0 and not game_state.game_end():
+            yield game_state
+
+
+@pytest.mark.parametrize("table", [False, True], ids=["plain", "table"])
+def test_alpha_beta_matches_minimax(game, table):
+    strategy = AlphaBetaStrategy()
+    # like in a game the table is kept across turns, its entries come from searches of other windows
+    strategy.transposition_table = TranspositionTable(1024 * 1024) if table else None
+    for game_state in positions(game):
+        # the state search_turn leaves before iterative deepening, the killers carry over between depths
+        strategy.killers = [[] for _ in range(MAX_DEPTH + 2)]
+        strategy.principal_variation = []
+        root_ply = game_state.ply
+        for depth in range(MAX_DEPTH + 1):
+            value, line = strategy.negamax(game_state, depth + 1, 0, -INFINITY, INFINITY, True)
+            assert game_state.ply == root_ply
+            assert value == minimax(game_state, depth + 1)
+            strategy.principal_variation = strategy.complete_line(game_state, line, depth + 1)
+            if not table:
+                assert line_value(game_state, line) == value
+
+
+@pytest.mark.parametrize("split_ply", [1, 2])
+def test_parallel_alpha_beta_matches_minimax(game, split_ply):
+    strategy = ParallelAlphaBetaStrategy(split_ply)
+    for game_state in positions(game):
+        codec = StateCodec(game_state)
+        # the tasks search without a table, one ply less covers the combination at and below the split ply
+        for depth in range(MAX_DEPTH):
+            line = strategy.search_parallel(SerialPool(), codec, game_state, depth)
+            assert line_value(game_state, line) == minimax(game_state, depth + 1)
+
+
+@pytest.mark.parametrize("split_ply", [0, 1, 2])
+def test_greedy_four_core_matches_single_core(game, split_ply):
+    single_core = GreedySingleCoreStrategy()
+    four_core = GreedyFourCoreStrategy(split_ply)
+    for game_state in positions(game):
+        codec = StateCodec(game_state)
+        for depth in range(MAX_DEPTH):
+            assert four_core.calculate_root(SerialPool(), codec, game_state, depth) == \
+                single_core.calculate_state(game_state, depth, 0)[1]
+
+
+def test_greedy_table_keeps_the_line(game):
+    plain = GreedySingleCoreStrategy()
+    with_table = GreedySingleCoreStrategy()
+    # kept across turns like in a game, lines are cut at the entries and completed from the table
+    with_table.transposition_table = TranspositionTable(1024 * 1024)
+    for game_state in positions(game):
+        for depth in range(MAX_DEPTH + 1):
+            assert with_table.search(game_state, depth) == plain.search(game_state, depth)
+
+
+def solve(game_state: GameState, codec: StateCodec, memo) -> int:
+    """Final score difference for the player to move, every position to the end of the game is searched once"""
+    if game_state.game_end():
+        return EngineStrategy.evaluate(game_state)
+    state = codec.encode(game_state)
+    if state not in memo:
+        mover = game_state.active_player
+        best_value = -INFINITY
+        for turn_action in TurnAction:
+            if not game_state.turn_action_possible(turn_action):
+                continue
+            game_state.apply(turn_action)
+            value = solve(game_state, codec, memo)
+            best_value = max(best_value, value if game_state.active_player is mover else -value)
+            game_state.undo()
+        memo[state] = best_value
+    return memo[state]
+
+
+def test_endgame_margins_match_exhaustive_search(game):
+    strategy = AlphaBetaStrategy()
+    game_state, rng = game
+    for _ in random_game(game_state, rng):
+        if game_state.game_end() or strategy.remaining_distance(game_state) > strategy.endgame_distance:
+            continue
+        root_ply = game_state.ply
+        mover = game_state.active_player
+        result = strategy.solve_endgame(game_state)
+        assert game_state.ply == root_ply
+
+        codec = StateCodec(game_state)
+        memo = {}
+        margins = {}
+        for turn_action in TurnAction:
+            if game_state.turn_action_possible(turn_action):
+                game_state.apply(turn_action)
+                value = solve(game_state, codec, memo)
+                margins[turn_action] = value if game_state.active_player is mover else -value
+                game_state.undo()
+        assert {turn_action: stats["proven margin"] for turn_action, stats in result.action_stats.items()} == margins
+        # the returned line is played to the end of the game and reaches the best margin
+        assert result.game_end()
+        assert line_value(game_state, [entry["turn_action"] for entry in result.history]) == max(margins.values())
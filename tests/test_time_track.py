@@ -0,0 +1,46 @@
+import pytest
+
+from components import TimeTrack
+
+
+def triggers_income_triggers_special_patch(starting_position: int, steps_to_progress_on_track: int) -> (bool, bool):
+    """The trigger check TimeTrack had before the crossing tables"""
+    ending_position = starting_position + steps_to_progress_on_track
+
+    def _triggers(l: [int]):
+        for i in l:
+            if i < starting_position:
+                continue
+            elif i > ending_position:
+                return False
+            else:
+                return True
+
+    return _triggers(TimeTrack._income_locations), _triggers(TimeTrack._special_spot_locations)
+
+
+@pytest.mark.parametrize("start", range(TimeTrack._goal_id + 1))
+def test_crossings_match_count(start):
+    for steps in range(TimeTrack._goal_id + 2):
+        assert TimeTrack.crossings(start, steps) == TimeTrack.count_crossings(start, steps)
+
+
+@pytest.mark.parametrize("start", range(TimeTrack._goal_id + 1))
+def test_crossings_match_former_triggers(start):
+    # the former check counted the starting position, so it has to match at start + 1 with one step less
+    for steps in range(TimeTrack._goal_id + 2):
+        income_phases, spots = TimeTrack.crossings(start, steps)
+        triggered = triggers_income_triggers_special_patch(start + 1, steps - 1)
+        assert (income_phases > 0, spots > 0) == (bool(triggered[0]), bool(triggered[1]))
+
+
+def test_several_income_phases_are_counted():
+    assert TimeTrack.crossings(4, 14)[0] == 3
+
+
+def test_special_patch_is_taken_once():
+    track = TimeTrack()
+    assert track.claim(TimeTrack.crossings(20, 13)[1]) == 2
+    assert track.claim(TimeTrack.crossings(25, 10)[1]) == 0
+    assert track.claim(TimeTrack.crossings(30, 10)[1]) == 1
+    assert track.claimed == 0b111
@@ -0,0 +1,246 @@
+import copy
+import itertools
+import json
+import math
+import random
+import timeit
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import click
+
+import engine_stragegies
+import worker_pool
+from compact_state import StateCodec
+from components import GameState, Market
+from game_data import parse_game_data, load_snapshot, init_game
+from transposition import TranspositionTable
+
+ELO_BASE = 1500
+
+
+class Engine(NamedTuple):
+    """A strategy with its search settings, written as strategy:depth or strategy:depth:seconds"""
+    strategy: str
+    depth: int
+    time_budget: Optional[float] = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "Engine":
+        name, _, rest = spec.partition(":")
+        if name.lower() not in engine_stragegies.strategies:
+            raise click.BadParameter(f"Unknown strategy {name}, choose from {', '.join(engine_stragegies.strategies)}")
+        depth, _, seconds = rest.partition(":")
+        return cls(name.lower(), int(depth) if depth else 3, float(seconds) if seconds else None)
+
+    def __str__(self):
+        return f"{self.strategy}:{self.depth}" + (f":{self.time_budget:g}" if self.time_budget is not None else "")
+
+
+class GameTask(NamedTuple):
+    game: int
+    first: Engine
+    second: Engine
+    # Market order of the game, None for the order of the start position
+    ring: Optional[Tuple[int, ...]]
+
+
+def start_position(game_data: Dict, ring: Optional[Tuple[int, ...]] = None) -> GameState:
+    market, p1, p2, track = init_game(*parse_game_data(copy.deepcopy(game_data)))
+    if ring is not None:
+        market = Market.from_layout(market.patch_table, ring, market.offset, market.removed)
+    game_state = GameState(p1, p2, market, track)
+    game_state.determine_active_player()
+    return game_state
+
+
+def shuffled_ring(game_state: GameState, rng: random.Random) -> Tuple[int, ...]:
+    """The market order of game_state with its remaining patches in random order"""
+    market = game_state.market
+    available = [index for index in range(len(market.ring)) if not market.removed & (1 << index)]
+    ids = [market.ring[index] for index in available]
+    rng.shuffle(ids)
+    ring = list(market.ring)
+    for index, id_ in zip(available, ids):
+        ring[index] = id_
+    return tuple(ring)
+
+
+# Start position and search settings of a tournament worker process, set by _init_worker
+_game_data: Optional[Dict] = None
+_table_bytes = 0
+
+
+def _init_worker(game_data: Dict, table_bytes: int, search_workers: int):
+    global _game_data, _table_bytes
+    _game_data, _table_bytes = game_data, table_bytes
+    # strategies which search on the worker pool get their own small pool in every tournament process
+    worker_pool.configure(search_workers, table_bytes)
+
+
+def _new_strategy(engine: Engine) -> engine_stragegies.EngineStrategy:
+    strategy = type(engine_stragegies.strategies[engine.strategy])()
+    if _table_bytes:
+        strategy.transposition_table = TranspositionTable(_table_bytes)
+    return strategy
+
+
+def play_game(task: GameTask) -> Dict:
+    """
+    Plays a whole game, the first engine moves first. Every turn is calculated on a position decoded from the current
+    state, so the engine maximizes the score of the player to move.
+    :return: Result record as written to the JSON-lines file
+    """
+    game_state = start_position(_game_data, task.ring)
+    codec = StateCodec(game_state)
+    numbers = {game_state.active_player.player_number: 0, game_state.passive_player.player_number: 1}
+    engines = (task.first, task.second)
+    strategies = (_new_strategy(task.first), _new_strategy(task.second))
+    seconds, moves = [0.0, 0.0], [0, 0]
+
+    while not game_state.game_end():
+        side = numbers[game_state.active_player.player_number]
+        position = codec.decode(codec.encode(game_state))
+        timer = timeit.default_timer()
+        calculated = strategies[side].calculate_turn(position.active_player, position.passive_player, position.market,
+                                                     position.time_track, engines[side].depth, engines[side].time_budget)
+        seconds[side] += timeit.default_timer() - timer
+        moves[side] += 1
+        game_state.apply(calculated.history[0]["turn_action"])
+
+    players = sorted((game_state.active_player, game_state.passive_player), key=lambda player: numbers[player.player_number])
+    scores = [player.score for player in players]
+    return {
+        "game": task.game,
+        "first": str(task.first),
+        "second": str(task.second),
+        "ring": list(game_state.market.ring),
+        "scores": scores,
+        "margin": scores[0] - scores[1],
+        "winner": str(engines[0]) if scores[0] > scores[1] else str(engines[1]) if scores[1] > scores[0] else None,
+        "moves": moves,
+        "seconds": seconds,
+    }
+
+
+def schedule(engines: List[Engine], games: int, start: GameState, shuffle: bool, seed: int) -> List[GameTask]:
+    """
+    Every pair of engines plays games market orders, each of them twice so both engines move first once
+    """
+    rng = random.Random(seed)
+    tasks = []
+    for first, second in itertools.combinations(engines, 2):
+        for _ in range(games):
+            ring = shuffled_ring(start, rng) if shuffle else None
+            tasks.append(GameTask(len(tasks), first, second, ring))
+            tasks.append(GameTask(len(tasks), second, first, ring))
+    return tasks
+
+
+def elo_ratings(records: List[Dict], iterations: int = 200) -> Dict[str, float]:
+    """
+    Bradley-Terry fit of all games, draws count as half a win for both sides. Every pair of engines gets one
+    virtual draw, so an engine without wins still has a finite rating. The ratings average to ELO_BASE.
+    """
+    engines = sorted({record["first"] for record in records} | {record["second"] for record in records})
+    wins = {engine: 0.0 for engine in engines}
+    games: Dict[Tuple[str, str], float] = {}
+    for first, second in itertools.combinations(engines, 2):
+        games[first, second] = games[second, first] = 1.0
+        wins[first] += 0.5
+        wins[second] += 0.5
+    for record in records:
+        first, second = record["first"], record["second"]
+        games[first, second] += 1
+        games[second, first] += 1
+        if record["winner"] is None:
+            wins[first] += 0.5
+            wins[second] += 0.5
+        else:
+            wins[record["winner"]] += 1
+
+    strength = {engine: 1.0 for engine in engines}
+    for _ in range(iterations):
+        strength = {engine: wins[engine] / sum(games.get((engine, other), 0) / (strength[engine] + strength[other])
+                                               for other in engines if other != engine)
+                    for engine in engines}
+        mean = math.exp(sum(math.log(value) for value in strength.values()) / len(strength))
+        strength = {engine: value / mean for engine, value in strength.items()}
+    return {engine: ELO_BASE + 400 * math.log10(value) for engine, value in strength.items()}
+
+
+def summary(records: List[Dict]) -> List[str]:
+    """One line per engine: score (wins + draws / 2), average margin, Elo and time per move"""
+    ratings = elo_ratings(records) if records else {}
+    lines = []
+    for engine in sorted(ratings, key=ratings.get, reverse=True):
+        played = points = margin = seconds = moves = 0
+        for record in records:
+            for side, other in ((0, 1), (1, 0)):
+                if (record["first"], record["second"])[side] != engine:
+                    continue
+                played += 1
+                points += 1.0 if record["winner"] == engine else 0.5 if record["winner"] is None else 0.0
+                margin += record["scores"][side] - record["scores"][other]
+                seconds += record["seconds"][side]
+                moves += record["moves"][side]
+        lines.append(f"{engine:28} games: {played:4}, win rate: {points / played:6.1%}, average margin: {margin / played:+6.1f}, "
+                     f"Elo: {ratings[engine]:6.0f}, time per move: {seconds / max(moves, 1):.3f}s")
+    return lines
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument("snapshot", type=click.File("r"))
+@click.option("--engine", "-e", "engine_specs", multiple=True, required=True,
+              help="strategy:depth or strategy:depth:seconds, at least two")
+@click.option("--games", "-g", default=10, show_default=True, help="Market orders per pair of engines, each is played "
+                                                                   "with both engines moving first")
+@click.option("--shuffle/--no-shuffle", default=True, show_default=True, help="Random market orders instead of the one of SNAPSHOT")
+@click.option("--seed", default=0, show_default=True, type=int)
+@click.option("--processes", "-p", default=None, help="Games played at once [default: cpu count]", type=int)
+@click.option("--search-workers", default=1, show_default=True, help="Worker pool of the parallel strategies in every process", type=int)
+@click.option("--tt-size", default=0, show_default=True, help="Transposition table size in MB per engine, 0 disables it", type=int)
+@click.option("--output", "-o", default="tournament.jsonl", show_default=True, help="JSON-lines file, one result per game",
+              type=click.Path(dir_okay=False))
+def play(snapshot, engine_specs, games, shuffle, seed, processes, search_workers, tt_size, output):
+    """
+    Plays every pair of engines against each other from the position of SNAPSHOT (e.g. a game start recorded by
+    pw.py --snapshot-dir) and reports win rates, margins, Elo and time per move
+    """
+    engines = list(dict.fromkeys(Engine.parse(spec) for spec in engine_specs))
+    if len(engines) < 2:
+        raise click.BadParameter("At least two different engines are needed", param_hint="--engine")
+    _, game_data = load_snapshot(snapshot)
+    tasks = schedule(engines, games, start_position(game_data), shuffle, seed)
+    click.echo(f"{len(tasks)} games between {', '.join(map(str, engines))}")
+
+    records = []
+    with open(output, "w") as file, ProcessPoolExecutor(processes, initializer=_init_worker,
+                                                         initargs=(game_data, tt_size * 1024 * 1024, search_workers)) as pool:
+        for future in as_completed([pool.submit(play_game, task) for task in tasks]):
+            record = future.result()
+            records.append(record)
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            click.echo(f"[{len(records)}/{len(tasks)}] {record['first']} {record['scores'][0]} - "
+                       f"{record['scores'][1]} {record['second']}")
+    click.echo()
+    for line in summary(records):
+        click.echo(line)
+
+
+@cli.command()
+@click.argument("results", type=click.File("r"))
+def report(results):
+    """Summarizes a JSON-lines file of play"""
+    for line in summary([json.loads(line) for line in results if line.strip()]):
+        click.echo(line)
+
+
+if __name__ == "__main__":
+    cli()
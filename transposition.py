@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from enum import IntEnum
+from typing import Any, Optional
+
+from components import TurnAction
+
+
+class Bound(IntEnum):
+    EXACT = 0,
+    LOWER = 1,
+    UPPER = 2,
+
+
+class TTEntry:
+    __slots__ = ("depth", "value", "best_action", "bound")
+
+    def __init__(self, depth: int, value: Any, best_action: Optional[TurnAction], bound: Bound):
+        self.depth = depth
+        self.value = value
+        self.best_action = best_action
+        self.bound = bound
+
+
+class TranspositionTable:
+    """
+    Search results keyed by GameState.hash_key. Holds at most max_bytes worth of entries and evicts the least
+    recently used entry when full. A stored entry is only replaced by a result of at least the same depth.
+    """
+    # Size of one entry: dict slot, int key and TTEntry with a small value. Measured with tracemalloc after depth 6
+    # searches of the fixtures: about 190 bytes for alpha-beta (int value), 255 for greedy (pair of scores).
+    ENTRY_BYTES = 256
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.capacity = max(1, max_bytes // self.ENTRY_BYTES)
+        self.__entries: OrderedDict[int, TTEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def probe(self, key: int, depth: int) -> Optional[TTEntry]:
+        """:return: Entry for key if it was searched at least depth deep"""
+        entry = self.__entries.get(key)
+        if entry is None or entry.depth < depth:
+            self.misses += 1
+            return None
+        self.__entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def best_action(self, key: int) -> Optional[TurnAction]:
+        """Best action of any depth for move ordering, does not count as hit or miss"""
+        entry = self.__entries.get(key)
+        return entry.best_action if entry is not None else None
+
+    def store(self, key: int, depth: int, value: Any, best_action: Optional[TurnAction], bound: Bound = Bound.EXACT):
+        entry = self.__entries.get(key)
+        if entry is not None:
+            if entry.depth > depth:
+                return
+            self.__entries.move_to_end(key)
+        elif len(self.__entries) >= self.capacity:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+        self.__entries[key] = TTEntry(depth, value, best_action, bound)
+        self.stores += 1
+
+    @property
+    def hit_rate(self) -> float:
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def reset_stats(self):
+        self.hits = self.misses = self.stores = self.evictions = 0
+
+    def clear(self):
+        self.__entries.clear()
+        self.reset_stats()
+
+    def stats(self) -> str:
+        return f"TT: {len(self.__entries)}/{self.capacity} entries, hits: {self.hits}, misses: {self.misses}, " \
+               f"hit rate: {self.hit_rate:.1%}, evictions: {self.evictions}"
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key: int):
+        return key in self.__entries
@@ -0,0 +1,72 @@
+import atexit
+import ctypes
+import itertools
+import os
+from multiprocessing import Pool, RawValue
+from typing import Optional
+
+_pool: Optional[Pool] = None
+_workers: Optional[int] = None
+_table_bytes = 0
+# Searches on the pool are numbered and run one after another, the tasks of every search up to this number stop,
+# shared with the workers
+_cancelled_search: Optional[ctypes.c_longlong] = None
+_search_numbers = itertools.count(1)
+
+# Transposition table size for searches inside a worker process, set by the pool initializer
+worker_table_bytes = 0
+
+
+def configure(workers: Optional[int] = None, table_bytes: int = 0):
+    """
+    Sets the pool size (default: os.cpu_count()) and the transposition table size of every worker.
+    A running pool is only restarted if one of them changes.
+    """
+    global _workers, _table_bytes
+    if (workers, table_bytes) != (_workers, _table_bytes):
+        close()
+        _workers, _table_bytes = workers, table_bytes
+
+
+def size() -> int:
+    return _workers or os.cpu_count() or 1
+
+
+def get_pool() -> Pool:
+    """The pool lives until close or interpreter exit, so workers keep their caches across turns"""
+    global _pool, _cancelled_search
+    if _pool is None:
+        _cancelled_search = RawValue("q", 0)
+        _pool = Pool(size(), initializer=_init_worker, initargs=(_table_bytes, _cancelled_search))
+    return _pool
+
+
+def new_search() -> int:
+    """:return: Number of a search whose tasks are about to run on the pool"""
+    return next(_search_numbers)
+
+
+def cancel_search(search: int):
+    """Stops the running tasks of a search, they check search_cancelled while they search"""
+    if _cancelled_search is not None and _cancelled_search.value < search:
+        _cancelled_search.value = search
+
+
+def search_cancelled(search: int) -> bool:
+    return _cancelled_search is not None and search <= _cancelled_search.value
+
+
+def close():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+
+
+def _init_worker(table_bytes: int, cancelled_search: ctypes.c_longlong):
+    global worker_table_bytes, _cancelled_search
+    worker_table_bytes, _cancelled_search = table_bytes, cancelled_search
+
+
+atexit.register(close)